@@ -0,0 +1,6 @@
+""" benchmarks for hyputils, run from the root of the repo
+    e.g. python -m bench.http_pool
+
+    python -m bench.suite runs the load, sync and query benchmarks
+    at several corpus sizes and writes json that can be compared
+    across commits with --out and --compare """
@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+""" memory and time to build HypothesisAnnotation, AnnotationPool
+    and HypothesisHelper objects from search api rows
+
+Usage:
+    python -m bench.annotations [n]
+"""
+
+import sys
+import gc
+import json
+import time
+import tracemalloc
+from hyputils.hypothesis import (HypothesisAnnotation, AnnotationPool,
+                                 HypothesisHelper)
+from test.common.corpus import make_rows
+
+
+class BenchHelper(HypothesisHelper):
+    """ own registry so the bench doesn't touch anything else """
+
+
+def timed(function, *args):
+    gc.collect()
+    start = time.perf_counter()
+    out = function(*args)
+    return out, time.perf_counter() - start
+
+
+def allocated(function, *args):
+    """ bytes still held by the return value of function """
+    gc.collect()
+    tracemalloc.start()
+    try:
+        out = function(*args)
+        current, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return out, current
+
+
+def touch(annos):
+    """ the fields the helpers and indexes hit over and over """
+    for _ in range(3):
+        for a in annos:
+            a.uri, a.tags, a.type, a.exact, a.prefix, a.start
+
+    return annos
+
+
+def main(n=100000):
+    rows = make_rows(n)
+    results = {'n': n}
+
+    annos, results['annotation_bytes'] = allocated(
+        lambda: [HypothesisAnnotation(r) for r in rows])
+    results['annotation_bytes_per'] = results['annotation_bytes'] / n
+    _, results['annotation_fields_seconds'] = timed(touch, annos)
+
+    annos = [HypothesisAnnotation(r) for r in rows]
+    _, results['pool_seconds'] = timed(AnnotationPool, annos)
+
+    BenchHelper.reset(reset_annos_dict=True)
+    annos = [HypothesisAnnotation(r) for r in rows]
+    _, results['helper_seconds'] = timed(lambda: [BenchHelper(a, annos) for a in annos])
+
+    print(json.dumps(results, indent=2))
+    return results
+
+
+if __name__ == '__main__':
+    main(*(int(a) for a in sys.argv[1:]))
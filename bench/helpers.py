@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+""" one HypothesisHelper(anno, annos) call per annotation against
+    HypothesisHelper.fromAnnos on annotations with reply threads
+
+Usage:
+    python -m bench.helpers [n]
+"""
+
+import sys
+import gc
+import json
+import random
+import time
+from hyputils.hypothesis import HypothesisAnnotation, HypothesisHelper
+from test.common.corpus import make_rows
+
+
+class BenchHelper(HypothesisHelper):
+    """ own registry so the bench doesn't touch anything else """
+    objects = {}
+    _tagIndex = {}
+
+
+def threaded_rows(n, reply_fraction=0.5, seed=0):
+    """ rows where about reply_fraction of them are replies, newest last """
+    rng = random.Random(seed)
+    rows = make_rows(n, seed=seed)
+    for i, row in enumerate(rows):
+        if i and rng.random() < reply_fraction:
+            parent = rows[rng.randrange(i)]
+            row['references'] = parent.get('references', []) + [parent['id']]
+            row['target'] = [{'source': row['uri']}]
+
+    return rows
+
+
+def per_call(annos):
+    return [BenchHelper(a, annos) for a in annos]
+
+
+def add_anno(annos):
+    """ a new list per call, every call diffs the whole annos list """
+    BenchHelper._annos_list = []
+    return [BenchHelper.addAnno(a) for a in annos]
+
+
+def bulk(annos):
+    return BenchHelper.fromAnnos(annos)
+
+
+def main(n=200000, add_anno_n=20000):
+    """ add_anno is quadratic so it only runs on the first add_anno_n """
+    rows = threaded_rows(n)
+    results = {'n': n, 'add_anno_n': min(n, add_anno_n)}
+    for name, build, size in (('per_call', per_call, n),
+                              ('add_anno', add_anno, min(n, add_anno_n)),
+                              ('bulk', bulk, n)):
+        BenchHelper.reset(reset_annos_dict=True)
+        annos = [HypothesisAnnotation(r) for r in rows[:size]]
+        gc.collect()
+        start = time.perf_counter()
+        build(annos)
+        results[name + '_seconds'] = time.perf_counter() - start
+        assert len(BenchHelper.objects) == size
+
+    print(json.dumps(results, indent=2))
+    return results
+
+
+if __name__ == '__main__':
+    main(*(int(a) for a in sys.argv[1:]))
@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+""" compare one connection per request against the pooled session
+    in HypothesisUtils using a local stub of the search api
+
+Usage:
+    python -m bench.http_pool [pages] [handshake_ms]
+"""
+
+import sys
+import json
+import time
+import threading
+from urllib.parse import urlparse, parse_qs
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import requests
+from hyputils.hypothesis import HypothesisUtils
+from test.common.corpus import make_rows
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'  # keep-alive
+    disable_nagle_algorithm = True  # headers and body are separate writes
+
+    def setup(self):
+        super().setup()
+        server = self.server
+        with server.lock:
+            server.connections += 1
+
+        time.sleep(server.handshake)  # stand in for tcp + tls setup
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        params = parse_qs(url.query)
+        rows = self.server.rows
+        limit = int(params.get('limit', ['200'])[0])
+        if 'search_after' in params:
+            after = params['search_after'][0]
+            rows = [r for r in rows if r['updated'] > after]
+
+        body = json.dumps({'total': len(rows), 'rows': rows[:limit]}).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def serve(rows, handshake):
+    server = ThreadingHTTPServer(('127.0.0.1', 0), StubHandler)
+    server.daemon_threads = True
+    server.rows = rows
+    server.handshake = handshake
+    server.connections = 0
+    server.lock = threading.Lock()
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server
+
+
+def unpooled(h, params):
+    """ what search_all did before sessions, a new connection per page """
+    headers = {'Authorization': 'Bearer ' + h.token,
+               'Content-Type': 'application/json;charset=utf-8'}
+    params = dict(params)
+    while True:
+        rows = requests.get(h.query_url(**params), headers=headers).json()['rows']
+        if not rows:
+            return
+        yield from rows
+        params['search_after'] = rows[-1]['updated']
+
+
+def main(pages=50, handshake_ms=20):
+    limit = 20
+    rows = make_rows(pages * limit)
+    server = serve(rows, handshake_ms / 1000)
+    domain = '%s:%s' % server.server_address
+    params = {'order': 'asc', 'sort': 'updated', 'limit': limit}
+    results = {}
+    for name in ('unpooled', 'pooled'):
+        server.connections = 0
+        with HypothesisUtils('bench', 'TOKEN', domain=domain, scheme='http') as h:
+            start = time.perf_counter()
+            if name == 'pooled':
+                n = sum(1 for _ in h.search_all(dict(params)))
+            else:
+                n = sum(1 for _ in unpooled(h, params))
+
+            elapsed = time.perf_counter() - start
+
+        assert n == len(rows), (n, len(rows))
+        results[name] = {'seconds': elapsed, 'connections': server.connections,
+                         'requests': pages + 1}
+
+    server.shutdown()
+    print(json.dumps(results, indent=2))
+    return results
+
+
+if __name__ == '__main__':
+    main(*(int(a) for a in sys.argv[1:]))
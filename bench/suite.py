@@ -0,0 +1,282 @@
+#!/usr/bin/env python3
+""" time the load, sync and query hot paths on synthetic corpora
+
+    every benchmark runs at every size and reports the best of repeat
+    runs, setup is never timed, results are json so that runs on two
+    commits can be compared with --compare which exits 1 if anything
+    got slower than threshold, sizes above 100k need a lot of memory
+
+Usage:
+    python -m bench.suite [--sizes 1000,10000,100000] [--only NAME,...]
+                          [--repeat 3] [--out PATH] [--compare PATH]
+                          [--threshold 1.2]
+"""
+
+import sys
+import gc
+import json
+import time
+import shutil
+import logging
+import platform
+import argparse
+import tempfile
+import subprocess
+from datetime import datetime, timezone
+from pathlib import Path
+from hyputils.hypothesis import (HypothesisAnnotation, AnnotationPool, AnnoList,
+                                 AnnoReader, Memoizer)
+from hyputils.handlers import annotationSyncHandler
+from hyputils.utils import log
+from test.common.corpus import make_row, timestamp
+from .helpers import BenchHelper, threaded_rows
+
+benchmarks = {}
+
+
+def benchmark(function):
+    """ function(corpus) does any setup and returns (run, ops) """
+    benchmarks[function.__name__] = function
+    return function
+
+
+class Corpus:
+    """ rows for one size and the state shared between benchmarks """
+
+    def __init__(self, n, folder):
+        self.n = n
+        self.folder = folder
+        self.rows = threaded_rows(n)
+        self.annos = [HypothesisAnnotation(r) for r in self.rows]
+        self._memfile = None
+        self.helpers_built = False
+
+    def memoizer(self, name):
+        return Memoizer(self.folder / name, api_token='bench', group='__world__')
+
+    @property
+    def memfile(self):
+        """ a snapshot of the corpus with no journal """
+        if self._memfile is None:
+            mem = self.memoizer('snapshot.json')
+            mem.memoize_annos(self.annos)
+            self._memfile = mem.memoization_file
+
+        return self._memfile
+
+    def helpers(self):
+        if not self.helpers_built:
+            BenchHelper.reset(reset_annos_dict=True)
+            BenchHelper.fromAnnos(self.annos)
+            self.helpers_built = True
+
+        return BenchHelper
+
+    def newer(self, fraction=0.1, start=0):
+        """ updated versions of fraction of the corpus and as many new rows """
+        k = max(1, int(self.n * fraction))
+        step = max(1, self.n // k)
+        updated = [dict(r, text='edited', updated=timestamp(self.n + start + i))
+                   for i, r in enumerate(self.rows[::step][:k])]
+        created = [make_row(updated=timestamp(self.n + start + k + i)) for i in range(k)]
+        return updated + created
+
+
+@benchmark
+def get_annos_from_file(corpus):
+    reader = AnnoReader(corpus.memfile, '__world__')
+    return reader.get_annos_from_file, corpus.n
+
+
+@benchmark
+def memoize_annos(corpus):
+    mem = corpus.memoizer('memoize.json')
+    return (lambda: mem.memoize_annos(corpus.annos)), corpus.n
+
+
+@benchmark
+def merge_new_annos(corpus):
+    mem = corpus.memoizer('merge.json')
+    annos = AnnoList(corpus.annos)
+    new = [HypothesisAnnotation(r) for r in corpus.newer()]
+    return (lambda: mem._merge_new_annos(annos, new)), len(new)
+
+
+@benchmark
+def annotation_pool(corpus):
+    return (lambda: AnnotationPool(corpus.annos)), corpus.n
+
+
+@benchmark
+def helper_per_call(corpus):
+    BenchHelper.reset(reset_annos_dict=True)
+    corpus.helpers_built = True  # run leaves the full set of helpers
+    annos = corpus.annos
+    return (lambda: [BenchHelper(a, annos) for a in annos]), corpus.n
+
+
+@benchmark
+def helper_from_annos(corpus):
+    BenchHelper.reset(reset_annos_dict=True)
+    corpus.helpers_built = True
+    return (lambda: BenchHelper.fromAnnos(corpus.annos)), corpus.n
+
+
+def _cycle(queries, ops):
+    return [queries[i % len(queries)] for i in range(ops)]
+
+
+@benchmark
+def by_tags(corpus):
+    Helper = corpus.helpers()
+    tags = sorted({t for a in corpus.annos for t in a.tags})
+    queries = _cycle([(t,) for t in tags] + list(zip(tags, tags[1:])) + [('missing',)], 1000)
+    Helper.byTags(*queries[0])  # the index goes live on first use
+
+    def run():
+        for tags in queries:
+            Helper.byTags(*tags)
+
+    return run, len(queries)
+
+
+@benchmark
+def by_iri(corpus):
+    Helper = corpus.helpers()
+    uris = sorted({a.uri for a in corpus.annos})
+    queries = _cycle([(u, False) for u in uris] +
+                     [('https://example.org/paper/1', True), ('https://nope.org/', True)], 1000)
+
+    def run():
+        for iri, prefix in queries:
+            list(Helper.byIri(iri, prefix=prefix))
+
+    return run, len(queries)
+
+
+@benchmark
+def helper_repr(corpus):
+    Helper = corpus.helpers()
+    sample = [Helper.byId(a.id) for a in corpus.annos[:1000]]
+    return (lambda: [repr(h) for h in sample]), len(sample)
+
+
+@benchmark
+def sync_handler(corpus):
+    """ websocket update messages through annotationSyncHandler
+        including the time to flush them to a memoizer """
+    mem = corpus.memoizer('sync.json')
+    mem.memoize_annos(corpus.annos)
+    annos = AnnoList(corpus.annos)
+    rows = corpus.newer(fraction=min(1, 10000 / corpus.n) / 2, start=corpus.n)
+    messages = [{'options': {'action': 'update' if i < len(rows) // 2 else 'create'},
+                 'payload': [row]} for i, row in enumerate(rows)]
+    handler = annotationSyncHandler(annos, memoizer=mem)
+
+    def run():
+        for message in messages:
+            handler.handler(message)
+
+        handler.close()
+
+    return run, len(messages)
+
+
+def measure(function, corpus, repeat):
+    times = []
+    for _ in range(repeat):
+        run, ops = function(corpus)
+        gc.collect()
+        start = time.perf_counter()
+        run()
+        times.append(time.perf_counter() - start)
+
+    best = min(times)
+    return {'benchmark': function.__name__,
+            'n': corpus.n,
+            'ops': ops,
+            'seconds': best,
+            'mean_seconds': sum(times) / len(times),
+            'ops_per_second': ops / best if best else None}
+
+
+def commit():
+    try:
+        out = subprocess.run(['git', 'rev-parse', 'HEAD'], stdout=subprocess.PIPE,
+                             stderr=subprocess.PIPE, universal_newlines=True,
+                             cwd=Path(__file__).parent)
+    except OSError:
+        return None
+
+    return out.stdout.strip() or None
+
+
+def compare(results, baseline, threshold):
+    """ print new/old time ratios, return the ones above threshold """
+    old = {(r['benchmark'], r['n']): r for r in baseline['results']}
+    slower = []
+    for r in results['results']:
+        b = old.get((r['benchmark'], r['n']))
+        if b is None or not b['seconds']:
+            continue
+
+        ratio = r['seconds'] / b['seconds']
+        flag = ' SLOWER' if ratio > threshold else ''
+        print(f"{r['benchmark']:<22}{r['n']:>9} {b['seconds']:>10.4f}s "
+              f"{r['seconds']:>10.4f}s {ratio:>6.2f}x{flag}", file=sys.stderr)
+        if flag:
+            slower.append(dict(r, ratio=ratio))
+
+    return slower
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--sizes', default='1000,10000,100000')
+    parser.add_argument('--only', default=None)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--out', default=None)
+    parser.add_argument('--compare', default=None)
+    parser.add_argument('--threshold', type=float, default=1.2)
+    args = parser.parse_args(argv)
+
+    names = list(benchmarks) if args.only is None else args.only.split(',')
+    unknown = set(names) - set(benchmarks)
+    if unknown:
+        parser.error(f'unknown benchmarks {sorted(unknown)} choose from {list(benchmarks)}')
+
+    log.setLevel(logging.WARNING)
+    results = {'commit': commit(),
+               'python': platform.python_version(),
+               'platform': platform.platform(),
+               'date': datetime.now(timezone.utc).isoformat(),
+               'repeat': args.repeat,
+               'results': []}
+    for n in (int(s) for s in args.sizes.split(',')):
+        folder = Path(tempfile.mkdtemp())
+        try:
+            corpus = Corpus(n, folder)
+            for name in names:
+                print(f'{name} {n}', file=sys.stderr)
+                results['results'].append(measure(benchmarks[name], corpus, args.repeat))
+        finally:
+            BenchHelper.reset(reset_annos_dict=True)
+            shutil.rmtree(folder)
+            corpus = None
+            gc.collect()
+
+    print(json.dumps(results, indent=2))
+    if args.out is not None:
+        with open(args.out, 'wt') as f:
+            json.dump(results, f, indent=2)
+
+    if args.compare is not None:
+        with open(args.compare, 'rt') as f:
+            slower = compare(results, json.load(f), args.threshold)
+
+        if slower:
+            return 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,58 @@
+#!/usr/bin/env python3
+""" python list filtering against AnnotationTable queries
+
+Usage:
+    python -m bench.table [n]
+"""
+
+import sys
+import json
+import time
+from hyputils.hypothesis import HypothesisAnnotation, norm
+from hyputils.table import AnnotationTable
+from test.common.corpus import make_rows, timestamp
+
+
+def best(function, repeat=3):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        out = function()
+        times.append(time.perf_counter() - start)
+
+    return out, min(times)
+
+
+def main(n=300000):
+    annos = [HypothesisAnnotation(r) for r in make_rows(n)]
+    start, end, tag = timestamp(n // 4), timestamp(n // 2), 'PROTCUR:a'
+    uri = annos[0].uri
+
+    def loop_query():
+        return [a for a in annos
+                if start <= a.updated < end and
+                a.user == 'tgbugstest' and
+                tag in a.tags]
+
+    def loop_uri():
+        norm_iri = norm(uri)
+        return [a for a in annos if norm(a.uri) == norm_iri]
+
+    table, build = best(lambda: AnnotationTable(annos), repeat=1)
+    results = {'n': n, 'table_build_seconds': build}
+    for name, loop, query in (
+            ('time_user_tag', loop_query,
+             lambda: table.between(start, end).user('tgbugstest').tag(tag)),
+            ('uri', loop_uri, lambda: table.uri(uri))):
+        expect, loop_seconds = best(loop)
+        got, table_seconds = best(query)
+        assert len(got) == len(expect), (name, len(got), len(expect))
+        results[name] = {'rows': len(got), 'loop_seconds': loop_seconds,
+                         'table_seconds': table_seconds}
+
+    print(json.dumps(results, indent=2))
+    return results
+
+
+if __name__ == '__main__':
+    main(*(int(a) for a in sys.argv[1:]))
@@ -0,0 +1,252 @@
+""" asyncio native client for the hypothes.is REST api
+
+    AsyncHypothesisUtils mirrors HypothesisUtils but every request is
+    a coroutine so it can share an event loop with AnnotationStream,
+    requires aiohttp, pip install hyputils[async]
+"""
+
+import json
+import asyncio
+import aiohttp
+from .hypothesis import HypothesisUtils
+from .retry import RetryPolicy
+from .utils import log
+
+__all__ = ['AsyncHypothesisUtils']
+
+
+class AsyncHypothesisUtils(HypothesisUtils):
+    """ async variant of HypothesisUtils
+
+        at most concurrency requests are in flight at the same time
+        use as `async with AsyncHypothesisUtils(...) as h:` or call
+        `await h.close()` when done """
+
+    def __init__(self, username=None, token=None, group=None, domain=None, limit=None,
+                 pool_size=None, scheme=None, concurrency=None, retry=None, rate=None):
+        if retry is None:
+            retry = RetryPolicy(exceptions=(aiohttp.ClientConnectionError,
+                                            asyncio.TimeoutError))
+
+        super().__init__(username=username, token=token, group=group,
+                         domain=domain, limit=limit, pool_size=pool_size,
+                         scheme=scheme, retry=retry, rate=rate)
+        self.concurrency = self.pool_size if concurrency is None else concurrency
+        self._semaphore = None
+
+    @property
+    def session(self):
+        """ connection pool shared by all requests, must be
+            first accessed from inside a running event loop """
+        if self._session is None:
+            connector = aiohttp.TCPConnector(limit=self.pool_size)
+            self._session = aiohttp.ClientSession(
+                connector=connector,
+                headers={'Authorization': 'Bearer ' + self.token,
+                         'Content-Type': 'application/json;charset=utf-8'})
+            self._semaphore = asyncio.Semaphore(self.concurrency)
+
+        return self._session
+
+    async def close(self):
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    def __enter__(self):
+        raise TypeError(f'use async with for {self.__class__.__name__}')
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        await self.close()
+
+    async def _send(self, method, url, **kwargs):
+        session = self.session
+        async with self._semaphore:
+            async with session.request(method, url, **kwargs) as resp:
+                await resp.read()  # so resp.json() works after release
+                return resp
+
+    async def _request(self, method, url, idempotent=True, retry=None, **kwargs):
+        """ send a request applying the rate limit and retry policy """
+        policy = self.retry if retry is None else retry
+        attempt = 0
+        while True:
+            if self.rate_limiter is not None:
+                await asyncio.sleep(self.rate_limiter.reserve())
+
+            try:
+                r = await self._send(method, url, **kwargs)
+            except Exception as e:
+                if not policy.retry_exception(e, attempt, idempotent):
+                    raise
+
+                delay = policy.delay(attempt)
+                log.error(f'{e!r} on {method} {url} attempt {attempt} retrying in {delay:.2f}s')
+            else:
+                if not policy.retry_status(r.status, attempt, idempotent):
+                    return r
+
+                delay = policy.delay(attempt, r.headers.get('Retry-After'))
+                log.warning(f'{r.status} {r.reason} on {method} {url} '
+                            f'attempt {attempt} retrying in {delay:.2f}s')
+
+            await asyncio.sleep(delay)
+            attempt += 1
+
+    async def authenticated_api_query(self, query_url=None):
+        try:
+            r = await self._request('GET', query_url)
+            obj = await r.json()
+            if r.ok:
+                return obj
+            else:
+                raise aiohttp.ClientResponseError(r.request_info, r.history,
+                                                  status=r.status,
+                                                  message=f'response was not ok! {r.reason} {obj}')
+        except (KeyboardInterrupt, asyncio.CancelledError):
+            raise
+        except BaseException as e:
+            log.exception(e)
+            return {'ERROR': True, 'rows': tuple(), 'exception': e}
+
+    async def create_annotation_with_target_using_only_text_quote(
+            self, url=None, prefix=None, exact=None, suffix=None, text=None,
+            tags=None, tag_prefix=None, document=None, extra=None):
+        payload = self.make_annotation_payload_with_target_using_only_text_quote(
+            url, prefix, exact, suffix, text, tags, document, extra)
+        return await self.post_annotation(payload)
+
+    async def head_annotation(self, id):
+        return await self._request('HEAD', self.api_url + '/annotations/' + id)
+
+    async def get_annotation(self, id):
+        return await self._request('GET', self.api_url + '/annotations/' + id)
+
+    async def post_annotation(self, payload):
+        data = json.dumps(payload, ensure_ascii=False)
+        return await self._request('POST', self.api_url + '/annotations',
+                                   idempotent=False,
+                                   data=data.encode('utf-8'))
+
+    async def patch_annotation(self, id, payload):
+        data = json.dumps(payload, ensure_ascii=False)
+        return await self._request('PATCH', self.api_url + '/annotations/' + id,
+                                   data=data.encode('utf-8'))
+
+    async def delete_annotation(self, id):
+        return await self._request('DELETE', self.api_url + '/annotations/' + id)
+
+    async def search(self, params={}):
+        """ Call search API, return a dict """
+        if 'offset' not in params:
+            params['offset'] = 0
+        if 'limit' not in params or 'limit' in params and params['limit'] is None:
+            params['limit'] = self.single_page_limit
+        return await self.authenticated_api_query(self.query_url(**params))
+
+    async def search_all(self, params={}, max_results=None, stop_at=None):
+        """ Call search API with pagination, async yield rows """
+        sort_by, dont_stop = self._search_setup(params, max_results, stop_at)
+        nresults = 0
+        while True:
+            obj = await self.search(params)
+            if 'ERROR' in obj:
+                # don't let a failed page look like the end of the results
+                raise obj['exception']
+
+            rows = obj['rows']
+            lr = len(rows)
+            nresults += lr
+            if lr == 0:
+                return
+
+            stop = None
+            if max_results:
+                if nresults >= max_results:
+                    stop = max_results - nresults + lr
+
+            for row in rows[:stop]:
+                if dont_stop is not None and not dont_stop(row):
+                    return
+
+                yield row
+
+            if stop:
+                return
+
+            search_after = rows[-1][sort_by]
+            params['search_after'] = search_after
+            log.info(f'searching after {search_after}')
+
+    async def batch_update(self, function, *ids, pretend=True, ordered=True):
+        """ async yield (blob, function(blob)) when pretending otherwise
+            (blob, patch response), requests run concurrently up to
+            self.concurrency, set ordered=False to get results as
+            soon as they are ready, a fixed pool of workers pulls ids
+            from a queue so huge batches do not create a task per id """
+
+        async def one(id):
+            resp = await self.get_annotation(id)
+            blob = await resp.json()
+            updated = function(blob)
+            if pretend:
+                return blob, updated
+            else:
+                return blob, await self.patch_annotation(id, updated)
+
+        todo = asyncio.Queue()
+        for item in enumerate(ids):
+            todo.put_nowait(item)
+
+        done = asyncio.Queue()  # (index, result, exception)
+
+        async def worker():
+            while not todo.empty():
+                i, id = todo.get_nowait()
+                try:
+                    done.put_nowait((i, await one(id), None))
+                except asyncio.CancelledError:
+                    raise  # an Exception before 3.8
+                except Exception as e:
+                    done.put_nowait((i, None, e))
+
+        self.session  # make sure the semaphore exists
+        workers = [asyncio.ensure_future(worker())
+                   for _ in range(min(self.concurrency, len(ids)))]
+        try:
+            finished = {}
+            next_i = 0
+            while next_i < len(ids):
+                i, result, exception = await done.get()
+                if exception is not None:
+                    raise exception
+
+                if not ordered:
+                    next_i += 1
+                    yield result
+                    continue
+
+                finished[i] = result
+                while next_i in finished:
+                    yield finished.pop(next_i)
+                    next_i += 1
+        finally:
+            for task in workers:
+                task.cancel()
+
+    @staticmethod
+    async def summarize_batch(results):
+        """ HypothesisUtils.summarize_batch for async results, takes
+            the async generator from batch_update or a list of its
+            results and awaits the body of patch responses """
+        if hasattr(results, '__aiter__'):
+            results = [r async for r in results]
+
+        pairs = []
+        for blob, out in results:
+            pairs.append((blob, out if isinstance(out, dict) else await out.json()))
+
+        return HypothesisUtils.summarize_batch(pairs)
@@ -3,14 +3,41 @@
 """
 
 import os
+import atexit
+import weakref
+import threading
+from time import monotonic
+from contextlib import contextmanager
+from .utils import log
+
+
+@contextmanager
+def _nolock():
+    """ contextlib.nullcontext is 3.7+ """
+    yield
+
+
+_write_behinds = weakref.WeakSet()  # started and not yet closed
+
+
+@atexit.register
+def _close_write_behinds():
+    """ one exit hook for every writeBehind instead of one per instance """
+    for write_behind in list(_write_behinds):
+        write_behind.close()
 
 
 class filterHandler:
     """ Base class that all filter handlers should be derived from.
         Any authenticiation state needed to link services should be
         managed in __init__. Sorta a crappy python ITTT.
+
+        concurrency tells subscribe.Dispatcher where to run the handler,
+        'inline' on the event loop, 'thread' or 'process' in a pool.
     """
 
+    concurrency = 'inline'
+
     def filter(self, message):
         return True
 
@@ -21,6 +48,9 @@ class filterHandler:
         if self.filter(message):
             self.handler(message)
 
+    def close(self):
+        """ called once when the stream shuts down """
+
 
 class dbSyncHandler(filterHandler):
     def __init__(self, *helpers):
@@ -31,42 +61,181 @@ class dbSyncHandler(filterHandler):
             helper(message)
 
 
+class writeBehind:
+    """ memoize changes to annos from a background thread
+
+        changes to the same annotation are coalesced and written in one
+        batch once max_pending are waiting, max_delay seconds after the
+        first one arrived, or on flush/close, there is never more than
+        one write in flight and marking a change never touches the disk
+
+        hold lock while mutating annos so that a consistent snapshot
+        can be taken for memoizers that rewrite everything """
+
+    def __init__(self, memoizer, annos, max_pending=500, max_delay=1.0):
+        self.memoizer = memoizer
+        self.annos = annos
+        self.max_pending = max_pending
+        self.max_delay = max_delay
+        self.lock = threading.RLock()
+        self._changed = threading.Condition(self.lock)
+        self._pending = {}  # id -> (action, anno or id) in the order last touched
+        self._first = None
+        self._writing = False
+        self._force = False
+        self._closed = False
+        self._thread = None
+
+    def mark(self, action, payload):
+        """ record a create, update or delete, payload is an id for delete """
+        id_ = payload if action == 'delete' else payload.id
+        with self.lock:
+            if self._closed:
+                raise ValueError('write behind is closed')
+
+            old = self._pending.pop(id_, None)
+            if old is not None and old[0] == 'create' and action == 'update':
+                action = 'create'
+
+            self._pending[id_] = action, payload
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, daemon=True)
+                self._thread.start()
+                _write_behinds.add(self)
+
+            if self._first is None:
+                self._first = monotonic()
+                self._changed.notify_all()  # start the max_delay clock
+            elif len(self._pending) >= self.max_pending:
+                self._changed.notify_all()
+
+    def _ready(self):
+        return (self._closed or self._force or
+                len(self._pending) >= self.max_pending or
+                monotonic() - self._first >= self.max_delay)
+
+    def _run(self):
+        while True:
+            with self.lock:
+                while not (self._pending and self._ready()):
+                    if self._closed:
+                        return
+
+                    self._changed.wait(None if self._first is None else
+                                       self._first + self.max_delay - monotonic())
+
+                changes = list(self._pending.values())
+                snapshot = list(self.annos)
+                self._pending = {}
+                self._first = None
+                self._force = False
+                self._writing = True
+
+            try:
+                self._write(changes, snapshot)
+            except BaseException as e:
+                log.exception(e)
+            finally:
+                with self.lock:
+                    self._writing = False
+                    self._changed.notify_all()
+
+    def _write(self, changes, snapshot):
+        if hasattr(self.memoizer, 'memoize_changes'):
+            self.memoizer.memoize_changes(changes, snapshot)
+        else:
+            self.memoizer.memoize_annos(snapshot)
+
+    def flush(self):
+        """ block until everything marked so far has been written """
+        with self.lock:
+            if self._thread is None:
+                return
+
+            self._force = True
+            self._changed.notify_all()
+            while self._pending or self._writing:
+                self._changed.wait()
+
+    def close(self):
+        """ flush and stop the writer thread """
+        with self.lock:
+            if self._closed:
+                return
+
+            self._closed = True
+            self._changed.notify_all()
+            thread = self._thread
+
+        if thread is not None:
+            thread.join()
+
+        _write_behinds.discard(self)
+
+
 class annotationSyncHandler(filterHandler):
     class DeletedAnno:
         deleted = True
         def __init__(self, id):
             self.id = id
 
-    def __init__(self, annos, memoizer=None):
-        from .hypothesis import HypothesisAnnotation as ha
+    def __init__(self, annos, memoizer=None, write_behind=True):
+        from .hypothesis import HypothesisAnnotation as ha, AnnoList
         self.HypothesisAnnotation = ha
+        self.AnnoList = AnnoList
         self.annos = annos
         if memoizer is not None:
             self.memoizer = memoizer
         if not hasattr(self, 'memoizer'):
             print(f'WARNING: no memoizer has been supplied for {self.__class__.__name__}')
+            self.write_behind = None
+        elif write_behind:
+            # bursts of events are written in batches off the event loop
+            self.write_behind = writeBehind(self.memoizer, self.annos)
+        else:
+            self.write_behind = None
 
     def handler(self, message):
         anno = None
+        lock = _nolock() if self.write_behind is None else self.write_behind.lock
         try:
             act = message['options']['action']
-            if act != 'create': # update delete
-                mid = message['payload'][0]['id']
-                for gone in [_ for _ in self.annos if _.id == mid]:
-                    # FIXME slow, replace when we switch over to using dicts
-                    self.annos.remove(gone)
-                anno = self.DeletedAnno(mid)
-            if act != 'delete':  # create update
-                anno = self.HypothesisAnnotation(message['payload'][0])
-                self.annos.append(anno)
-            #print(len(self.annos), 'annotations.')
-            if hasattr(self, 'memoizer'):
-                self.memoizer.memoize_annos(self.annos)
+            with lock:
+                if act != 'create': # update delete
+                    mid = message['payload'][0]['id']
+                    if isinstance(self.annos, self.AnnoList):
+                        self.annos.delete(mid)
+                    else:
+                        self.annos[:] = [_ for _ in self.annos if _.id != mid]
+                    anno = self.DeletedAnno(mid)
+                if act != 'delete':  # create update
+                    anno = self.HypothesisAnnotation(message['payload'][0])
+                    self.annos.append(anno)
+                #print(len(self.annos), 'annotations.')
+                if self.write_behind is not None:
+                    self.write_behind.mark(act, mid if act == 'delete' else anno)
+                elif hasattr(self, 'memoizer'):
+                    if hasattr(self.memoizer, 'memoize_anno'):
+                        # journal only the change instead of rewriting everything
+                        if act == 'delete':
+                            self.memoizer.memoize_delete(mid, self.annos)
+                        else:
+                            self.memoizer.memoize_anno(anno, self.annos, action=act)
+                    else:
+                        self.memoizer.memoize_annos(self.annos)
 
             return anno  # we can't not return None
         except KeyError as e:
             embed()
 
+    def flush(self):
+        if self.write_behind is not None:
+            self.write_behind.flush()
+
+    def close(self):
+        if self.write_behind is not None:
+            self.write_behind.close()
+
 
 class helperSyncHandler(annotationSyncHandler):
     def __init__(self, annos, *helpers, memoizer=None):
@@ -112,6 +281,9 @@ class zendeskHandler(filterHandler):
         break these filterHandlers out into their own file that users could
         create independently of the subscription setup here....
     """
+
+    concurrency = 'thread'  # ticket_create blocks on the network
+
     def __init__(self, infopath='~/files/zendeskinfo.yaml'):
         import yaml
         from zdesk import Zendesk
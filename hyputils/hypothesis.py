@@ -1,29 +1,45 @@
 #!/usr/bin/env python3
 from __future__ import print_function
+import os
 from os import environ, chmod
 import json
 import shutil
 import hashlib
 import pathlib
-from time import sleep
+import queue
+import threading
+from time import sleep, monotonic
 from types import GeneratorType
-from collections import defaultdict
+from datetime import datetime
+from bisect import bisect_left, insort
+from itertools import islice
+from collections import Counter, OrderedDict
+from collections.abc import MutableSequence
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
 import psutil  # sigh
 import appdirs
 import requests
-from .utils import log, logd
+from .utils import log, logd, bounded_map
+from .retry import RetryPolicy, TokenBucket
 
 try:
     from urllib.parse import urlencode
 except ImportError:
     from urllib import urlencode
 
+try:
+    import fcntl
+except ImportError:  # windows, fall back to polling the lock folder
+    fcntl = None
+
 # read environment variables # FIXME not the most modular...
 
 __all__ = ['api_token', 'username', 'group', 'group_to_memfile',
            'idFromShareLink', 'shareLinkFromId',
-           'AnnoFetcher', 'Memoizer',
-           'HypothesisUtils', 'HypothesisHelper', 'Annotation', 'HypAnnoId']
+           'AnnoFetcher', 'AnnoList', 'Memoizer',
+           'HypothesisUtils', 'HypothesisHelper', 'HelperRegistry', 'ThreadIndex',
+           'Annotation', 'HypAnnoId']
 
 api_token = environ.get('HYP_API_TOKEN', 'TOKEN')   # Hypothesis API token
 username = environ.get('HYP_USERNAME', 'USERNAME')  # Hypothesis username
@@ -37,11 +53,95 @@ class JEncode(json.JSONEncoder):
             return list(obj)
         elif isinstance(obj, HypothesisAnnotation):
             return obj._row
+        elif isinstance(obj, AnnoList):
+            return list(obj)
 
         # Let the base class default method raise the TypeError
         return json.JSONEncoder.default(self, obj)
 
 
+class _JsonArrayStream:
+    """ incrementally decode the members of a top level json array
+
+        the whole file is never held in memory, only a window of text
+        large enough to contain the next member """
+
+    def __init__(self, file, chunk_size=2 ** 20):
+        self.file = file
+        self.chunk_size = chunk_size
+        self.buffer = ''
+        self.pos = 0
+        self.eof = False
+        self.decoder = json.JSONDecoder()
+
+    def _fill(self, size=None):
+        if self.eof:
+            return False
+
+        if self.pos:
+            # drop everything we have already consumed
+            self.buffer = self.buffer[self.pos:]
+            self.pos = 0
+
+        data = self.file.read(self.chunk_size if size is None else size)
+        if not data:
+            self.eof = True
+            return False
+
+        self.buffer += data
+        return True
+
+    def peek(self):
+        """ the next non whitespace character, or None at the end """
+        while True:
+            buffer = self.buffer
+            length = len(buffer)
+            while self.pos < length and buffer[self.pos] in ' \t\n\r':
+                self.pos += 1
+
+            if self.pos < length:
+                return buffer[self.pos]
+            elif not self._fill():
+                return None
+
+    def expect(self, chars):
+        char = self.peek()
+        if char is None or char not in chars:
+            raise json.decoder.JSONDecodeError(f'expected one of {chars!r}',
+                                               self.buffer, self.pos)
+        self.pos += 1
+        return char
+
+    def value(self):
+        self.peek()
+        size = self.chunk_size
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buffer, self.pos)
+                self.pos = end
+                return value
+            except json.decoder.JSONDecodeError:
+                # assume a member that spans the end of the buffer
+                if not self._fill(size):
+                    raise
+
+                size *= 2
+
+    def members(self, opened=False):
+        """ yield the members of the array starting at the current position """
+        if not opened:
+            self.expect('[')
+
+        if self.peek() == ']':
+            self.pos += 1
+            return
+
+        while True:
+            yield self.value()
+            if self.expect(',]') == ']':
+                return
+
+
 def group_to_memfile(group, post=lambda group_hash: None):
     if group != '__world__':
         m = hashlib.sha256()
@@ -72,6 +172,28 @@ def norm(iri):
 
     return iri_norm
 
+
+def _flock(fd, operation, timeout=None, max_delay=0.05):
+    """ fcntl.flock that gives up after timeout seconds, False if it did """
+    if timeout is None:
+        fcntl.flock(fd, operation)
+        return True
+
+    # flock cannot time out so retry without blocking, backing off to max_delay
+    deadline = monotonic() + timeout
+    delay = 0.001
+    while True:
+        try:
+            fcntl.flock(fd, operation | fcntl.LOCK_NB)
+            return True
+        except BlockingIOError:
+            remaining = deadline - monotonic()
+            if remaining <= 0:
+                return False
+
+            sleep(min(delay, remaining))
+            delay = min(delay * 2, max_delay)
+
 # annotation retrieval and memoization
 
 
@@ -87,35 +209,46 @@ class AnnoFetcher:
     lsu_default = '1900-01-01T00:00:00.000000+00:00'  # don't need, None is ok
 
     def __init__(self, api_token=api_token, username=username, group=group,
-                 **kwargs):
+                 workers=None, **kwargs):
         if api_token == 'TOKEN':
             log.warning('\x1b[31mWARNING:\x1b[0m NO API TOKEN HAS BEEN SET!')
         self.api_token = api_token
         self.username = username
         self.group = group
+        # default number of windows fetched in parallel, None is sequential
+        self.workers = workers
+        # passed along to HypothesisUtils e.g. domain, scheme, pool_size, prefetch
+        self._h_kwargs = {k: v for k, v in kwargs.items()
+                          if k in ('domain', 'limit', 'pool_size', 'prefetch', 'scheme')}
+        if workers and 'pool_size' not in self._h_kwargs:
+            self._h_kwargs['pool_size'] = max(10, workers)
+
+        self._h = None
 
     def __call__(self):
         return self.get_annos()
 
     def h(self):
-        return HypothesisUtils(username=self.username,
-                               token=self.api_token,
-                               group=self.group)
-
-    def yield_from_api(self,
-                       search_after=None,
-                       limit=None,
-                       max_results=None,
-                       stop_at=None):
-        # use stop at if you want to be evil and hit the api in parallel
-        log.info(f'fetching after {search_after}')
+        # reuse one instance so that every sync shares a connection pool
+        if self._h is None:
+            self._h = HypothesisUtils(username=self.username,
+                                      token=self.api_token,
+                                      group=self.group,
+                                      **self._h_kwargs)
+        return self._h
+
+    def close(self):
+        """ close pooled connections to the api """
+        if self._h is not None:
+            self._h.close()
+
+    def _params(self, search_after=None, limit=None, max_results=None):
         # hard code these to simplify assumptions
         order = 'asc'
         sort = 'updated'
-        h = self.h()
         params = {'order': order,
                   'sort': sort,
-                  'group': h.group}
+                  'group': self.h().group}
         if search_after:
             params['search_after'] = search_after
         if max_results is None and self.group == '__world__':
@@ -125,20 +258,122 @@ class AnnoFetcher:
         if limit is not None:
             params['limit'] = limit
 
+        return params
+
+    def yield_from_api(self,
+                       search_after=None,
+                       limit=None,
+                       max_results=None,
+                       stop_at=None,
+                       workers=None):
+        # use stop at if you want to be evil and hit the api in parallel
+        if workers is None:
+            workers = self.workers
+
+        if workers is not None and workers > 1 and max_results is None:
+            yield from self._yield_from_api_parallel(search_after=search_after,
+                                                     limit=limit,
+                                                     stop_at=stop_at,
+                                                     workers=workers)
+            return
+
+        log.info(f'fetching after {search_after}')
+        h = self.h()
+        params = self._params(search_after, limit, max_results)
         for row in h.search_all(
                 params, max_results=max_results, stop_at=stop_at):
             yield row
 
+    @staticmethod
+    def _parse_updated(updated):
+        # strptime %z does not accept +00:00 before 3.7
+        if updated[-3] == ':':
+            updated = updated[:-3] + updated[-2:]
+        return datetime.strptime(updated, '%Y-%m-%dT%H:%M:%S.%f%z')
+
+    def _updated_bounds(self, params, stop_at):
+        """ updated of the first row after search_after and of the last row """
+        h = self.h()
+
+        def rows(params):
+            obj = h.search(params)
+            if 'ERROR' in obj:
+                # a failed bounds query must not look like an empty group
+                raise obj['exception']
+
+            return obj['rows']
+
+        first = rows(dict(params, limit=1))
+        if not first:
+            return None, None
+
+        if stop_at is not None:
+            return first[0]['updated'], stop_at
+
+        desc = {k: v for k, v in params.items() if k != 'search_after'}
+        desc['order'] = 'desc'
+        last = rows(dict(desc, limit=1))
+        return first[0]['updated'], last[0]['updated'] if last else None
+
+    def _windows(self, search_after, stop_at, lower, upper, n):
+        """ split (search_after, stop_at] into n windows by updated """
+        edges = []
+        if lower is not None and upper is not None and lower < upper:
+            start = self._parse_updated(lower)
+            step = (self._parse_updated(upper) - start) / n
+            for i in range(1, n):
+                edge = (start + step * i).isoformat(timespec='microseconds')
+                if (not edges or edge > edges[-1]) and edge < upper:
+                    edges.append(edge)
+
+        bounds = [search_after] + edges + [stop_at]
+        return list(zip(bounds[:-1], bounds[1:]))
+
+    def _yield_from_api_parallel(self,
+                                 search_after=None,
+                                 limit=None,
+                                 stop_at=None,
+                                 workers=4):
+        """ fetch disjoint updated windows concurrently
+
+            each window is yielded as soon as it and every window before
+            it have been fetched so the stream stays ordered, like the
+            sequential path an annotation that is updated during the sync
+            can show up again later on with its newer version """
+        h = self.h()
+        params = self._params(search_after, limit)
+        lower, upper = self._updated_bounds(params, stop_at)
+        if lower is None:
+            return
+
+        windows = self._windows(search_after, stop_at, lower, upper, workers)
+        log.info(f'fetching after {search_after} in {len(windows)} windows')
+
+        def fetch(window):
+            after, stop = window
+            wparams = {k: v for k, v in params.items() if k != 'search_after'}
+            if after:
+                wparams['search_after'] = after
+
+            return list(h.search_all(wparams, stop_at=stop))
+
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            # map hands back each window in order as soon as it is done
+            for rows in executor.map(fetch, windows):
+                yield from rows
+
     def get_annos_from_api(self,
                            search_after=None,
                            limit=None,
                            max_results=None,
-                           stop_at=None):
+                           stop_at=None,
+                           workers=None):
         return [HypothesisAnnotation(r) for r in
                 self.yield_from_api(search_after=search_after,
                                     limit=limit,
                                     max_results=max_results,
-                                    stop_at=stop_at)]
+                                    stop_at=stop_at,
+                                    workers=workers)]
 
 
 class AnnoReader:
@@ -163,39 +398,156 @@ class AnnoReader:
         return annos
 
     def get_annos_from_file(self, file=None):
+        annos = AnnoList()
+        gen = self.yield_annos_from_file(file)
+        while True:
+            try:
+                annos.append(next(gen))
+            except StopIteration as e:
+                last_sync_updated = e.value
+                break
+            except json.decoder.JSONDecodeError:
+                # start over from the api rather than trust a partial read
+                return AnnoList(), None
+
+        return annos, last_sync_updated
+
+    def yield_annos_from_file(self, file=None):
+        """ yield annotations as they are decoded from the memoization file
+
+            the last sync updated value is the return value of the generator
+            use `lsu = yield from reader.yield_annos_from_file()` to get it
+
+            supports both the [jblobs, lsu] and bare [jblobs] layouts """
         if file is None:
             file = self.memoization_file
 
-        jblobs = []
+        journal = None
+        if file == self.memoization_file:
+            journal = self._journal_state()
+
         last_sync_updated = None
-        if file is not None:
-            try:
-                with open(file, 'rt') as f:
-                    jblobs_lsu = json.load(f)
+        last = None
+        first = True
+        for row in self._yield_rows_from_file(file):
+            if isinstance(row, str) or row is None:
+                last_sync_updated = row  # [jblobs, lsu] layout
+                continue
+
+            if journal and row['id'] in journal:
+                jrow = journal[row['id']]
+                if jrow is None or jrow['updated'] >= row['updated']:
+                    continue  # deleted or updated after the snapshot
+                else:
+                    journal.pop(row['id'])  # snapshot is newer
 
-                try:
-                    jblobs, last_sync_updated = jblobs_lsu
-                    if not isinstance(last_sync_updated, str):
-                        msg = ('We have probably hit the rare case where there'
-                               ' are exactly two annotations in a cache file.')
-                        raise ValueError(msg)
-                except ValueError:
-                    jblobs = jblobs_lsu
-                    last_sync_updated = jblobs[-1]['updated']
-
-                if jblobs is None:
-                    raise ValueError('wat')
-            except json.decoder.JSONDecodeError:
-                with open(file, 'rt') as f:
-                    data = f.read()
-                if not data:
+            anno = HypothesisAnnotation(row)
+            if first:
+                self.check_group((anno,))
+                first = False
+
+            last = anno
+            yield anno
+
+        if last is not None and last_sync_updated is None:
+            last_sync_updated = last.updated  # bare list layout
+
+        if journal:
+            for jrow in journal.values():
+                if jrow is not None:
+                    anno = HypothesisAnnotation(jrow)
+                    if first:
+                        self.check_group((anno,))
+                        first = False
+
+                    last = anno
+                    yield anno
+
+            if last is not None:
+                # matches the lsu that memoize_annos would have written
+                last_sync_updated = last.updated
+
+        return last_sync_updated
+
+    def _yield_rows_from_file(self, file):
+        if file is None:
+            return
+
+        try:
+            with open(file, 'rt') as f:
+                stream = _JsonArrayStream(f)
+                if stream.peek() is None:
                     log.info('memoization file exists but is empty')
+                    return
+
+                stream.expect('[')
+                char = stream.peek()
+                if char == '[':  # [jblobs, lsu]
+                    yield from stream.members()
+                    stream.expect(',')
+                    yield stream.value()
+                    stream.expect(']')
+                else:  # bare list
+                    yield from stream.members(opened=True)
+
+        except json.decoder.JSONDecodeError as e:
+            log.error(f'memoization file {file} is corrupt {e}')
+            raise
+        except FileNotFoundError:
+            log.info('memoization file does not exist')
+
+    @property
+    def _journal_file(self):
+        """ append only log of changes made since the last snapshot """
+        mf = self.memoization_file
+        return mf.parent / (mf.name + '.journal')
+
+    @property
+    def _compacting_file(self):
+        """ the journal is moved here while a new snapshot is written """
+        mf = self.memoization_file
+        return mf.parent / (mf.name + '.journal-compacting')
+
+    def _read_journal(self):
+        records = []
+        for path in (self._compacting_file, self._journal_file):
+            try:
+                with open(path, 'rt') as f:
+                    for line in f:
+                        if not line.strip():
+                            continue
+                        try:
+                            records.append(json.loads(line))
+                        except json.decoder.JSONDecodeError:
+                            # a partial final line from a crashed writer
+                            log.warning(f'skipping bad journal record in {path}')
             except FileNotFoundError:
-                log.info('memoization file does not exist')
+                pass
 
-        annos = [HypothesisAnnotation(jb) for jb in jblobs]
-        self.check_group(annos)
-        return annos, last_sync_updated
+        return records
+
+    def _journal_state(self):
+        """ the final state of every annotation touched by the journal
+            in the order they were last touched, None means deleted """
+        records = self._read_journal()
+        self._journal_records = len(records)
+        state = {}
+        for action, payload in records:
+            if action == 'delete':
+                state.pop(payload, None)
+                state[payload] = None
+            else:  # create update
+                old = state.get(payload['id'])
+                # replay is idempotent so a crash during compaction
+                # cannot roll an annotation back to an older version
+                if old is None or payload['updated'] >= old['updated']:
+                    state.pop(payload['id'], None)
+                    state[payload['id']] = payload
+
+        if records:
+            log.info(f'replaying {len(records)} journal records')
+
+        return state
 
     def check_group(self, annos):
         if annos:
@@ -207,10 +559,16 @@ class AnnoReader:
 
 class Memoizer(AnnoReader, AnnoFetcher):  # TODO just use a database ...
 
+    # number of journal records after which a new snapshot is written
+    compact_after = 5000
+
     def __init__(self, memoization_file=None,
                  api_token=api_token,
                  username=username,
-                 group=group):
+                 group=group,
+                 on_update=None,
+                 lock_timeout=None,
+                 **kwargs):
         # SIGH
         AnnoReader.__init__(self,
             memoization_file=memoization_file,
@@ -220,10 +578,23 @@ class Memoizer(AnnoReader, AnnoFetcher):  # TODO just use a database ...
             memoization_file=memoization_file,
             api_token=api_token,
             username=username,
-            group=group)
+            group=group,
+            **kwargs)
 
         lock_name = '.lock-' + self.memoization_file.stem
         self._lock_folder = self.memoization_file.parent / lock_name
+        # held exclusively from before the lock folder is created until after
+        # it is removed so that waiting processes are woken by the os
+        self._lock_file = self.memoization_file.parent / (lock_name + '.flock')
+        # called with the new annotations every time some are merged
+        self.on_update = on_update
+        # seconds to wait for another process to finish updating, None is forever
+        self.lock_timeout = lock_timeout
+
+        self._journal_lock = threading.RLock()
+        self._journal_records = 0
+        self._compaction_thread = None
+        self._writer_locked = False  # flock conflicts with our own other fds
 
     def add_missing_annos(self, annos, last_sync_updated):  # XXX deprecated
         """ this modifies annos in place """
@@ -240,6 +611,7 @@ class Memoizer(AnnoReader, AnnoFetcher):  # TODO just use a database ...
                               stop_at=None,
                               batch_size=2000):
         self.check_group(annos)
+        search_after = start_after
         if annos:
             if start_after is not None:
                 raise TypeError('cannot have both non-empty annos and '
@@ -267,36 +639,86 @@ class Memoizer(AnnoReader, AnnoFetcher):  # TODO just use a database ...
                                helpers=tuple()):
         # BUT FIRST check to make sure that no one else is in the middle of fetching into our anno file
         # YES THIS USES A LOCK FILE, SIGH
-        can_update = not self._lock_folder.exists()
-        if can_update:
-            # TODO in a multiprocess context streaming anno updates
-            # is a nightmare, even in this context if we call get_annos
-            # more than once there is a risk that only some processes
-            # will get the new annos, though I guess that is ok
-            # in the sense that they will go look for new annos starting
-            # wherever they happen to be and will double pull any annos
-            # that were previously pulled by another process in addition
-            # to any annoations that happend after the other process pulled
-            # the only inconsistency would be if an annoation was deleted
-            # since we already deal with the update case
-            self._lock_folder.mkdir()
-            new_annos = self._can_update(annos, search_after, stop_at, batch_size)
-        elif self._locking_process_dead():
-            if self._lock_pid_file.exists():
-                # folder might exist by itself with no lock-pid file
-                self._unlock_pid()
-
-            _search_after = self._lock_folder_lsu()
-            search_after = (search_after
-                            if _search_after is None else
-                            _search_after)
+        with self._writer_lock() as is_writer:
+            if not is_writer:
+                new_annos = None
+            elif not self._lock_folder.exists():
+                # TODO in a multiprocess context streaming anno updates
+                # is a nightmare, even in this context if we call get_annos
+                # more than once there is a risk that only some processes
+                # will get the new annos, though I guess that is ok
+                # in the sense that they will go look for new annos starting
+                # wherever they happen to be and will double pull any annos
+                # that were previously pulled by another process in addition
+                # to any annoations that happend after the other process pulled
+                # the only inconsistency would be if an annoation was deleted
+                # since we already deal with the update case
+                self._lock_folder.mkdir()
+                new_annos = self._can_update(annos, search_after, stop_at, batch_size)
+            elif self._locking_process_dead():
+                if self._lock_pid_file.exists():
+                    # folder might exist by itself with no lock-pid file
+                    self._unlock_pid()
+
+                _search_after = self._lock_folder_lsu()
+                search_after = (search_after
+                                if _search_after is None else
+                                _search_after)
+
+                new_annos = self._can_update(annos, search_after, stop_at, batch_size)
+            else:
+                new_annos = None
 
-            new_annos = self._can_update(annos, search_after, stop_at, batch_size)
-        else:
-            new_annos = self._cannot_update(annos)
+        if new_annos is None:
+            # wait outside the writer lock otherwise we would wait on ourselves
+            new_annos = self._cannot_update(annos, search_after, stop_at, batch_size)
 
         return new_annos
 
+    @contextmanager
+    def _writer_lock(self):
+        """ try to become the process that updates the memoization file
+
+            yields False if another process holds the lock, without
+            fcntl always yields True and the lock folder decides """
+        if fcntl is None:
+            yield True
+            return
+
+        self._touch_private(self._lock_file)
+        with open(self._lock_file, 'rb') as f:
+            try:
+                fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                yield False
+                return
+
+            self._writer_locked = True
+            try:
+                yield True
+            finally:
+                self._writer_locked = False
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+    @contextmanager
+    def _compaction_lock(self):
+        """ hold the writer lock so that no other process updates the
+            memoization file while we write a compacted snapshot, waits
+            at most lock_timeout, nothing to take if we hold it already """
+        if fcntl is None or self._writer_locked:
+            yield
+            return
+
+        self._touch_private(self._lock_file)
+        with open(self._lock_file, 'rb') as f:
+            if not _flock(f.fileno(), fcntl.LOCK_EX, self.lock_timeout):
+                raise TimeoutError(f'{self._lock_file} still locked after {self.lock_timeout}s')
+
+            try:
+                yield
+            finally:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
     def _can_update(self, annos, search_after, stop_at, batch_size):
         """ only call this if we can update"""
         try:
@@ -325,26 +747,56 @@ class Memoizer(AnnoReader, AnnoFetcher):  # TODO just use a database ...
             if self._lock_pid_file.exists():
                 self._unlock_pid()
 
-    def _cannot_update(self, annos):
+    def _cannot_update(self, annos, search_after, stop_at=None, batch_size=2000):
         # we have to block here until the annos are updated and the
         # lock folder is removed so we can extend the current annos
-        while True:
-            sleep(1)  # sigh
-            # FIXME in theory this wait could
-            # lead to some workers never waking up
-            # if calls to update from other workers
-            # happen frequently enough
-            if not self._lock_folder.exists():
-                break
+        if not self._wait_for_writer(self.lock_timeout):
+            # the writer died part way through, pick up where it left off
+            return self._stream_annos_from_api(annos, search_after, stop_at, batch_size)
 
         all_annos, lsu = self.get_annos_from_file()
         # this approach is safter than direct comparison of all_annos and annos
         # because it makes it possible to detect duplicates from updates
-        new_annos = [a for a in all_annos if a.updated > lsu]
+        # compare against where the caller was, the file lsu is already the newest
+        new_annos = [a for a in all_annos
+                     if search_after is None or a.updated > search_after]
         self._merge_new_annos(annos, new_annos)
         # we don't need to memoize here
         return new_annos
 
+    def _wait_for_writer(self, timeout=None):
+        """ block until the process updating the memoization file is done
+
+            the writer holds the lock file exclusively from before it
+            creates the lock folder until after it removes it, so waiters
+            block on a shared lock rather than on the folder, which may
+            not exist yet, returns False if the writing process died
+            before finishing and raises TimeoutError if it is still
+            going after timeout """
+        deadline = None if timeout is None else monotonic() + timeout
+        while True:
+            remaining = None if deadline is None else max(deadline - monotonic(), 0)
+            if fcntl is not None:
+                # every waiter takes a shared lock so all of them
+                # wake up together as soon as the writer lets go
+                self._touch_private(self._lock_file)
+                with open(self._lock_file, 'rb') as f:
+                    if not _flock(f.fileno(), fcntl.LOCK_SH, remaining):
+                        raise TimeoutError(f'{self._lock_file} still locked after {timeout}s')
+
+                    fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+            if not self._lock_folder.exists():
+                return True
+            elif self._locking_process_dead():
+                return False
+            elif deadline is not None and monotonic() >= deadline:
+                raise TimeoutError(f'{self._lock_folder} still locked after {timeout}s')
+            elif fcntl is None:
+                sleep(1 if remaining is None else min(1, remaining))  # sigh
+            else:
+                # writer that does not take the lock file
+                sleep(0.1)
 
     @property
     def _lock_pid_file(self):
@@ -355,7 +807,7 @@ class Memoizer(AnnoReader, AnnoFetcher):  # TODO just use a database ...
             raise FileExistsError(self._lock_pid_file)
 
         p = psutil.Process()
-        data = f'{p.pid},{p._create_time}'
+        data = f'{p.pid},{p.create_time()}'
 
         with open(self._lock_pid_file, 'wt') as f:
             f.write(data)
@@ -383,7 +835,7 @@ class Memoizer(AnnoReader, AnnoFetcher):  # TODO just use a database ...
             return True
 
         p = psutil.Process(pid)
-        return p._create_time != create_time
+        return p.create_time() != create_time
 
     def _unlock_pid(self):
         self._lock_pid_file.unlink()
@@ -413,45 +865,158 @@ class Memoizer(AnnoReader, AnnoFetcher):  # TODO just use a database ...
         return new_annos
 
     def _merge_new_annos(self, annos, new_annos):
-        new_ids = set(a.id for a in new_annos)
-        n_updated = 0
-        for anno in tuple(annos):
-            if anno.id in new_ids:
-                annos.remove(anno)  # FIXME stale data in helper data structures
-                n_updated += 1
-
-        annos.extend(new_annos)
+        if isinstance(annos, AnnoList):
+            n_updated = sum(annos.upsert(a) is not None for a in new_annos)
+        else:
+            new_ids = set(a.id for a in new_annos)
+            kept = [a for a in annos if a.id not in new_ids]
+            n_updated = len(annos) - len(kept)
+            annos[:] = kept + list(new_annos)
+
+        # FIXME stale data in helper data structures
         log.info(f'added {len(new_annos) - n_updated} new annotations')
         if n_updated:
             log.info(f'updated {n_updated} annotations')
 
+        if self.on_update is not None and new_annos:
+            self.on_update(new_annos)
+
+    def _touch_private(self, path):
+        # always touch and chmod before writing
+        # so that there is no time at which a file
+        # with data can exist with the wrong permission
+        if not path.exists():
+            if not path.parent.exists():
+                path.parent.mkdir()
+
+            path.touch()
+            path.chmod(0o600)
+
+    def _write_snapshot(self, annos):
+        # write to a temporary file and swap it in so that readers
+        # never see a partially written snapshot
+        temp = self.memoization_file.parent / (self.memoization_file.name + '.tmp')
+        self._touch_private(temp)
+        with open(temp, 'wt') as f:
+            lsu = annos[-1].updated if annos else None
+            alsu = annos, lsu
+            json.dump(alsu, f, cls=JEncode)
+
+        os.replace(temp, self.memoization_file)
+
+    def _wait_for_compaction(self):
+        thread = self._compaction_thread
+        if thread is not None and thread is not threading.current_thread():
+            thread.join()
+
     def memoize_annos(self, annos):
+        """ write a full snapshot of annos and clear the journal """
         # FIXME if there are multiple ws listeners we will have race conditions?
         if self.memoization_file is not None:
             msg = ('annos updated, memoizing new version with, '
                    f'{len(annos)} members')
             log.info(msg)
-            do_chmod = False
-            if not self.memoization_file.exists():
-                do_chmod = True
-                if not self.memoization_file.parent.exists():
-                    self.memoization_file.parent.mkdir()
-
-            if do_chmod:
-                # always touch and chmod before writing
-                # so that there is no time at which a file
-                # with data can exist with the wrong permission
-                self.memoization_file.touch()
-                self.memoization_file.chmod(0o600)
-
-            with open(self.memoization_file, 'wt') as f:
-                lsu = annos[-1].updated if annos else None
-                alsu = annos, lsu
-                json.dump(alsu, f, cls=JEncode)
+            while True:
+                self._wait_for_compaction()
+                with self._journal_lock:
+                    thread = self._compaction_thread
+                    if thread is not None and thread is not threading.current_thread():
+                        continue  # another compaction started while we waited
+
+                    self._write_snapshot(annos)
+                    for path in (self._compacting_file, self._journal_file):
+                        try:
+                            path.unlink()
+                        except FileNotFoundError:
+                            pass
+
+                    self._journal_records = 0
+                    break
 
         else:
             log.info(f'No memoization file, not saving.')
 
+    def _journal(self, records, annos):
+        """ append records to the journal, O(1) in the size of annos """
+        if self.memoization_file is None:
+            log.info('No memoization file, not saving.')
+            return
+
+        with self._journal_lock:
+            if not self.memoization_file.exists():
+                # the journal is only meaningful relative to a snapshot
+                self._write_snapshot([])
+
+            self._touch_private(self._journal_file)
+            with open(self._journal_file, 'at') as f:
+                f.write(''.join(json.dumps(r, cls=JEncode) + '\n'
+                                for r in records))
+
+            self._journal_records += len(records)
+            if self._journal_records >= self.compact_after:
+                self.compact(annos)
+
+    def memoize_anno(self, anno, annos, action='update'):
+        """ journal a single created or updated annotation,
+            annos must already contain anno """
+        self._journal(((action, anno),), annos)
+
+    def memoize_delete(self, id_, annos):
+        """ journal the deletion of an annotation,
+            annos must already have had it removed """
+        self._journal((('delete', id_),), annos)
+
+    def memoize_changes(self, changes, annos):
+        """ journal many (action, anno or id) changes in one write """
+        self._journal(tuple(changes), annos)
+
+    def compact(self, annos, background=True):
+        """ fold the journal into a new snapshot
+
+            the current journal is moved aside so that appends can
+            continue while the snapshot is written, if we crash before
+            finishing the moved journal is replayed on the next load,
+            the snapshot is written holding the writer lock so that it
+            cannot race another process updating the same file """
+        with self._journal_lock:
+            if self._compaction_thread is not None:
+                return  # already in progress, those records will be compacted next time
+
+            if self._journal_file.exists():
+                if self._compacting_file.exists():
+                    # left behind by a crash, keep everything in one place
+                    with open(self._compacting_file, 'at') as out, open(self._journal_file, 'rt') as f:
+                        shutil.copyfileobj(f, out)
+
+                    self._journal_file.unlink()
+                else:
+                    os.replace(self._journal_file, self._compacting_file)
+
+            snapshot = tuple(annos)
+            self._journal_records = 0
+
+            def compact_target():
+                try:
+                    with self._compaction_lock():
+                        self._write_snapshot(snapshot)
+                        with self._journal_lock:
+                            try:
+                                self._compacting_file.unlink()
+                            except FileNotFoundError:
+                                pass
+                except BaseException as e:
+                    log.exception(e)
+                finally:
+                    self._compaction_thread = None
+
+            if background:
+                self._compaction_thread = threading.Thread(target=compact_target,
+                                                           daemon=True)
+                self._compaction_thread.start()
+            else:
+                self._compaction_thread = threading.current_thread()
+                compact_target()
+
     def get_annos(self):
         annos, last_sync_updated = self.get_annos_from_file()
         new_annos = self._stream_annos_from_api(annos, last_sync_updated)
@@ -459,22 +1024,32 @@ class Memoizer(AnnoReader, AnnoFetcher):  # TODO just use a database ...
 
     def add_anno(self, anno, annos):
         annos.append(anno)
-        self.memoize_annos(annos)
+        self.memoize_anno(anno, annos, action='create')
 
     def del_anno(self, id_, annos, memoize=True):
-        # FIXME this is is SUPER slow
-        matches = [a for a in annos if a.id == id_]
-        if not matches:
-            raise ValueError(f'No annotation with id={id_} could be found.')
+        if isinstance(annos, AnnoList):
+            found = annos.delete(id_) is not None
         else:
-            for match in matches:
-                annos.remove(match)
-            if memoize:
-                self.memoize_annos(annos)
+            kept = [a for a in annos if a.id != id_]
+            found = len(kept) != len(annos)
+            annos[:] = kept
+
+        if not found:
+            raise ValueError(f'No annotation with id={id_} could be found.')
+        elif memoize:
+            self.memoize_delete(id_, annos)
 
     def update_anno(self, anno, annos):
-        self.del_anno(anno.id, annos, memoize=False)
-        self.add_anno(anno, annos)
+        if isinstance(annos, AnnoList):
+            if annos.byId(anno.id) is None:
+                raise ValueError(f'No annotation with id={anno.id} could be found.')
+
+            annos.upsert(anno)
+        else:
+            self.del_anno(anno.id, annos, memoize=False)
+            annos.append(anno)
+
+        self.memoize_anno(anno, annos, action='update')
 
     def update_annos_from_api_response(resp, annos):
         # XXX NOTE this will collide with websocket if unmanaged
@@ -520,7 +1095,8 @@ class HypothesisUtils:
     # XXX design flaw, group is not required at this point, should be passed for operations
     # a default_group could be set ... the issue is deep and pervasive though because the
     # group id is expected all over the fucking place
-    def __init__(self, username=None, token=None, group=None, domain=None, limit=None):
+    def __init__(self, username=None, token=None, group=None, domain=None, limit=None,
+                 pool_size=None, scheme=None, prefetch=0, retry=None, rate=None):
         if domain is None:
             self.domain = 'hypothes.is'
         else:
@@ -529,10 +1105,17 @@ class HypothesisUtils:
             self.username = username
         if token is not None:
             self.token = token
-        self.app_url = 'https://%s/app' % self.domain
-        self.api_url = 'https://%s/api' % self.domain
-        self.query_url_template = 'https://%s/api/search?{query}' % self.domain
-        self.search_url_template = 'https://%s/search?q={query}' % self.domain
+        self.scheme = 'https' if scheme is None else scheme
+        self.app_url = '%s://%s/app' % (self.scheme, self.domain)
+        self.api_url = '%s://%s/api' % (self.scheme, self.domain)
+        self.query_url_template = '%s://%s/api/search?{query}' % (self.scheme, self.domain)
+        self.search_url_template = '%s://%s/search?q={query}' % (self.scheme, self.domain)
+        # max number of connections kept alive, raise this to match
+        # the number of threads if you share one instance between them
+        self.pool_size = 10 if pool_size is None else pool_size
+        self.prefetch = prefetch  # pages search_all may request ahead of the consumer
+        self._session = None
+        self._session_lock = threading.Lock()
         self.group = group if group is not None else '__world__'
         self.single_page_limit = 200 if limit is None else limit  # per-page, the api honors limit= up to (currently) 200
         self.permissions = {
@@ -541,34 +1124,88 @@ class HypothesisUtils:
                 "delete": ['acct:' + self.username + '@hypothes.is'],
                 "admin":  ['acct:' + self.username + '@hypothes.is']
                 }
-        self.ssl_retry = 0
+        # retry policy shared by every request, calls keep their own attempt count
+        self.retry = RetryPolicy() if retry is None else retry
+        # optional client side limit in requests per second
+        self.rate_limiter = None if rate is None else TokenBucket(rate)
+
+    @property
+    def session(self):
+        """ connection pool shared by all requests made by this instance """
+        if self._session is None:
+            with self._session_lock:
+                if self._session is None:
+                    session = requests.Session()
+                    adapter = requests.adapters.HTTPAdapter(
+                        pool_connections=1, pool_maxsize=self.pool_size)
+                    session.mount('https://', adapter)
+                    session.mount('http://', adapter)
+                    session.headers.update(
+                        {'Authorization': 'Bearer ' + self.token,
+                         'Content-Type': 'application/json;charset=utf-8'})
+                    self._session = session
+
+        return self._session
+
+    def close(self):
+        """ close all pooled connections, a new pool is
+            created if this instance is used again """
+        with self._session_lock:
+            if self._session is not None:
+                self._session.close()
+                self._session = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def _send(self, method, url, **kwargs):
+        return self.session.request(method, url, **kwargs)
+
+    def _request(self, method, url, idempotent=True, retry=None, **kwargs):
+        """ send a request applying the rate limit and retry policy """
+        policy = self.retry if retry is None else retry
+        attempt = 0
+        while True:
+            if self.rate_limiter is not None:
+                self.rate_limiter.acquire()
+
+            try:
+                r = self._send(method, url, **kwargs)
+            except Exception as e:
+                if not policy.retry_exception(e, attempt, idempotent):
+                    raise
+
+                delay = policy.delay(attempt)
+                log.error(f'{e!r} on {method} {url} attempt {attempt} retrying in {delay:.2f}s')
+            else:
+                if not policy.retry_status(r.status_code, attempt, idempotent):
+                    return r
+
+                delay = policy.delay(attempt, r.headers.get('Retry-After'))
+                log.warning(f'{r.status_code} {r.reason} on {method} {url} '
+                            f'attempt {attempt} retrying in {delay:.2f}s')
+
+            sleep(delay)
+            attempt += 1
 
     def authenticated_api_query(self, query_url=None):
         try:
-            headers = {'Authorization': 'Bearer ' + self.token,
-                       'Content-Type': 'application/json;charset=utf-8'}
-            r = requests.get(query_url, headers=headers)
+            r = self._request('GET', query_url)
             obj = r.json()
             if r.ok:
                 return obj
             else:
                 raise NotOkError(f'response was not ok! {r.reason} {obj}', r)
 
-        except requests.exceptions.SSLError as e:
-            if self.ssl_retry < 5:
-                self.ssl_retry += 1
-                log.error(f'Ssl error at level {self.ssl_retry} retrying....')
-                return self.authenticated_api_query(query_url)
-            else:
-                self.ssl_retry = 0
-                log.error(e)
-                return {'ERROR': True, 'rows': tuple()}
         except KeyboardInterrupt:
             raise
         except BaseException as e:
             log.exception(e)
             #print('Request, status code:', r.status_code)  # this causes more errors...
-            return {'ERROR': True, 'rows': tuple()}
+            return {'ERROR': True, 'rows': tuple(), 'exception': e}
 
     def make_annotation_payload_with_target_using_only_text_quote(
             self, url, prefix, exact, suffix, text, tags, document, extra):
@@ -628,67 +1265,52 @@ class HypothesisUtils:
 
     def head_annotation(self, id):
         # used as a 'kind' way to look for deleted annotations
-        headers = {'Authorization': 'Bearer ' + self.token,
-                   'Content-Type': 'application/json;charset=utf-8'}
-        r = requests.head(self.api_url + '/annotations/' + id, headers=headers)
+        r = self._request('HEAD', self.api_url + '/annotations/' + id)
         return r
 
     def get_annotation(self, id):
-        headers = {'Authorization': 'Bearer ' + self.token,
-                   'Content-Type': 'application/json;charset=utf-8'}
-        r = requests.get(self.api_url + '/annotations/' + id, headers=headers)
+        r = self._request('GET', self.api_url + '/annotations/' + id)
         return r
 
     def post_annotation(self, payload):
-        headers = {'Authorization': 'Bearer ' + self.token,
-                   'Content-Type': 'application/json;charset=utf-8'}
         data = json.dumps(payload, ensure_ascii=False)
-        r = requests.post(self.api_url + '/annotations',
-                          headers=headers,
+        # a retried POST could create a duplicate so only retry
+        # when the server says it did not process the request
+        r = self._request('POST', self.api_url + '/annotations',
+                          idempotent=False,
                           data=data.encode('utf-8'))
         return r
 
     def patch_annotation(self, id, payload):
-        headers = {'Authorization': 'Bearer ' + self.token,
-                   'Content-Type': 'application/json;charset=utf-8'}
         data = json.dumps(payload, ensure_ascii=False)
-        r = requests.patch(self.api_url + '/annotations/' + id,
-                           headers=headers,
-                           data=data.encode('utf-8'))
+        r = self._request('PATCH', self.api_url + '/annotations/' + id,
+                          data=data.encode('utf-8'))
         return r
 
     def delete_annotation(self, id):
-        headers = {'Authorization': 'Bearer ' + self.token,
-                   'Content-Type': 'application/json;charset=utf-8'}
-        r = requests.delete(self.api_url + '/annotations/' + id, headers=headers)
+        r = self._request('DELETE', self.api_url + '/annotations/' + id)
         return r
 
-    def search_all(self, params={}, max_results=None, stop_at=None):
-        """Call search API with pagination, return rows """
-        sort_by = params['sort'] if 'sort' in params else 'updated'
-        if stop_at:
-            if not isinstance(stop_at, str):
-                raise TypeError('stop_at should be a string')
+    def search_all(self, params={}, max_results=None, stop_at=None, prefetch=None):
+        """Call search API with pagination, return rows
 
-            dont_stop = (lambda r: r[sort_by] <= stop_at  # when ascending things less than stop are ok
-                         if 'order' in params and params['order'] == 'asc'
-                         else lambda r: r[sort_by] >= stop_at)
+        prefetch is the number of pages that may be requested on a
+        background thread while the caller is still working through
+        the current page, 0 disables prefetching, None uses self.prefetch"""
+        sort_by, dont_stop = self._search_setup(params, max_results, stop_at)
+        if prefetch is None:
+            prefetch = self.prefetch
 
-        if max_results:
-            limit = 200 if 'limit' not in params else params['limit']  # FIXME hardcoded
-            if max_results < limit:
-                params['limit'] = max_results
+        pages = self._pages(params, sort_by, max_results, dont_stop)
+        if prefetch:
+            pages = self._prefetch(pages, prefetch)
 
         #sup_inf = max if params['order'] = 'asc' else min  # api defaults to desc
         # trust that rows[-1] works rather than potentially messsing stuff if max/min work differently
         nresults = 0
-        while True:
-            obj = self.search(params)
-            rows = obj['rows']
+        for rows in pages:
             lr = len(rows)
             nresults += lr
-            if lr == 0:
-                return
 
             stop = None
             if max_results:
@@ -709,10 +1331,91 @@ class HypothesisUtils:
             if stop:
                 return
 
+    @staticmethod
+    def _search_setup(params, max_results, stop_at):
+        """ shared setup for paginated searches, returns the sort
+            key and a predicate that is false once past stop_at """
+        sort_by = params['sort'] if 'sort' in params else 'updated'
+        dont_stop = None
+        if stop_at:
+            if not isinstance(stop_at, str):
+                raise TypeError('stop_at should be a string')
+
+            if 'order' in params and params['order'] == 'asc':
+                dont_stop = lambda r: r[sort_by] <= stop_at  # when ascending things less than stop are ok
+            else:
+                dont_stop = lambda r: r[sort_by] >= stop_at
+
+        if max_results:
+            limit = 200 if 'limit' not in params else params['limit']  # FIXME hardcoded
+            if max_results < limit:
+                params['limit'] = max_results
+
+        return sort_by, dont_stop
+
+    def _pages(self, params, sort_by, max_results=None, dont_stop=None):
+        """ yield non-empty pages of rows following search_after """
+        nresults = 0
+        while True:
+            obj = self.search(params)
+            if 'ERROR' in obj:
+                # don't let a failed page look like the end of the results
+                raise obj['exception']
+
+            rows = obj['rows']
+            if not rows:
+                return
+
+            yield rows
+            nresults += len(rows)
+            if max_results and nresults >= max_results:
+                return
+            if dont_stop is not None and not dont_stop(rows[-1]):
+                return
+
             search_after = rows[-1][sort_by]
             params['search_after'] = search_after
             log.info(f'searching after {search_after}')
 
+    @staticmethod
+    def _prefetch(pages, depth):
+        """ run pages on a background thread keeping at most depth pages
+            ahead of the consumer, errors are raised in the consumer """
+        q = queue.Queue(maxsize=depth)
+        closed = threading.Event()
+
+        def put(item):
+            while not closed.is_set():
+                try:
+                    q.put(item, timeout=0.1)
+                    return True
+                except queue.Full:
+                    pass
+
+        def producer():
+            try:
+                for page in pages:
+                    if not put(('page', page)):
+                        return
+
+                put(('done', None))
+            except BaseException as e:
+                put(('error', e))
+
+        thread = threading.Thread(target=producer, daemon=True)
+        thread.start()
+        try:
+            while True:
+                kind, value = q.get()
+                if kind == 'page':
+                    yield value
+                elif kind == 'done':
+                    return
+                else:
+                    raise value
+        finally:
+            closed.set()  # the producer exits at its next put
+
     def search_url(self, **params):
         return (self
                 .search_url_template
@@ -731,24 +1434,84 @@ class HypothesisUtils:
         obj = self.authenticated_api_query(self.query_url(**params))
         return obj
 
-    def batch_update(self, function, *ids, pretend=True):
+    def batch_update(self, function, *ids, pretend=True, workers=None,
+                     ordered=True, retries=None):
         """ apply a function a set of annotations from their ids
             and patch the changes back to the remote
             pretend is set to True by default so that you can test the output
-            before shooting yourself in the foot """
-        # this is a friendly function that does sequential requests
-        # if you want something e.g. with Async/deferred, don't use this
+            before shooting yourself in the foot
+
+            yields (blob, function(blob)) when pretending and (blob, response)
+            otherwise, pass the results to summarize_batch for a quick look
+            at what changed
+
+            workers > 1 runs that many get/patch pairs concurrently, set
+            ordered=False to get results as soon as they finish, failed
+            requests are retried according to self.retry, retries
+            overrides the number of attempts for this batch only """
+        # without workers this is a friendly function that does sequential requests
+        retry = self.retry if retries is None else self.retry.replace(retries=retries)
+        url = self.api_url + '/annotations/'
+
+        def get(id):
+            return self._request('GET', url + id, retry=retry)
 
         if pretend:
-            yield from ((a, function(a)) for id in ids
-                        for a in (self.get_annotation(id).json(),))
+            def one(id):
+                blob = get(id).json()
+                return blob, function(blob)
 
         else:
-            for id in ids:
-                resp = self.get_annotation(id)
-                blob = resp.json()
+            def one(id):
+                blob = get(id).json()
                 updated = function(blob)
-                yield blob, self.patch_annotation(id, updated)
+                data = json.dumps(updated, ensure_ascii=False)
+                return blob, self._request('PATCH', url + id, retry=retry,
+                                           data=data.encode('utf-8'))
+
+        if workers is None or workers <= 1:
+            yield from (one(id) for id in ids)
+        else:
+            if workers > self.pool_size:
+                log.warning(f'workers {workers} > pool_size {self.pool_size}, '
+                            'some connections will not be reused')
+
+            yield from bounded_map(one, ids, workers, ordered=ordered)
+
+    @staticmethod
+    def summarize_batch(results):
+        """ one line per annotation that changed plus a total,
+            results are from batch_update, pretend or not """
+        lines = []
+        n = 0
+        for blob, out in results:
+            n += 1
+            after = out if isinstance(out, dict) else out.json()
+            diff = diff_payload(blob, after)
+            diff.pop('updated', None)  # always changes on patch
+            if not diff:
+                continue
+
+            parts = []
+            for key, (old, new) in diff.items():
+                if key == 'tags':
+                    old, new = set(old or ()), set(new or ())
+                    parts.append('tags' +
+                                 ''.join(f' +{t}' for t in sorted(new - old)) +
+                                 ''.join(f' -{t}' for t in sorted(old - new)))
+                else:
+                    parts.append(f'{key} changed')
+
+            lines.append(f"{blob.get('id')}: " + '; '.join(parts))
+
+        lines.append(f'{len(lines)} of {n} annotations changed')
+        return '\n'.join(lines)
+
+
+def diff_payload(blob, payload):
+    """ {key: (old, new)} for each key in payload that differs from blob """
+    return {k: (blob.get(k), v) for k, v in payload.items()
+            if k not in blob or blob[k] != v}
 
 
 class HypAnnoId(str):  # TODO derive from Identifer ...
@@ -912,13 +1675,26 @@ class Annotation:
 
 
 class HypothesisAnnotation:
-    """Encapsulate one row of a Hypothesis API search."""
+    """Encapsulate one row of a Hypothesis API search.
+
+    Rows are treated as immutable, uri, tags, type and the selector
+    lookups are computed on first access and cached in slots, a
+    changed annotation should come in as a new HypothesisAnnotation."""
+
+    __slots__ = ('_row', '_uri', '_tags', '_type', '_selectors_by_type', '__weakref__')
+
     def __init__(self, row):
         if isinstance(row, HypothesisAnnotation):
             row = row._row
 
         self._row = row
 
+    def __getstate__(self):
+        return self._row
+
+    def __setstate__(self, row):
+        self._row = row
+
     def _normalized(self):
         out = {}
         for k in dir(self):
@@ -988,6 +1764,13 @@ class HypothesisAnnotation:
 
     @property
     def uri(self):
+        try:
+            return self._uri
+        except AttributeError:
+            self._uri = uri = self._compute_uri()
+            return uri
+
+    def _compute_uri(self):
         if 'uri' in self._row:    # should it ever not?
             uri = self._row['uri']
         else:
@@ -1010,14 +1793,25 @@ class HypothesisAnnotation:
 
     @property
     def tags(self):
-        tags = []
+        # a fresh list every time so callers can't corrupt the cache
+        return list(self._tag_tuple)
+
+    @property
+    def _tag_tuple(self):
+        try:
+            return self._tags
+        except AttributeError:
+            pass
+
+        tags = ()
         if 'tags' in self._row and self._row['tags'] is not None:
             tags = self._row['tags']
             if isinstance(tags, list):  # I find it hard to believe this is ever not true
-                tags = [t.strip() for t in tags]
+                tags = tuple(t.strip() for t in tags)
             else:
                 raise BaseException('should never happen ...')
 
+        self._tags = tags
         return tags
 
     @property
@@ -1059,12 +1853,20 @@ class HypothesisAnnotation:
 
     @property
     def type(self):
+        try:
+            return self._type
+        except AttributeError:
+            pass
+
         if self.references:
-            return 'reply'
+            type = 'reply'
         elif self.targets and any('selector' in t for t in self.targets):
-            return 'annotation'
+            type = 'annotation'
         else:
-            return 'pagenote'
+            type = 'pagenote'
+
+        self._type = type
+        return type
 
     @property
     def targets(self):
@@ -1084,10 +1886,19 @@ class HypothesisAnnotation:
                     yield selector
 
     def _selector_value(self, type, name):
-        # obviously inefficient
-        for selector in self.selectors:
-            if 'type' in selector and selector['type'] == type and len(selector) > 1:
-                return selector[name]
+        try:
+            index = self._selectors_by_type
+        except AttributeError:
+            # first selector of each type wins, same as the old linear scan
+            index = {}
+            for selector in self.selectors:
+                if 'type' in selector and len(selector) > 1:
+                    index.setdefault(selector['type'], selector)
+
+            self._selectors_by_type = index
+
+        if type in index:
+            return index[type][name]
 
     @property
     def prefix(self):
@@ -1123,7 +1934,7 @@ class HypothesisAnnotation:
         # text and tags can change, if exact changes then the id will also change
         return (self.id == other.id and
                 self.text == other.text and
-                set(self.tags) == set(other.tags) and
+                set(self._tag_tuple) == set(other._tag_tuple) and
                 self.updated == other.updated)
 
     def __hash__(self):
@@ -1137,45 +1948,496 @@ class HypothesisAnnotation:
         return not self.__lt__(other)
 
 
+class AnnoList(MutableSequence):
+    """ insertion ordered annotations indexed by id
+
+        a full mutable sequence so it can stand in for the plain lists
+        of annotations used everywhere else, ids are unique so appending
+        an annotation whose id is already present replaces the old one
+        and moves it to the end, and assigning or inserting one removes
+        any other copy, in and index accept either an annotation or an
+        id, + returns a plain list, delete and upsert by id and access
+        at the ends are O(1), other positional operations are O(n),
+        the index is an OrderedDict because reversing dict views is 3.8+ """
+
+    def __init__(self, annos=()):
+        self._index = OrderedDict()
+        self.extend(annos)
+
+    def __len__(self):
+        return len(self._index)
+
+    def __iter__(self):
+        return iter(self._index.values())
+
+    def __reversed__(self):
+        return reversed(self._index.values())
+
+    def __contains__(self, id_annotation):
+        if isinstance(id_annotation, str):
+            return id_annotation in self._index
+
+        current = self._index.get(getattr(id_annotation, 'id', None))
+        return current is not None and current == id_annotation
+
+    def __eq__(self, other):
+        if isinstance(other, (list, tuple, AnnoList)):
+            return list(self) == list(other)
+
+        return NotImplemented
+
+    __hash__ = None
+
+    def __add__(self, other):
+        return list(self) + list(other)
+
+    def __radd__(self, other):
+        return list(other) + list(self)
+
+    def __repr__(self):
+        return f'{self.__class__.__name__}({list(self)!r})'
+
+    def __getitem__(self, key):
+        if isinstance(key, slice):
+            return list(self)[key]
+
+        n = len(self._index)
+        if key < 0:
+            key += n
+
+        if not 0 <= key < n:
+            raise IndexError('AnnoList index out of range')
+        elif key == n - 1:
+            return next(reversed(self._index.values()))
+        elif key < n // 2:
+            return next(islice(self._index.values(), key, None))
+        else:
+            return next(islice(reversed(self._index.values()), n - 1 - key, None))
+
+    def _assign(self, annos, placed):
+        """ rebuild from annos keeping only the placed copy of each placed id """
+        placed = {a.id: a for a in placed}
+        index = OrderedDict()
+        for a in annos:
+            if a.id in placed and a is not placed[a.id] or a.id in index:
+                continue
+
+            index[a.id] = a
+
+        self._index = index
+
+    def __setitem__(self, key, value):
+        if isinstance(key, slice):
+            value = list(value)
+        else:
+            old = self[key]
+            if old.id == value.id:
+                self._index[old.id] = value  # same position
+                return
+
+            value = [value]
+            key = slice(key, key + 1 or None)
+
+        annos = list(self)
+        annos[key] = value
+        self._assign(annos, value)
+
+    def __delitem__(self, key):
+        if isinstance(key, slice):
+            annos = list(self)
+            del annos[key]
+            self._index = OrderedDict((a.id, a) for a in annos)
+        else:
+            del self._index[self[key].id]
+
+    def insert(self, index, anno):
+        if index >= len(self._index):
+            self.upsert(anno)
+        else:
+            annos = list(self)
+            annos.insert(index, anno)
+            self._assign(annos, (anno,))
+
+    def index(self, id_annotation, start=0, stop=None):
+        if id_annotation not in self:
+            raise ValueError(f'{id_annotation!r} not in {self.__class__.__name__}')
+
+        id_ = id_annotation if isinstance(id_annotation, str) else id_annotation.id
+        for i, key in enumerate(islice(self._index, start, stop), start):
+            if key == id_:
+                return i
+
+        raise ValueError(f'{id_annotation!r} not in {self.__class__.__name__}')
+
+    def pop(self, index=-1):
+        if index == -1 and self._index:
+            return self._index.popitem()[1]
+
+        anno = self[index]
+        del self._index[anno.id]
+        return anno
+
+    def sort(self, *, key=None, reverse=False):
+        self._index = OrderedDict((a.id, a) for a in sorted(self, key=key, reverse=reverse))
+
+    def reverse(self):
+        self._index = OrderedDict((a.id, a) for a in reversed(self))
+
+    def byId(self, id_annotation):
+        return self._index.get(id_annotation)
+
+    def upsert(self, anno):
+        """ add or replace anno, return the version it replaced if any """
+        old = self._index.pop(anno.id, None)
+        self._index[anno.id] = anno
+        return old
+
+    def append(self, anno):
+        self.upsert(anno)
+
+    def extend(self, annos):
+        for anno in annos:
+            self.upsert(anno)
+
+    def delete(self, id_annotation):
+        """ remove and return the annotation with id_annotation, None if absent """
+        return self._index.pop(id_annotation, None)
+
+    def remove(self, anno):
+        if anno not in self:
+            raise ValueError(f'{anno!r} not in {self.__class__.__name__}')
+
+        del self._index[anno if isinstance(anno, str) else anno.id]
+
+    def clear(self):
+        self._index.clear()
+
+    def copy(self):
+        return self.__class__(self)
+
+
+class ThreadIndex:
+    """ reply structure of a set of annotations by id
+
+        the parent of an annotation is the closest of its references
+        that is present, so replies whose direct parent is missing
+        still hang off the nearest ancestor, and are orphans until the
+        direct parent shows up, all lookups are dict hits and add and
+        remove only touch the annotations whose parent changes """
+
+    def __init__(self):
+        self._references = {}  # id -> tuple of referenced ids, root first
+        self._parent = {}  # id -> closest present ancestor or None
+        self._children = {}  # id -> {child id: None}
+        self._waiting = {}  # absent id -> {id: None} that may get a closer parent
+        self._orphans = {}  # id -> None, direct parent is absent
+
+    def __contains__(self, id_):
+        return id_ in self._references
+
+    def __len__(self):
+        return len(self._references)
+
+    def _resolve(self, id_):
+        for ref in reversed(self._references[id_]):
+            if ref in self._references:
+                return ref
+
+    def _set_parent(self, id_, parent):
+        old = self._parent.get(id_)
+        if old is not None and old in self._children:
+            children = self._children[old]
+            children.pop(id_, None)
+            if not children:
+                self._children.pop(old)
+
+        self._parent[id_] = parent
+        if parent is not None:
+            if parent not in self._children:
+                self._children[parent] = {}
+
+            self._children[parent][id_] = None
+
+    def add(self, id_, references=()):
+        references = tuple(references)
+        if id_ in self._references:
+            if self._references[id_] == references:
+                return
+
+            self.remove(id_)
+
+        self._references[id_] = references
+        for ref in references:
+            if ref not in self._references:
+                if ref not in self._waiting:
+                    self._waiting[ref] = {}
+
+                self._waiting[ref][id_] = None
+
+        if references and references[-1] not in self._references:
+            self._orphans[id_] = None
+
+        self._set_parent(id_, self._resolve(id_))
+        # annotations that reference this one may have a closer parent now
+        for waiter in self._waiting.pop(id_, ()):
+            self._set_parent(waiter, self._resolve(waiter))
+            if self._references[waiter][-1] == id_:
+                self._orphans.pop(waiter, None)
+
+    def extend(self, items):
+        """ add many (id, references) pairs, parents are resolved once
+            after all of them are present instead of being moved closer
+            every time an ancestor arrives """
+        new = []
+        for id_, references in items:
+            references = tuple(references)
+            if id_ in self._references:
+                if self._references[id_] == references:
+                    continue
+
+                self.remove(id_)
+
+            self._references[id_] = references
+            new.append(id_)
+
+        present, waiting, children = self._references, self._waiting, self._children
+        for id_ in new:
+            # new ids have no old parent so _set_parent is inlined
+            parent = None
+            for ref in present[id_]:
+                if ref in present:
+                    parent = ref  # the last present ref is the closest
+                else:
+                    if ref not in waiting:
+                        waiting[ref] = {}
+
+                    waiting[ref][id_] = None
+
+            self._parent[id_] = parent
+            if parent is not None:
+                if parent not in children:
+                    children[parent] = {}
+
+                children[parent][id_] = None
+
+            if present[id_] and present[id_][-1] not in present:
+                self._orphans[id_] = None
+
+        # annotations added before this batch may have a closer parent now
+        for id_ in new:
+            for waiter in self._waiting.pop(id_, ()):
+                self._set_parent(waiter, self._resolve(waiter))
+                if self._references[waiter][-1] == id_:
+                    self._orphans.pop(waiter, None)
+
+    def remove(self, id_):
+        if id_ not in self._references:
+            return
+
+        references = self._references.pop(id_)
+        for ref in references:
+            if ref in self._waiting:
+                waiting = self._waiting[ref]
+                waiting.pop(id_, None)
+                if not waiting:
+                    self._waiting.pop(ref)
+
+        self._orphans.pop(id_, None)
+        self._set_parent(id_, None)
+        self._parent.pop(id_)
+        # children move up to the next ancestor and wait for this one to return
+        children = self._children.pop(id_, ())
+        if children:
+            self._waiting[id_] = dict(children)
+
+        for child in children:
+            self._parent[child] = None
+            self._set_parent(child, self._resolve(child))
+            if self._references[child][-1] == id_:
+                self._orphans[child] = None
+
+    def parent(self, id_):
+        return self._parent.get(id_)
+
+    def children(self, id_):
+        return tuple(self._children.get(id_, ()))
+
+    def root(self, id_):
+        """ id of the thread root, which may not be present """
+        references = self._references.get(id_)
+        return references[0] if references else id_
+
+    def top(self, id_):
+        """ the furthest present ancestor, id_ itself if none are present """
+        for ref in self._references.get(id_, ()):
+            if ref in self._references:
+                return ref
+
+        return id_
+
+    def depth(self, id_):
+        return len(self._references.get(id_, ()))
+
+    def descendants(self, id_):
+        """ everything below id_ depth first """
+        stack = list(reversed(self.children(id_)))
+        while stack:
+            child = stack.pop()
+            yield child
+            stack.extend(reversed(self.children(child)))
+
+    def orphans(self):
+        return tuple(self._orphans)
+
+
 class AnnotationPool:
-    """ classic object container class """
+    """ classic object container class
+
+        indexes by id, normalized uri, tag, user, group, type, thread
+        root and parent, the secondary indexes are built on the first
+        query that needs them and are then kept up to date on add,
+        update and delete so a long lived pool (e.g. fed by a websocket)
+        can be queried without being rebuilt, each index maps a key to
+        an insertion ordered {id: anno} so removing one annotation is
+        O(its keys) """
+
+    _fields = ('tag', 'user', 'group', 'type')
+
     def __init__(self, annos=None, cls=HypothesisAnnotation):
-        self._index = {a.id:a for a in annos}
+        self._cls = cls
+        self._index = {}
+        self._indexed = False
+        if annos is not None:
+            self.add(annos)
 
-        dd = defaultdict(list)
-        for a in annos:
-            for ref in a.references:
-                try:
-                    parent = self._index[ref]
-                    dd[parent].append(a)
-                except KeyError as e:
-                    log.warning(f'dangling reply {a}')
+    def __len__(self):
+        return len(self._index)
 
-        self._replies_index = dict(dd)
-        self._replies = {}  # XXX see if we can remove this (used in getParents)
+    def __iter__(self):
+        yield from self._index.values()
 
-        if annos is None:
-            annos = []
+    def __contains__(self, id_annotation):
+        return id_annotation in self._index
 
-        self._annos = annos
+    @property
+    def _annos(self):
+        """ compatibility, the pooled annotations as a list, changes
+            to the list are not reflected in the pool, use add """
+        return list(self._index.values())
+
+    def _build_indexes(self):
+        """ construct the secondary indexes from _index """
+        if self._indexed:
+            return
+
+        self._uri_index = {}
+        self._field_indexes = {field: {} for field in self._fields}
+        self._thread_index = {}
+        self._replies_index = {}  # referenced id -> replies, parent need not exist
+        self._missing_parents = {}  # direct parent id -> replies waiting on it
+        for anno in self._index.values():
+            self._index_anno(anno)
+
+        self._indexed = True
+
+    @staticmethod
+    def _index_add(index, key, anno):
+        if key not in index:
+            index[key] = {}
+
+        index[key][anno.id] = anno
+
+    @staticmethod
+    def _index_remove(index, key, id_):
+        bucket = index[key]
+        bucket.pop(id_, None)
+        if not bucket:
+            index.pop(key)
+
+    @staticmethod
+    def _thread_root(anno):
+        return anno.references[0] if anno.references else anno.id
+
+    def _keys(self, anno):
+        yield 'user', anno.user
+        yield 'group', anno.group
+        yield 'type', anno.type
+        for tag in set(anno._tag_tuple):
+            yield 'tag', tag
+
+    def _index_anno(self, anno):
+        """ add anno to the secondary indexes, it must already be in _index """
+        self._index_add(self._uri_index, norm(anno.uri), anno)
+        for field, key in self._keys(anno):
+            self._index_add(self._field_indexes[field], key, anno)
+
+        self._index_add(self._thread_index, self._thread_root(anno), anno)
+        for ref in anno.references:
+            self._index_add(self._replies_index, ref, anno)
+
+        if anno.references and anno.references[-1] not in self._index:
+            self._index_add(self._missing_parents, anno.references[-1], anno)
+
+    def _insert(self, anno):
+        id_ = anno.id
+        self._index[id_] = anno
+        self._index_anno(anno)
+        # replies that arrived before this annotation are no longer orphans
+        self._missing_parents.pop(id_, None)
+
+    def _remove(self, id_):
+        anno = self._index.pop(id_)
+        self._index_remove(self._uri_index, norm(anno.uri), id_)
+        for field, key in self._keys(anno):
+            self._index_remove(self._field_indexes[field], key, id_)
+
+        self._index_remove(self._thread_index, self._thread_root(anno), id_)
+        for ref in anno.references:
+            self._index_remove(self._replies_index, ref, id_)
+
+        if anno.references and anno.references[-1] in self._missing_parents:
+            self._index_remove(self._missing_parents, anno.references[-1], id_)
+
+        # direct replies to this annotation are now orphans
+        for reply in self._replies_index.get(id_, {}).values():
+            if reply.references[-1] == id_:
+                self._index_add(self._missing_parents, id_, reply)
+
+        return anno
 
     def add(self, annos):
-        # TODO update self._index etc.
-        self._annos.extend(annos)
+        """ add annos, ones whose id is already present replace the old version """
+        index = self._index
         for a in annos:
-            # FIXME warn on collision?
-            self._index[a.id] = a
-            for ref in a.references:
-                parent = self._index[ref]
-                if parent not in self._replies_index:
-                    self._replies_index[parent] = []
+            if not isinstance(a, HypothesisAnnotation):
+                a = self._cls(a)
+
+            if self._indexed:
+                if a.id in index:
+                    self._remove(a.id)
 
-                self._replies_index[parent].append(a)
+                self._insert(a)
+            else:
+                # the replacement goes to the end like it does when indexed
+                index.pop(a.id, None)
+                index[a.id] = a
+
+    def update(self, anno):
+        self.add((anno,))
+
+    def delete(self, id_annotation):
+        """ remove and return the annotation, None if it was not present """
+        if id_annotation in self._index:
+            if self._indexed:
+                return self._remove(id_annotation)
+            else:
+                return self._index.pop(id_annotation)
 
     def replies(self, id_annotation):
-        a = self.byId(id_annotation)
-        if a in self._replies_index:
-            yield from self._replies_index[a]
+        """ all replies in the thread below id_annotation """
+        self._build_indexes()
+        if id_annotation in self._replies_index:
+            yield from self._replies_index[id_annotation].values()
 
     def byId(self, id_annotation):
         try:
@@ -1183,6 +2445,61 @@ class AnnotationPool:
         except KeyError as e:
             pass
 
+    def byUri(self, iri, prefix=False):
+        self._build_indexes()
+        norm_iri = norm(iri)
+        if not prefix:
+            yield from self._uri_index.get(norm_iri, {}).values()
+            return
+
+        for norm_uri, bucket in self._uri_index.items():
+            if norm_uri.startswith(norm_iri):
+                yield from bucket.values()
+
+    def byTags(self, *tags):
+        """ annotations that have all of tags """
+        self._build_indexes()
+        index = self._field_indexes['tag']
+        if not tags or any(tag not in index for tag in tags):
+            return []
+
+        buckets = sorted((index[tag] for tag in tags), key=len)
+        smallest, rest = buckets[0], buckets[1:]
+        return [a for id_, a in smallest.items() if all(id_ in b for b in rest)]
+
+    def _byField(self, field, key):
+        self._build_indexes()
+        return list(self._field_indexes[field].get(key, {}).values())
+
+    def byUser(self, user):
+        return self._byField('user', user)
+
+    def byGroup(self, group):
+        return self._byField('group', group)
+
+    def byType(self, type):
+        """ annotation, reply or pagenote """
+        return self._byField('type', type)
+
+    def thread(self, id_annotation):
+        """ every annotation in the thread containing id_annotation, root first """
+        self._build_indexes()
+        anno = self.byId(id_annotation)
+        root = id_annotation if anno is None else self._thread_root(anno)
+        bucket = self._thread_index.get(root, {})
+        if root in bucket:
+            yield bucket[root]
+
+        for id_, a in bucket.items():
+            if id_ != root:
+                yield a
+
+    def orphans(self):
+        """ replies whose direct parent is not in the pool """
+        self._build_indexes()
+        for bucket in self._missing_parents.values():
+            yield from bucket.values()
+
     def getParents(self, anno):
         # TODO consider auto retrieve on missing?
         if not anno.references:
@@ -1192,44 +2509,72 @@ class AnnotationPool:
             for parent_id in anno.references[::-1]:
                 parent = self.byId(parent_id)
                 if parent is not None:
-                    if parent.id not in self._replies:
-                        self._replies[parent.id] = set()
-                    self._replies[parent.id].add(self)
                     yield parent
 
 
 class iterclass(type):
+    def __init__(self, name, bases, namespace):
+        super().__init__(name, bases, namespace)
+        self._reset_indexes()
+
+    def _reset_indexes(self):
+        """ every class gets its own copy of the state derived from
+            objects, sibling subclasses must not write into each other """
+        self._tagIndex = {}  # tag -> {id: helper}
+        self._tagList = []  # sorted tags in _tagIndex for prefix queries
+        self._tagIndexLive = False  # once populated the index is kept up to date
+        self._uriIndex = {}  # normalized uri -> {id: helper}
+        self._uriList = []  # sorted keys of _uriIndex for prefix queries
+        self._uriIndexLive = False  # like _tagIndexLive
+        self._uri_tags = {}  # uri -> Counter of tags
+        self._uri_helpers = {}  # uri -> number of helpers
+        self._uri_namespaced = {}  # uri -> number of tags starting with prefix_ast
+        self._uris = set()
+        self._uriTagsLive = False  # like _tagIndexLive
+        self._threads = ThreadIndex()
+
     def __iter__(self):
         yield from self.objects.values()  # don't sort unless required
 
-    @property
-    def uri_tags(self):
-        """ a dictionary all (processed) tags for a given uri """
-        if not hasattr(self, '_uri_tags'):
-            uri_tags = defaultdict(set)
-            for obj in self.objects.values():  # do not use self here because the
-                # sorting in __iter__ above can be extremely slow
-                uri_tags[obj.uri].update(obj._tags)
+    def _populateUriTags(self):
+        if not self._uriTagsLive:
+            for obj in self.objects.values():
+                obj.populateUriTags()
 
-            self._uri_tags = dict(uri_tags)  # FIXME this will go stale
+            self._uriTagsLive = True
 
-        return self._uri_tags
+    @property
+    def uri_tags(self):
+        """ a dictionary of all (raw) tags for a given uri, the index
+            behind it is built on first use and kept up to date after
+            that, each call returns a fresh copy """
+        self._populateUriTags()
+        return {uri: set(tags) for uri, tags in self._uri_tags.items()}
 
     @property
     def uris(self):
-        """ uris that have been annotated with tags from this workflow """
-        if hasattr(self, 'namespace'):
-            return set(uri for uri, tags in self.uri_tags.items()
-                       if any(tag.startswith(self.prefix_ast)
-                              for tag in tags))
-        else:
-            return set(self.uri_tags)
+        """ uris that have been annotated with tags from this workflow
+            kept up to date, each call returns a fresh copy """
+        self._populateUriTags()
+        return set(self._uris)
 
     @property
     def orphans(self):
-        for id in self._orphanedReplies:
+        for id in self._threads.orphans():
             yield self.byId(id)
 
+    @property
+    def _replies(self):
+        """ compatibility, parent id -> set of reply helpers, derived
+            from _threads so changes to it are not kept """
+        return {parent: {self.objects[id_] for id_ in children if id_ in self.objects}
+                for parent, children in self._threads._children.items() if children}
+
+    @property
+    def _orphanedReplies(self):
+        """ compatibility, ids of replies whose parent is missing """
+        return set(self._threads.orphans())
+
 # HypothesisHelper class customized to deal with replacing
 #  exact, text, and tags based on its replies
 #  also for augmenting the annotation with distinct fields
@@ -1242,20 +2587,98 @@ class HypothesisHelper(metaclass=iterclass):  # a better HypothesisAnnotation
         XXX BIG WARNING HERE: you can only use ALL subclasses of HypothesisHelper
         XXX for a single group of annotations at a time otherwise things will go
         XXX completely haywire, transition to use AnnotationPool if at all possible
+        XXX or use HelperRegistry to get helper classes bound to one set of annos
     """
+    _registry = None  # set on classes created by HelperRegistry.bind
     objects = {}  # TODO updates # NOTE: all child classes need their own copy of objects
-    _tagIndex = {}
-    _replies = {}
+    # the tag, uri and thread indexes are per class, see iterclass._reset_indexes
+    _indexed_tags = frozenset()
+    _indexed_uri = None
+    _indexed_uri_tags = None
     reprReplies = True
     _embedded = False
     _done_loading = False
+    _bulk_loading = False
     _annos = {}
-    _orphanedReplies = set()
+    # iterclass provides these on the class, these cover self._replies
+    _replies = property(lambda self: type(self)._replies)
+    _orphanedReplies = property(lambda self: type(self)._orphanedReplies)
 
     @classmethod
     def addAnno(cls, anno):
         return cls(anno, [anno])
 
+    @classmethod
+    def fromAnnos(cls, annos):
+        """ build helpers for all of annos at once, much faster than
+            calling cls(anno, annos) for each anno because the id, uri
+            and reply indexes are built in one pass over the batch
+            before any helper is initialized instead of being updated
+            one helper at a time, so nothing is constructed recursively,
+            __init__ runs parents first so subclasses can rely on the
+            state of their parent the same way they can per call
+
+            returns the helpers in the order of the annos they were
+            built from, for bound classes that is the registry's annos """
+        if cls._registry is not None:
+            if annos is not cls._registry.annos:
+                for anno in annos:
+                    current = cls._registry.annos.byId(anno.id)
+                    if current is None or anno.updated > current.updated:
+                        cls._registry.annos.upsert(anno)
+
+            annos = cls._registry.annos
+        else:
+            if not hasattr(cls, '_annos_list'):
+                cls._annos_list = annos
+            elif cls._annos_list is not annos:
+                known = set(a.id for a in cls._annos_list)
+                cls._annos_list.extend(a for a in annos if a.id not in known)
+                annos = cls._annos_list
+
+            cls._annos.update({a.id:a for a in annos})
+
+        objects = cls.objects
+        cls._done_loading = False
+        helpers, new_objs, new_annos = [], [], []
+        for anno in annos:
+            obj = objects.get(anno.id)
+            if obj is None:
+                obj = object.__new__(cls)
+                obj.id = anno.id
+                objects[anno.id] = obj
+                new_objs.append(obj)
+                new_annos.append(anno)
+            # existing helpers already see new versions through _anno
+
+            helpers.append(obj)
+
+        # existing helpers are no-ops here unless their annotation changed
+        cls._threads.extend((anno.id, anno.references) for anno in annos)
+        if cls._uriIndexLive:
+            cls._populateUris(helpers)
+
+        # references are root first so a parent always has fewer than its replies
+        order = sorted(range(len(new_annos)), key=lambda i: len(new_annos[i].references))
+        cls._bulk_loading = True  # the indexes are done, skip the parent walk
+        try:
+            for i in order:
+                new_objs[i].__init__(new_annos[i], annos)
+        finally:
+            del cls._bulk_loading
+
+        cls._done_loading = True
+        if cls._uriTagsLive:
+            for obj in helpers:
+                obj.populateUriTags()
+
+        if cls._tagIndexLive:
+            # replies may have changed the tags of existing helpers too
+            for obj in helpers:
+                obj.populateTags()
+
+        return helpers
+
     @classmethod
     def byId(cls, id_):
         try:
@@ -1265,50 +2688,213 @@ class HypothesisHelper(metaclass=iterclass):  # a better HypothesisAnnotation
                    'populated with annotations yet!')
             raise Warning(msg) from e
 
+    @classmethod
+    def _populateTagIndex(cls):
+        log.debug('populating tags')
+        for obj in cls.objects.values():
+            obj.populateTags()
+
+        cls._tagIndexLive = True
+
     @classmethod
     def byTags(cls, *tags):
         if cls._done_loading:  # TODO maybe better than done loading is 'consistent'?
-            if not cls._tagIndex:
-                log.debug('populating tags')
-                # FIXME extremely inefficient on update
-                # and we want this to update as replies appear
-                # not all at once...
-                # FIXME this does not update if new annos are added on the fly!
-                [obj.populateTags() for obj in cls.objects.values()]
-
-            return sorted(set.intersection(*(cls._tagIndex[tag] for tag in tags)))
+            if not cls._tagIndexLive:
+                # built once, after that create, update and delete keep it current
+                cls._populateTagIndex()
+
+            postings = sorted((cls._tagIndex.get(tag, {}) for tag in tags), key=len)
+            if not postings:
+                return []
+
+            smallest, rest = postings[0], postings[1:]
+            return sorted(obj for id_, obj in smallest.items()
+                          if all(id_ in p for p in rest))
         else:
             log.warning('attempted to search by tags before done loading')
 
+    @classmethod
+    def tagsWithPrefix(cls, prefix):
+        """ all indexed tags that start with prefix, e.g. a workflow namespace """
+        if not cls._tagIndexLive:
+            cls._populateTagIndex()
+
+        tags = cls._tagList
+        out = []
+        for tag in tags[bisect_left(tags, prefix):]:
+            if not tag.startswith(prefix):
+                break
+
+            out.append(tag)
+
+        return out
+
+    @classmethod
+    def byTagPrefix(cls, prefix):
+        """ helpers with at least one tag that starts with prefix """
+        found = {}
+        for tag in cls.tagsWithPrefix(prefix):
+            found.update(cls._tagIndex[tag])
+
+        return sorted(found.values())
+
     def populateTags(self):
-        # FIXME need a way to evict old annos on update
-        for tag in self.tags:
+        """ (re)index the current tags of this helper """
+        tags = set(self.tags)
+        old = self._indexed_tags
+        for tag in old - tags:
+            self._removeFromTag(tag)
+
+        for tag in tags - old:
             if tag not in self._tagIndex:
-                self._tagIndex[tag] = {self}
-            else:
-                self._tagIndex[tag].add(self)
+                self._tagIndex[tag] = {}
+                insort(self._tagList, tag)
+
+            self._tagIndex[tag][self.id] = self
 
-            tset = self._tagIndex[tag]
-            if tset not in self._remove_self_from:
-                self._remove_self_from.append((tag, tset))
+        self._indexed_tags = frozenset(tags)
+
+    def _removeFromTag(self, tag):
+        posting = self._tagIndex[tag]
+        posting.pop(self.id, None)
+        if not posting:  # remove unused tags from the index
+            self._tagIndex.pop(tag)
+            del self._tagList[bisect_left(self._tagList, tag)]
 
     def depopulateTags(self):
         """ remove object from the tag index on delete """
-        log.debug(f'Removing {self._repr} from {len(self._remove_self_from)} tag sets')
-        for tag, tset in self._remove_self_from:
-            tset.remove(self)  # this should never error if everything is working correctly
-            if not tset:  # remove unused tags from the index in depopulate
-                self._tagIndex.pop(tag)
+        log.debug(f'Removing {self._repr} from {len(self._indexed_tags)} tag sets')
+        for tag in self._indexed_tags:
+            self._removeFromTag(tag)
+
+        self._indexed_tags = frozenset()
 
     @classmethod
     def byIri(cls, iri, prefix=False):
+        if not cls._uriIndexLive:
+            # built once, after that create, update and delete keep it current
+            cls._populateUris(cls.objects.values())
+            cls._uriIndexLive = True
+
         norm_iri = norm(iri)
-        for obj in cls.objects.values():
-            norm_ouri = norm(obj.uri)
-            if norm_ouri == norm_iri:
-                yield obj
-            elif prefix and norm_ouri.startswith(norm_iri):
-                yield obj
+        if not prefix:
+            yield from tuple(cls._uriIndex.get(norm_iri, {}).values())
+            return
+
+        uris = cls._uriList
+        # copy the matches so helpers created while iterating don't break us
+        for norm_ouri in uris[bisect_left(uris, norm_iri):]:
+            if not norm_ouri.startswith(norm_iri):
+                break
+
+            yield from tuple(cls._uriIndex[norm_ouri].values())
+
+    def populateUri(self):
+        """ (re)index the normalized uri of this helper """
+        norm_uri = norm(self.uri)
+        if norm_uri == self._indexed_uri:
+            return
+
+        self.depopulateUri()
+        if norm_uri not in self._uriIndex:
+            self._uriIndex[norm_uri] = {}
+            insort(self._uriList, norm_uri)
+
+        self._uriIndex[norm_uri][self.id] = self
+        self._indexed_uri = norm_uri
+
+    @classmethod
+    def _populateUris(cls, helpers):
+        """ populateUri for many helpers, the sorted uri list is rebuilt
+            once at the end instead of an insort per new uri """
+        index = cls._uriIndex
+        new_uris = False
+        for obj in helpers:
+            norm_uri = norm(obj.uri)
+            if norm_uri == obj._indexed_uri:
+                continue
+
+            if obj._indexed_uri is not None:
+                obj.depopulateUri()
+
+            if norm_uri not in index:
+                index[norm_uri] = {}
+                new_uris = True
+
+            index[norm_uri][obj.id] = obj
+            obj._indexed_uri = norm_uri
+
+        if new_uris:
+            cls._uriList = sorted(index)
+
+    def _namespaced(self, tags):
+        if hasattr(self, 'namespace'):
+            return sum(tag.startswith(self.prefix_ast) for tag in tags)
+
+    def populateUriTags(self):
+        """ (re)count the tags of this helper in uri_tags and uris """
+        uri, tags = self.uri, tuple(set(self._tags))  # _tags since tags can make many calls
+        if (uri, tags) == self._indexed_uri_tags:
+            return
+
+        self.depopulateUriTags()
+        if uri not in self._uri_tags:
+            self._uri_tags[uri] = Counter()
+            self._uri_helpers[uri] = 0
+            self._uri_namespaced[uri] = 0
+
+        counts = self._uri_tags[uri]
+        for tag in tags:
+            counts[tag] += 1
+
+        self._uri_helpers[uri] += 1
+        namespaced = self._namespaced(tags)
+        if namespaced is None:
+            self._uris.add(uri)
+        elif namespaced:
+            self._uri_namespaced[uri] += namespaced
+            self._uris.add(uri)
+
+        self._indexed_uri_tags = uri, tags
+
+    def depopulateUriTags(self):
+        if self._indexed_uri_tags is None:
+            return
+
+        uri, tags = self._indexed_uri_tags
+        counts = self._uri_tags[uri]
+        for tag in tags:
+            counts[tag] -= 1
+            if not counts[tag]:
+                del counts[tag]
+
+        self._uri_helpers[uri] -= 1
+        namespaced = self._namespaced(tags)
+        if namespaced:
+            self._uri_namespaced[uri] -= namespaced
+            if not self._uri_namespaced[uri]:
+                self._uris.discard(uri)
+
+        if not self._uri_helpers[uri]:
+            self._uri_tags.pop(uri)
+            self._uri_helpers.pop(uri)
+            self._uri_namespaced.pop(uri)
+            self._uris.discard(uri)
+
+        self._indexed_uri_tags = None
+
+    def depopulateUri(self):
+        norm_uri = self._indexed_uri
+        if norm_uri is None:
+            return
+
+        posting = self._uriIndex[norm_uri]
+        posting.pop(self.id, None)
+        if not posting:
+            self._uriIndex.pop(norm_uri)
+            del self._uriList[bisect_left(self._uriList, norm_uri)]
+
+        self._indexed_uri = None
 
     @classmethod
     def reset(cls, reset_annos_dict=False):
@@ -1320,11 +2906,15 @@ class HypothesisHelper(metaclass=iterclass):  # a better HypothesisAnnotation
             representation of annotation groups
 
             XXX WARNING this also resets ALL PARENT CLASSES
+            unless cls is bound to a HelperRegistry
         """
 
+        if cls._registry is not None:
+            cls._registry._reset_class(cls)
+            return
+
         cls.objects = {}
-        cls._tagIndex = {}
-        cls._replies = {}
+        cls._reset_indexes()
         cls.reprReplies = True
         cls._embedded = False
         cls._done_loading = False
@@ -1366,6 +2956,9 @@ class HypothesisHelper(metaclass=iterclass):  # a better HypothesisAnnotation
                             pass
 
     def __new__(cls, anno, annos):
+        if cls._registry is not None:
+            return cls._registry._new(cls, anno)
+
         if not hasattr(cls, '_annos_list'):
             cls._annos_list = annos
         elif cls._annos_list is not annos:  # FIXME STOP implement a real annos (SyncList) class FFS
@@ -1398,6 +2991,9 @@ class HypothesisHelper(metaclass=iterclass):  # a better HypothesisAnnotation
             if anno.id in cls.objects:
                 obj = cls.objects.pop(anno.id)  # this is what we were missing
                 obj.depopulateTags()
+                obj.depopulateUri()
+                obj.depopulateUriTags()
+                cls._threads.remove(anno.id)
                 #print('Found the sneek.', anno.id)
             return  # our job here is done
 
@@ -1424,28 +3020,31 @@ class HypothesisHelper(metaclass=iterclass):  # a better HypothesisAnnotation
             return super().__new__(cls)
 
     def __init__(self, anno, annos):
+        if self._registry is not None:
+            annos = self._registry.annos
+
         self._recursion_blocker = False
         self.annos = annos
         self.id = anno.id  # hardset this to prevent shenanigans
         self.objects[self.id] = self
-        self._remove_self_from = []
-
-        if self._tagIndex:
-            # if tagIndex is not empty and we make it to __init__
-            # then this anno helper has not been put into the tag index
-            # FIXME stale annos in the tag index are likely an issue
-            self.populateTags()
-
-        if hasattr(self, '_uri_tags'):  # keep uri_tags in sync
-            if anno.uri not in self._uri_tags:
-                self._uri_tags[self.uri] = set()
-
-            self._uri_tags[self.uri].update(self._tags)  # use _tags since tags can make many calls
 
         #if self.objects[self.id] is None:
             #printD('WAT', self.id)
         self.hasAstParent = False
-        self.parent  # populate self._replies before the recursive call
+        if not self._bulk_loading:  # fromAnnos has already indexed the whole batch
+            self._threads.add(self.id, anno.references)
+            if self._uriIndexLive:
+                self.populateUri()
+
+            if self._uriTagsLive:
+                self.populateUriTags()
+
+            parent = self.parent  # construct missing parents before the recursive call
+            if self._tagIndexLive:
+                self.populateTags()  # new or updated
+                if parent is not None:
+                    parent.populateTags()  # replies can change the tags of their parent
+
         if len(self.objects) == len(annos):
             self.__class__._done_loading = True
 
@@ -1511,10 +3110,8 @@ class HypothesisHelper(metaclass=iterclass):  # a better HypothesisAnnotation
                 #self.objects[id_] = None  # don't do this it breaks the type on objects
                 #print('Problem in', self.shareLink)  # must come after self.objects[id_] = None else RecursionError
                 if not self._recursion_blocker:
-                    if self._type == 'reply':
-                        #print('Orphaned reply', self.shareLink, f"{self.classn}.byId('{self.id}')")
-                        self._orphanedReplies.add(self.id)
-                    else:
+                    # orphaned replies are tracked by _threads
+                    if self._type != 'reply':
                         logd.warning(f"Problem in {self.shareLink} {self.classn}.byId('{self.id}')")
                 return None
             else:
@@ -1522,17 +3119,19 @@ class HypothesisHelper(metaclass=iterclass):  # a better HypothesisAnnotation
                 return h
 
     @property
-    def shareLink(self):  # FIXME just look it up?!
+    def shareLink(self):
+        # walk to the top of the thread, each parent is a lookup
         self._recursion_blocker = True
-        if self.parent is not None:
-            link = self.parent.shareLink
-            # call link before unset recursion to prevent cases
-            # where an intermediate parent was deleted
-            self._recursion_blocker = False
-            return link
-        else:
+        try:
+            top = self
+            parent = self.parent
+            while parent is not None:
+                top = parent
+                parent = parent.parent
+        finally:
             self._recursion_blocker = False
-            return shareLinkFromId(self.id)
+
+        return shareLinkFromId(top.id)
 
     @property
     def htmlLink(self):
@@ -1540,31 +3139,28 @@ class HypothesisHelper(metaclass=iterclass):  # a better HypothesisAnnotation
 
     @property
     def parent(self):
-        if not self.references:
+        references = self.references
+        if not references:
             return None
-        else:
-            for parent_id in self.references[::-1]:  # go backward to get the direct parent first, slower for shareLink but ok
-                parent = self.getObjectById(parent_id)
-                if parent is not None:
-                    if parent.id not in self._replies:
-                        self._replies[parent.id] = set()
-                    self._replies[parent.id].add(self)
-                    return parent
-                else:
-                    #printD(f"Parent gone for {self.__class__.__name__}.byId('{self.id}'}")
-                    pass
+
+        parent_id = self._threads.parent(self.id)
+        if parent_id == references[-1]:
+            return self.objects[parent_id]
+
+        # the direct parent has no helper yet, make one if we have the annotation
+        for parent_id in references[::-1]:  # go backward to get the direct parent first
+            parent = self.getObjectById(parent_id)
+            if parent is not None:
+                return parent
 
     @property
     def replies(self):
-        # for the record, the naieve implementation of this
-        # looping over annos everytime is 3 orders of magnitude slower
-        if self._done_loading:
-            if self.id not in self._replies:
-                self._replies[self.id] = set()
-            return self._replies[self.id]  # we use self.id here instead of self to avoid recursion on __eq__
-        else:
-            log.warning('Not done loading annos, you will be missing references!')
-            return set()
+        return set(self.objects[id_] for id_ in self._threads.children(self.id))
+
+    def descendants(self):
+        """ every reply in the thread below this one, depth first """
+        for id_ in self._threads.descendants(self.id):
+            yield self.objects[id_]
 
     def __eq__(self, other):
         return (type(self) == type(other) and
@@ -1617,3 +3213,85 @@ class HypothesisHelper(metaclass=iterclass):  # a better HypothesisAnnotation
                 f'{replies_text}'
                 f'{format__repr__for_children}'
                 f'\n{t}{"":_<20}')
+
+
+class HelperRegistry:
+    """ one set of annotations and the helper state that goes with it
+
+        HypothesisHelper keeps objects, the tag index, replies etc. on
+        the class so only one set of annotations can be used at a time,
+        bind returns a subclass with its own copy of that state which
+        shares this registry's annos, so helpers for different groups
+        can be used side by side or in different threads and
+        processes without calling reset, annos is the source of truth
+        for the bound helpers, pass it to them or add to it with upsert
+
+        registry = HelperRegistry(Memoizer(group=group).get_annos())
+        Helper = registry.bind(HypothesisHelper)
+        helpers = [Helper(a, registry.annos) for a in registry.annos]
+    """
+
+    def __init__(self, annos=None):
+        self.annos = annos if isinstance(annos, AnnoList) else AnnoList(annos or ())
+        self._bound = {}
+
+    def __getitem__(self, helper):
+        return self._bound[helper]
+
+    def bind(self, helper):
+        """ the subclass of helper bound to this registry, one per helper """
+        if helper._registry is self:
+            return helper
+
+        if helper not in self._bound:
+            namespace = {'__module__': helper.__module__,
+                         '__qualname__': helper.__qualname__,
+                         '__doc__': helper.__doc__,
+                         '_registry': self,
+                         # live id -> anno view so _anno and getAnnoById stay O(1)
+                         '_annos': self.annos._index,
+                         '_annos_list': self.annos}
+            self._bound[helper] = type(helper)(helper.__name__, (helper,), namespace)
+            self._reset_class(self._bound[helper])
+
+        return self._bound[helper]
+
+    def _reset_class(self, cls):
+        cls.objects = {}
+        cls._reset_indexes()
+        cls.reprReplies = True
+        cls._embedded = False
+        cls._done_loading = False
+
+    def reset(self):
+        """ drop the state of every bound helper but keep annos """
+        for cls in self._bound.values():
+            self._reset_class(cls)
+
+    def upsert(self, anno):
+        self.annos.upsert(anno)
+
+    def _new(self, cls, anno):
+        """ HypothesisHelper.__new__ for bound classes, no set diffs of
+            the annos list, only the one annotation is synced """
+        if hasattr(anno, 'deleted'):
+            self.annos.delete(anno.id)
+            if anno.id in cls.objects:
+                obj = cls.objects.pop(anno.id)
+                obj.depopulateTags()
+                obj.depopulateUri()
+                obj.depopulateUriTags()
+                cls._threads.remove(anno.id)
+
+            return None
+
+        current = self.annos.byId(anno.id)
+        if current is None or anno.updated > current.updated:
+            self.annos.upsert(anno)
+
+        try:
+            obj = cls.objects[anno.id]
+        except KeyError:
+            return object.__new__(cls)
+
+        return obj  # __init__ runs again and picks up the new version
@@ -0,0 +1,109 @@
+""" retry and rate limit policies shared by the api clients """
+
+import random
+import threading
+from time import monotonic, sleep
+from email.utils import parsedate_to_datetime
+from datetime import datetime, timezone
+import requests
+
+__all__ = ['RetryPolicy', 'TokenBucket']
+
+
+class RetryPolicy:
+    """ exponential backoff with full jitter
+
+        responses with a status in statuses and the exceptions in
+        exceptions are retried up to retries times, a Retry-After
+        header on the response takes precedence over the backoff,
+        requests that are not idempotent (POST) are only retried on
+        statuses where the server promises it did nothing """
+
+    statuses = (429, 500, 502, 503, 504)
+    not_processed = (429, 503)
+    exceptions = (requests.exceptions.ConnectionError,  # includes SSLError
+                  requests.exceptions.Timeout)
+
+    def __init__(self, retries=5, backoff=0.5, max_backoff=60, jitter=True,
+                 statuses=None, exceptions=None):
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.jitter = jitter
+        if statuses is not None:
+            self.statuses = tuple(statuses)
+        if exceptions is not None:
+            self.exceptions = tuple(exceptions)
+
+    def replace(self, **kwargs):
+        """ a copy of this policy with some values changed """
+        new = self.__class__.__new__(self.__class__)
+        new.__dict__.update(self.__dict__)
+        new.__dict__.update(kwargs)
+        return new
+
+    def retry_status(self, status_code, attempt, idempotent=True):
+        if attempt >= self.retries:
+            return False
+
+        statuses = self.statuses if idempotent else self.not_processed
+        return status_code in statuses
+
+    def retry_exception(self, exception, attempt, idempotent=True):
+        return (idempotent and
+                attempt < self.retries and
+                isinstance(exception, self.exceptions))
+
+    def delay(self, attempt, retry_after=None):
+        """ seconds to wait before the next attempt """
+        if retry_after is not None:
+            seconds = self.parse_retry_after(retry_after)
+            if seconds is not None:
+                return seconds
+
+        cap = min(self.max_backoff, self.backoff * 2 ** attempt)
+        return random.uniform(0, cap) if self.jitter else cap
+
+    @staticmethod
+    def parse_retry_after(value):
+        """ Retry-After is either seconds or an http date """
+        try:
+            return max(0., float(value))
+        except ValueError:
+            pass
+
+        try:
+            when = parsedate_to_datetime(value)
+        except (TypeError, ValueError):
+            return None
+
+        if when.tzinfo is None:
+            when = when.replace(tzinfo=timezone.utc)
+
+        return max(0., (when - datetime.now(timezone.utc)).total_seconds())
+
+
+class TokenBucket:
+    """ client side rate limit of rate requests per second
+        with bursts of up to burst requests, thread safe """
+
+    def __init__(self, rate, burst=None):
+        self.rate = rate
+        self.burst = max(1, rate) if burst is None else burst
+        self._tokens = self.burst
+        self._last = monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self, tokens=1):
+        """ take tokens now and return how long to wait before using them """
+        with self._lock:
+            now = monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._last) * self.rate)
+            self._last = now
+            self._tokens -= tokens  # may go negative, later callers wait longer
+            return 0. if self._tokens >= 0 else -self._tokens / self.rate
+
+    def acquire(self, tokens=1):
+        wait = self.reserve(tokens)
+        if wait:
+            sleep(wait)
@@ -0,0 +1,229 @@
+""" sqlite backed annotation storage
+
+    SqliteMemoizer is a drop in replacement for Memoizer that keeps rows
+    in a local sqlite database instead of a single json file, point
+    updates and deletes are indexed writes and multiple processes can
+    read while another writes because the database runs in wal mode
+"""
+
+import json
+import sqlite3
+import threading
+from itertools import groupby
+from .hypothesis import (Memoizer, HypothesisAnnotation, JEncode,
+                         group_to_memfile, api_token, username, group)
+from .utils import log
+
+__all__ = ['SqliteMemoizer']
+
+_schema = (
+    '''CREATE TABLE IF NOT EXISTS annotations (
+           id TEXT PRIMARY KEY,
+           updated TEXT NOT NULL,
+           groupid TEXT NOT NULL,
+           uri TEXT,
+           row TEXT NOT NULL)''',
+    'CREATE INDEX IF NOT EXISTS annotations_updated ON annotations (updated)',
+    'CREATE INDEX IF NOT EXISTS annotations_groupid ON annotations (groupid)',
+    'CREATE INDEX IF NOT EXISTS annotations_uri ON annotations (uri)',
+    '''CREATE TABLE IF NOT EXISTS tags (
+           tag TEXT NOT NULL,
+           id TEXT NOT NULL REFERENCES annotations (id) ON DELETE CASCADE,
+           PRIMARY KEY (tag, id)) WITHOUT ROWID''',
+    'CREATE INDEX IF NOT EXISTS tags_id ON tags (id)',
+)
+
+
+class SqliteMemoizer(Memoizer):
+    """ Memoizer that stores annotations in sqlite indexed by
+        id, updated, group, uri and tag """
+
+    def __init__(self, memoization_file=None,
+                 api_token=api_token,
+                 username=username,
+                 group=group,
+                 timeout=30,
+                 **kwargs):
+        if memoization_file is None:
+            memoization_file = group_to_memfile(group).with_suffix('.sqlite')
+
+        super().__init__(memoization_file=memoization_file,
+                         api_token=api_token,
+                         username=username,
+                         group=group,
+                         **kwargs)
+        self.timeout = timeout
+        self._local = threading.local()  # sqlite connections are per thread
+
+    @property
+    def _conn(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            self._touch_private(self.memoization_file)
+            conn = sqlite3.connect(str(self.memoization_file),
+                                   timeout=self.timeout,
+                                   isolation_level=None)  # we manage transactions
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            conn.execute('PRAGMA foreign_keys=ON')
+            for statement in _schema:
+                conn.execute(statement)
+
+            self._local.conn = conn
+
+        return conn
+
+    def close(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+        super().close()
+
+    def _transaction(self, function, *args):
+        conn = self._conn
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            out = function(conn, *args)
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+        else:
+            conn.execute('COMMIT')
+            return out
+
+    @staticmethod
+    def _upsert(conn, annos):
+        annos = [a if isinstance(a, HypothesisAnnotation) else HypothesisAnnotation(a)
+                 for a in annos]
+        conn.executemany('DELETE FROM tags WHERE id = ?', ((a.id,) for a in annos))
+        conn.executemany('INSERT OR REPLACE INTO annotations '
+                         '(id, updated, groupid, uri, row) VALUES (?, ?, ?, ?, ?)',
+                         ((a.id, a.updated, a.group, a.uri,
+                           json.dumps(a._row, cls=JEncode))
+                          for a in annos))
+        conn.executemany('INSERT OR IGNORE INTO tags (tag, id) VALUES (?, ?)',
+                         ((tag, a.id) for a in annos for tag in a.tags))
+
+    @staticmethod
+    def _delete(conn, ids):
+        conn.executemany('DELETE FROM annotations WHERE id = ?', ((id,) for id in ids))
+
+    def _select(self, where='', args=()):
+        cursor = self._conn.execute('SELECT row FROM annotations '
+                                    f'{where} ORDER BY updated, id', args)
+        for row, in cursor:
+            yield HypothesisAnnotation(json.loads(row))
+
+    # Memoizer surface
+
+    def yield_annos_from_file(self, file=None):
+        if file is not None and file != self.memoization_file:
+            # lock folder batches and the like are still json
+            return (yield from super().yield_annos_from_file(file))
+
+        first = True
+        last = None
+        for anno in self._select():
+            if first:
+                self.check_group((anno,))
+                first = False
+
+            last = anno
+            yield anno
+
+        return None if last is None else last.updated
+
+    def memoize_annos(self, annos):
+        """ replace the contents of the database with annos """
+        log.info(f'annos updated, memoizing new version with, {len(annos)} members')
+
+        def replace(conn):
+            conn.execute('DELETE FROM annotations')
+            self._upsert(conn, annos)
+
+        self._transaction(replace)
+
+    def memoize_anno(self, anno, annos, action='update'):
+        self._transaction(self._upsert, (anno,))
+
+    def memoize_delete(self, id_, annos):
+        self._transaction(self._delete, (id_,))
+
+    def memoize_changes(self, changes, annos):
+        """ apply many (action, anno or id) changes in one transaction """
+        def apply(conn):
+            for delete, run in groupby(changes, lambda c: c[0] == 'delete'):
+                payloads = [payload for action, payload in run]
+                if delete:
+                    self._delete(conn, payloads)
+                else:
+                    self._upsert(conn, payloads)
+
+        self._transaction(apply)
+
+    def compact(self, annos, background=True):
+        """ sqlite takes care of this for us """
+
+    def _wait_for_compaction(self):
+        pass
+
+    def _last_updated(self):
+        updated, = self._conn.execute('SELECT max(updated) FROM annotations').fetchone()
+        return updated
+
+    def _stream_annos_from_api(self,
+                               annos,
+                               search_after,
+                               stop_at=None,
+                               batch_size=2000,
+                               helpers=tuple()):
+        # another process may already have pulled some of what we need
+        db_updated = self._last_updated()
+        fetch_after = (db_updated
+                       if search_after is None or
+                       db_updated is not None and db_updated > search_after else
+                       search_after)
+
+        gen = self.yield_from_api(search_after=fetch_after, stop_at=stop_at)
+        while True:
+            batch = [row for i, row in zip(range(batch_size), gen)]
+            if not batch:
+                break
+
+            self._transaction(self._upsert, batch)
+
+        if search_after is None:
+            new_annos = list(self._select())
+        else:
+            new_annos = list(self._select('WHERE updated > ?', (search_after,)))
+
+        if stop_at is not None:
+            new_annos = [a for a in new_annos if a.updated <= stop_at]
+
+        if new_annos:
+            self.check_group(new_annos)
+            self._merge_new_annos(annos, new_annos)
+
+        return new_annos
+
+    # indexed lookups
+
+    def byId(self, id_):
+        for anno in self._select('WHERE id = ?', (id_,)):
+            return anno
+
+    def byTags(self, *tags):
+        """ annotations that have all of tags """
+        if not tags:
+            return []
+
+        where = ' AND '.join('id IN (SELECT id FROM tags WHERE tag = ?)' for _ in tags)
+        return list(self._select('WHERE ' + where, tags))
+
+    def byUri(self, uri):
+        return list(self._select('WHERE uri = ?', (uri,)))
+
+    def byGroup(self, group):
+        return list(self._select('WHERE groupid = ?', (group,)))
@@ -7,8 +7,11 @@ import ssl
 import uuid
 import json
 from os import environ
+from time import perf_counter
+from collections import OrderedDict
 from socket import socketpair
 from threading import Thread
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
 
 import certifi
 import websockets
@@ -29,6 +32,273 @@ class Handler:
             print('NOT ANNOTATION')
             print(message)
 
+    def close(self):
+        """ let handlers finish anything they deferred, e.g. memoization """
+        for fh in self.filter_handlers:
+            fh.close()
+
+
+class DispatchMetrics:
+    """ counters for a Dispatcher, blocked_seconds is the total time
+        the receive loop spent waiting on a full queue """
+
+    def __init__(self):
+        self.received = 0
+        self.processed = 0
+        self.errors = 0
+        self.duplicates = 0
+        self.backfilled = 0
+        self.queued = 0
+        self.max_queued = 0
+        self.blocked = 0
+        self.blocked_seconds = 0
+        self.handler_calls = {}
+        self.handler_seconds = {}
+
+    def as_dict(self):
+        return dict(vars(self))
+
+
+class Backfill:
+    """ exactly once delivery across websocket reconnects
+
+        remembers the newest updated it has let through and the updated
+        of the max_seen annotations it saw most recently, after a reconnect
+        the rest api is searched from that point through fetcher (an
+        AnnoFetcher) and anything that arrives twice is dropped by
+        (id, updated), a backfill forgets everything it cannot return
+
+        deletes that happen while disconnected cannot be recovered this
+        way because the search api does not return deleted annotations,
+        and backfilled rows are not matched against the server prefilter
+        so filter handlers still have to filter them """
+
+    def __init__(self, fetcher, last_updated=None, batch_size=200, max_seen=100000):
+        self.fetcher = fetcher
+        self.last_updated = last_updated
+        self.batch_size = batch_size
+        self.max_seen = max_seen
+        self._updated = OrderedDict()  # id -> newest updated let through, least recent first
+
+    def accept(self, message):
+        """ False if message is an update we have already seen """
+        try:
+            row = message['payload'][0]
+            id_, updated = row['id'], row['updated']
+        except (KeyError, IndexError, TypeError):
+            return True  # deletes and anything else are idempotent
+
+        seen = self._updated.get(id_)
+        if seen is not None and seen >= updated:
+            return False
+
+        self._updated[id_] = updated
+        self._updated.move_to_end(id_)
+        if len(self._updated) > self.max_seen:
+            self._updated.popitem(last=False)
+
+        if self.last_updated is None or updated > self.last_updated:
+            self.last_updated = updated
+
+        return True
+
+    @staticmethod
+    def notification(row):
+        action = 'create' if row.get('created') == row['updated'] else 'update'
+        return {'type': 'annotation-notification',
+                'options': {'action': action},
+                'payload': [row]}
+
+    async def fill(self, dispatcher):
+        """ queue everything updated since last_updated, oldest first """
+        loop = asyncio.get_event_loop()  # the running loop, get_running_loop is 3.7+
+        search_after = self.last_updated
+        # the search only returns rows updated after search_after
+        for id_, updated in list(self._updated.items()):
+            if search_after is not None and updated <= search_after:
+                del self._updated[id_]
+
+        gen = self.fetcher.yield_from_api(search_after=search_after)
+
+        def next_batch():
+            return [row for _, row in zip(range(self.batch_size), gen)]
+
+        while True:
+            batch = await loop.run_in_executor(None, next_batch)
+            if not batch:
+                break
+
+            for row in batch:
+                if await dispatcher.put_message(self.notification(row)):
+                    dispatcher.metrics.backfilled += 1
+
+
+class Dispatcher:
+    """ decouple receiving messages from running filter handlers
+
+        messages are routed to one of lanes bounded queues by annotation
+        id, each lane runs every handler on one message at a time so
+        events for the same annotation are always processed in order,
+        a full lane makes put wait which pushes back on the receive loop,
+        the default single lane keeps the order they arrived in across
+        annotations, with more lanes only the per annotation order holds
+
+        each filter handler picks where it runs with its concurrency
+        attribute, 'inline' on the event loop, 'thread' in a thread pool
+        or 'process' in a process pool, process handlers must be picklable
+        and any state they change stays in the worker process """
+
+    def __init__(self, handler, maxsize=1000, lanes=1,
+                 thread_workers=None, process_workers=None, backfill=None):
+        self.handler = handler
+        self.backfill = backfill
+        self.lanes = lanes
+        self.maxsize = maxsize
+        self.thread_workers = thread_workers
+        self.process_workers = process_workers
+        self.metrics = DispatchMetrics()
+        self._queues = None
+        self._tasks = None
+        self._executors = {}
+
+    async def start(self):
+        if self._queues is None:
+            lane_size = max(1, -(-self.maxsize // self.lanes))
+            self._queues = [asyncio.Queue(lane_size) for _ in range(self.lanes)]
+            self._tasks = [asyncio.ensure_future(self._consume(q)) for q in self._queues]
+
+    def _lane(self, message):
+        try:
+            id_ = message['payload'][0]['id']
+        except (KeyError, IndexError, TypeError):
+            return self._queues[0]
+
+        return self._queues[hash(id_) % self.lanes]
+
+    async def put(self, response):
+        """ parse a raw websocket response and queue it """
+        try:
+            message = json.loads(response)
+        except ValueError:
+            log.warning(f'could not parse message {response!r}')
+            return
+
+        if message:
+            await self.put_message(message)
+
+    async def put_message(self, message):
+        """ queue a parsed message, False if it was a duplicate """
+        await self.start()
+        m = self.metrics
+        if self.backfill is not None and not self.backfill.accept(message):
+            m.duplicates += 1
+            return False
+
+        m.received += 1
+        queue = self._lane(message)
+        if queue.full():
+            m.blocked += 1
+            start = perf_counter()
+            await queue.put(message)
+            m.blocked_seconds += perf_counter() - start
+        else:
+            queue.put_nowait(message)
+
+        m.queued += 1
+        m.max_queued = max(m.queued, m.max_queued)
+        return True
+
+    async def resume(self, websocket):
+        """ backfill anything missed while disconnected, live messages
+            that arrive in the meantime are buffered and replayed after """
+        if self.backfill is None or self.backfill.last_updated is None:
+            return
+
+        buffer = []
+
+        async def receive():
+            while True:
+                buffer.append(await websocket.recv())
+
+        receiving = asyncio.ensure_future(receive())
+        try:
+            await self.backfill.fill(self)
+        finally:
+            receiving.cancel()
+            await asyncio.gather(receiving, return_exceptions=True)
+
+        for response in buffer:
+            await self.put(response)
+
+        if not receiving.cancelled() and receiving.exception() is not None:
+            raise receiving.exception()  # e.g. closed during the backfill
+
+    def _executor(self, mode):
+        if mode not in self._executors:
+            if mode == 'thread':
+                self._executors[mode] = ThreadPoolExecutor(self.thread_workers)
+            elif mode == 'process':
+                self._executors[mode] = ProcessPoolExecutor(self.process_workers)
+            else:
+                raise ValueError(f'unknown concurrency {mode!r}')
+
+        return self._executors[mode]
+
+    async def _run(self, fh, message):
+        mode = getattr(fh, 'concurrency', 'inline')
+        if mode == 'inline':
+            fh(message)
+        else:
+            loop = asyncio.get_event_loop()  # the running loop, get_running_loop is 3.7+
+            await loop.run_in_executor(self._executor(mode), fh, message)
+
+    async def _consume(self, queue):
+        m = self.metrics
+        while True:
+            message = await queue.get()
+            m.queued -= 1
+            try:
+                if message.get('type') == 'annotation-notification':
+                    for fh in self.handler.filter_handlers:
+                        name = fh.__class__.__name__
+                        start = perf_counter()
+                        try:
+                            await self._run(fh, message)
+                        except Exception as e:
+                            m.errors += 1
+                            log.exception(e)
+                        finally:
+                            m.handler_calls[name] = m.handler_calls.get(name, 0) + 1
+                            m.handler_seconds[name] = (m.handler_seconds.get(name, 0) +
+                                                       perf_counter() - start)
+                else:
+                    self.handler.process(message)
+
+                m.processed += 1
+            finally:
+                queue.task_done()
+
+    async def join(self):
+        """ wait until everything queued so far has been processed """
+        if self._queues is not None:
+            for queue in self._queues:
+                await queue.join()
+
+    async def close(self):
+        """ finish queued messages and shut down the worker pools """
+        if self._queues is not None:
+            await self.join()
+            for task in self._tasks:
+                task.cancel()
+
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+            self._queues = self._tasks = None
+
+        for executor in self._executors.values():
+            executor.shutdown()
+
+        self._executors = {}
+
 
 class preFilter:
     """ Create a filter that will run on the hypothes.is server
@@ -97,6 +367,20 @@ def _ssl_context(verify=True):
     return ssl_context
 
 
+def _connect_kwargs(websocket_endpoint, headers):
+    kwargs = {}
+    if websocket_endpoint.startswith('wss://'):
+        kwargs['ssl'] = _ssl_context(verify=True)  # ws:// refuses an ssl context
+
+    # websockets 14 renamed extra_headers in its new asyncio client
+    if int(websockets.__version__.split('.')[0]) >= 14:
+        kwargs['additional_headers'] = headers
+    else:
+        kwargs['extra_headers'] = headers
+
+    return kwargs
+
+
 async def setup_connection(websocket):
     message = {'messageType': 'client_id',
                'value': str(uuid.uuid4()),}
@@ -110,6 +394,12 @@ async def setup_filters(websocket, filters):
 
 
 async def process_messages(websocket, handler):
+    if isinstance(handler, Dispatcher):
+        # only receive here, handlers run on the dispatcher's lanes
+        await handler.resume(websocket)
+        while True:
+            await handler.put(await websocket.recv())
+
     while True:
         response = await websocket.recv()
         try:
@@ -155,7 +445,11 @@ async def open_connection(sock=None, loop=None):
 
 def setup_websocket(api_token, filters, filter_handlers,
                     websocket_endpoint='wss://hypothes.is/ws',
-                    extra_headers=None):
+                    extra_headers=None,
+                    dispatch=None,
+                    backfill=None):
+    """ dispatch is a dict of keyword arguments for Dispatcher
+        backfill is a Backfill used to fill gaps on reconnect """
     if extra_headers is None:
         extra_headers = {}
 
@@ -175,22 +469,20 @@ def setup_websocket(api_token, filters, filter_handlers,
         #websocket_endpoint = 'wss://hypothes.is/ws'
         #filter_handlers = getFilterHandlers()
         handler = Handler(filter_handlers)
-        ssl_context = _ssl_context(verify=True)
-
+        dispatcher = Dispatcher(handler, backfill=backfill, **(dispatch or {}))
         headers = {'Authorization': 'Bearer ' + api_token}
         extra_headers.update(headers)
+        connect_kwargs = _connect_kwargs(websocket_endpoint, extra_headers)
         exit_reader, _writer = await open_connection(sock=rsock, loop=loop)
         while True:  # for insurance could also test on closed wsock
             log.debug('WE SHOULD GET HERE')
             try:
-                async with websockets.connect(websocket_endpoint,
-                                              ssl=ssl_context,
-                                              extra_headers=extra_headers) as ws:
+                async with websockets.connect(websocket_endpoint, **connect_kwargs) as ws:
                     await setup_connection(ws)
                     log.debug(f'websocket connected to {websocket_endpoint}')
                     await setup_filters(ws, filters)
                     log.debug('subscribed')
-                    await process_or_exit(ws, handler, exit_reader)
+                    await process_or_exit(ws, dispatcher, exit_reader)
             except ExitLoop as e:  # for whatever reason the await proceess or exit doesn't work here :/
                 print(e)
                 break
@@ -199,18 +491,30 @@ def setup_websocket(api_token, filters, filter_handlers,
             except (websockets.exceptions.ConnectionClosed, ConnectionResetError) as e:
                 pass
 
+        await dispatcher.close()
+        handler.close()
         _writer.close()  # prevents ResourceWarning
 
     return ws_loop, exit_loop
 
 
 class AnnotationStream:
-    def __init__(self, annos, prefilter, *handler_classes, memoizer=None):
-        from .hypothesis import api_token
+    def __init__(self, annos, prefilter, *handler_classes, memoizer=None, dispatch=None,
+                 fetcher=None, websocket_endpoint='wss://hypothes.is/ws'):
+        from .hypothesis import api_token, AnnoFetcher
         self.api_token = api_token
         self.annos = annos
         self.filters = prefilter
         self.filter_handlers = [handler(self.annos, memoizer=memoizer) for handler in handler_classes]
+        self.dispatch = dispatch
+        self.websocket_endpoint = websocket_endpoint
+        if fetcher is None and isinstance(memoizer, AnnoFetcher):
+            fetcher = memoizer
+
+        # pick up from the newest annotation we have, this covers the time
+        # between loading annos and subscribing as well as any reconnects
+        self.backfill = (None if fetcher is None else
+                         Backfill(fetcher, annos[-1].updated if annos else None))
 
     @staticmethod
     def loop_target(loop, ws_loop):
@@ -218,8 +522,10 @@ class AnnotationStream:
         loop.run_until_complete(ws_loop(loop))
 
     def __call__(self):
-        loop = asyncio.get_event_loop()
-        ws_loop, exit_loop = setup_websocket(self.api_token, self.filters, self.filter_handlers)
+        loop = asyncio.new_event_loop()  # runs in stream_thread only
+        ws_loop, exit_loop = setup_websocket(self.api_token, self.filters, self.filter_handlers,
+                                             websocket_endpoint=self.websocket_endpoint,
+                                             dispatch=self.dispatch, backfill=self.backfill)
         stream_thread = Thread(target=self.loop_target, args=(loop, ws_loop))
         return stream_thread, exit_loop
 
@@ -0,0 +1,282 @@
+""" columnar view of a set of annotations for fast filtering
+
+    AnnotationTable keeps one numpy array per field so that predicates
+    over hundreds of thousands of annotations are vectorized instead of
+    python loops, strings are interned as integer codes, timestamps are
+    integer microseconds since the epoch and tags are stored in csr
+    form, requires numpy, pip install hyputils[table]
+
+    table = AnnotationTable.from_memoizer(Memoizer(group=group))
+    recent = table.between(start='2019-01-01').user('tgbugs').tag('RRID:AB_1')
+    for anno in recent: ...
+"""
+
+from bisect import bisect_left
+from datetime import datetime, timezone
+import numpy as np
+from .hypothesis import HypothesisAnnotation, norm
+
+__all__ = ['AnnotationTable']
+
+_epoch = datetime(1970, 1, 1, tzinfo=timezone.utc)
+_formats = ('%Y-%m-%dT%H:%M:%S.%f%z',
+            '%Y-%m-%dT%H:%M:%S%z',
+            '%Y-%m-%dT%H:%M:%S.%f',
+            '%Y-%m-%dT%H:%M:%S',
+            '%Y-%m-%dT%H:%M',
+            '%Y-%m-%d')
+
+
+def _parse(value):
+    # fromisoformat is 3.7+ and strptime %z does not accept +00:00 before 3.7
+    value = value.replace('Z', '+00:00')
+    if len(value) > 10 and value[-3] == ':' and value[-6] in '+-':
+        value = value[:-3] + value[-2:]
+
+    for format in _formats:
+        try:
+            return datetime.strptime(value, format)
+        except ValueError:
+            pass
+
+    raise ValueError('not an iso8601 timestamp {!r}'.format(value))
+
+
+def timestamp_us(value):
+    """ iso8601 string or datetime to integer microseconds since the epoch """
+    if isinstance(value, str):
+        value = _parse(value)
+
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+
+    delta = value - _epoch
+    return (delta.days * 86400 + delta.seconds) * 1000000 + delta.microseconds
+
+
+class _Interned:
+    """ values of a string column, codes index into values """
+
+    def __init__(self):
+        self.values = []
+        self.index = {}
+
+    def code(self, value):
+        try:
+            return self.index[value]
+        except KeyError:
+            code = self.index[value] = len(self.values)
+            self.values.append(value)
+            return code
+
+    def sorted(self):
+        # only grows while a table is built so the cache can't go stale after
+        if getattr(self, '_sorted', None) is None or len(self._sorted) != len(self.values):
+            self._sorted = sorted(self.values)
+
+        return self._sorted
+
+    def codes(self, predicate):
+        """ codes for all values where predicate is true """
+        return np.fromiter((c for c, v in enumerate(self.values) if predicate(v)),
+                           dtype=np.int32)
+
+
+class AnnotationTable:
+    """ immutable columnar table of annotations
+
+        filtering methods return a new table holding the matching rows,
+        string tables are shared between a table and its subsets,
+        combine masks from the *_mask methods with & | ~ and index
+        with table[mask] for anything more complex than a chain """
+
+    _string_columns = ('user', 'group', 'uri', 'type')
+
+    def __init__(self, annos=()):
+        self._strings = {name: _Interned() for name in self._string_columns + ('tag',)}
+        self._build(annos)
+
+    def _build(self, annos):
+        annos = [a if isinstance(a, HypothesisAnnotation) else HypothesisAnnotation(a)
+                 for a in annos]
+        n = len(annos)
+        self._annos = np.empty(n, dtype=object)
+        self._annos[:] = annos
+        self.id = np.array([a.id for a in annos], dtype=object)
+        self.created = np.fromiter((timestamp_us(a.created) for a in annos),
+                                   dtype=np.int64, count=n)
+        self.updated = np.fromiter((timestamp_us(a.updated) for a in annos),
+                                   dtype=np.int64, count=n)
+        self._codes = {}
+        for name in self._string_columns:
+            code = self._strings[name].code
+            self._codes[name] = np.fromiter((code(getattr(a, name)) for a in annos),
+                                            dtype=np.int32, count=n)
+
+        tag_code = self._strings['tag'].code
+        lengths = np.fromiter((len(a._tag_tuple) for a in annos), dtype=np.int64, count=n)
+        self.tag_offsets = np.zeros(n + 1, dtype=np.int64)
+        np.cumsum(lengths, out=self.tag_offsets[1:])
+        self.tag_codes = np.fromiter((tag_code(t) for a in annos for t in a._tag_tuple),
+                                     dtype=np.int32, count=int(self.tag_offsets[-1]))
+        self._reset_tag_rows()
+        self._id_index = None
+
+    def _reset_tag_rows(self):
+        # row of each entry in tag_codes, the inverse of tag_offsets
+        self._tag_rows = np.repeat(np.arange(len(self), dtype=np.int64),
+                                   np.diff(self.tag_offsets))
+
+    @classmethod
+    def from_memoizer(cls, memoizer):
+        """ build from the cache file of a Memoizer or AnnoReader
+            without holding a second copy of the rows in a list """
+        return cls(memoizer.yield_annos_from_file())
+
+    # row access
+
+    def __len__(self):
+        return len(self._annos)
+
+    def __iter__(self):
+        yield from self._annos
+
+    def __repr__(self):
+        return f'<{self.__class__.__name__} {len(self)} rows>'
+
+    def __getitem__(self, key):
+        """ int -> HypothesisAnnotation, anything else numpy can
+            index with (slice, bool mask, index array) -> table """
+        if isinstance(key, (int, np.integer)):
+            return self._annos[key]
+
+        rows = np.arange(len(self))[key]
+        return self._take(rows)
+
+    def _take(self, rows):
+        new = self.__class__.__new__(self.__class__)
+        new._strings = self._strings
+        new._annos = self._annos[rows]
+        new.id = self.id[rows]
+        new.created = self.created[rows]
+        new.updated = self.updated[rows]
+        new._codes = {name: codes[rows] for name, codes in self._codes.items()}
+
+        starts = self.tag_offsets[rows]
+        lengths = self.tag_offsets[rows + 1] - starts
+        new.tag_offsets = np.zeros(len(rows) + 1, dtype=np.int64)
+        np.cumsum(lengths, out=new.tag_offsets[1:])
+        positions = (np.repeat(starts - new.tag_offsets[:-1], lengths) +
+                     np.arange(new.tag_offsets[-1], dtype=np.int64))
+        new.tag_codes = self.tag_codes[positions]
+        new._reset_tag_rows()
+        new._id_index = None
+        return new
+
+    def column(self, name):
+        """ decoded values of a string column as an object array """
+        values = np.array(self._strings[name].values, dtype=object)
+        return values[self._codes[name]]
+
+    def tags(self, i):
+        values = self._strings['tag'].values
+        return [values[c] for c in self.tag_codes[self.tag_offsets[i]:self.tag_offsets[i + 1]]]
+
+    def byId(self, id_):
+        if self._id_index is None:
+            self._id_index = {id_: i for i, id_ in enumerate(self.id)}
+
+        if id_ in self._id_index:
+            return self._annos[self._id_index[id_]]
+
+    # masks
+
+    def _equals_mask(self, name, *values):
+        index = self._strings[name].index
+        codes = [index[v] for v in values if v in index]
+        return np.isin(self._codes[name], codes)
+
+    def between_mask(self, start=None, end=None, field='updated'):
+        """ start <= field < end, either bound may be None """
+        column = getattr(self, field)
+        mask = np.ones(len(self), dtype=bool)
+        if start is not None:
+            mask &= column >= timestamp_us(start)
+        if end is not None:
+            mask &= column < timestamp_us(end)
+
+        return mask
+
+    def user_mask(self, *users):
+        return self._equals_mask('user', *users)
+
+    def group_mask(self, *groups):
+        return self._equals_mask('group', *groups)
+
+    def type_mask(self, *types):
+        """ annotation, reply or pagenote """
+        return self._equals_mask('type', *types)
+
+    def uri_mask(self, iri, prefix=False):
+        """ same matching as HypothesisHelper.byIri, the
+            scheme and hypothesisAnnotationId are ignored """
+        norm_iri = norm(iri)
+        if prefix:
+            codes = self._strings['uri'].codes(lambda u: norm(u).startswith(norm_iri))
+        else:
+            codes = self._strings['uri'].codes(lambda u: norm(u) == norm_iri)
+
+        return np.isin(self._codes['uri'], codes)
+
+    def tag_mask(self, *tags, any=False):
+        """ rows that have all of tags, or any of them if any=True """
+        index = self._strings['tag'].index
+        if not tags:
+            return np.ones(len(self), dtype=bool)
+
+        masks = []
+        for tag in tags:
+            mask = np.zeros(len(self), dtype=bool)
+            if tag in index:
+                mask[self._tag_rows[self.tag_codes == index[tag]]] = True
+
+            masks.append(mask)
+
+        return np.logical_or.reduce(masks) if any else np.logical_and.reduce(masks)
+
+    def tag_prefix_mask(self, prefix):
+        """ rows with at least one tag starting with prefix e.g. 'PROTCUR:' """
+        values = self._strings['tag'].sorted()
+        codes = []
+        for tag in values[bisect_left(values, prefix):]:
+            if not tag.startswith(prefix):
+                break
+
+            codes.append(self._strings['tag'].index[tag])
+
+        mask = np.zeros(len(self), dtype=bool)
+        mask[self._tag_rows[np.isin(self.tag_codes, codes)]] = True
+        return mask
+
+    # chainable filters
+
+    def between(self, start=None, end=None, field='updated'):
+        return self[self.between_mask(start, end, field)]
+
+    def user(self, *users):
+        return self[self.user_mask(*users)]
+
+    def group(self, *groups):
+        return self[self.group_mask(*groups)]
+
+    def type(self, *types):
+        return self[self.type_mask(*types)]
+
+    def uri(self, iri, prefix=False):
+        return self[self.uri_mask(iri, prefix)]
+
+    def tag(self, *tags, any=False):
+        return self[self.tag_mask(*tags, any=any)]
+
+    def tag_prefix(self, prefix):
+        return self[self.tag_prefix_mask(prefix)]
@@ -1,4 +1,6 @@
 import logging
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 
 
 def makeSimpleLogger(name, level=logging.INFO):
@@ -21,3 +23,33 @@ def makeSimpleLogger(name, level=logging.INFO):
 
 log = makeSimpleLogger('hyputils')
 logd = log.getChild('data')
+
+
+def bounded_map(function, iterable, workers, ordered=True):
+    """ like executor.map but with at most 2 * workers calls submitted
+        at any one time so that huge iterables are consumed lazily,
+        if ordered is False results are yielded as soon as they finish """
+    max_pending = 2 * workers
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        pending = deque()
+
+        def drain():
+            if ordered:
+                yield pending.popleft().result()
+            else:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    pending.remove(future)
+                    yield future.result()
+
+        try:
+            for item in iterable:
+                pending.append(executor.submit(function, item))
+                if len(pending) >= max_pending:
+                    yield from drain()
+
+            while pending:
+                yield from drain()
+        finally:
+            for future in pending:
+                future.cancel()
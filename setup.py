@@ -58,8 +58,10 @@ setup(name='hyputils',
           'requests',
           'websockets',
       ],
-      extras_require={'dev': ['pytest-cov', 'wheel'],
+      extras_require={'async': ['aiohttp'],
+                      'dev': ['pytest-cov', 'wheel'],
                       'memex':['python-dateutil'] + tests_memex_require,
+                      'table': ['numpy'],
                       'test': tests_require,
                       'zdesk': ['pyyaml', 'zdesk'],
                      },
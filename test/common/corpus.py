@@ -0,0 +1,76 @@
+# -*- coding: utf-8 -*-
+"""Synthetic rows shaped like results from the hypothes.is search api."""
+
+import random
+import string
+from datetime import datetime, timedelta, timezone
+
+_id_chars = string.ascii_letters + string.digits + '-_'
+_epoch = datetime(2018, 1, 1, tzinfo=timezone.utc)
+
+
+def timestamp(i, start=_epoch):
+    return (start + timedelta(seconds=i)).isoformat(timespec='microseconds')
+
+
+def make_id(rng=random):
+    return ''.join(rng.choice(_id_chars) for _ in range(22))
+
+
+def make_row(id=None, updated=None, created=None, group='__world__',
+             user='tgbugstest', uri='https://example.org/paper', tags=(),
+             text='', exact=None, references=None, rng=random):
+    if id is None:
+        id = make_id(rng)
+    if updated is None:
+        updated = timestamp(0)
+    if created is None:
+        created = updated
+
+    if exact is None:
+        target = [{'source': uri}]
+    else:
+        target = [{'source': uri,
+                   'selector': [{'type': 'TextQuoteSelector',
+                                 'prefix': 'before ',
+                                 'exact': exact,
+                                 'suffix': ' after'},
+                                {'type': 'TextPositionSelector',
+                                 'start': 7,
+                                 'end': 7 + len(exact)}]}]
+
+    row = {'id': id,
+           'created': created,
+           'updated': updated,
+           'user': f'acct:{user}@hypothes.is',
+           'uri': uri,
+           'text': text,
+           'tags': list(tags),
+           'group': group,
+           'permissions': {'read': [f'group:{group}'],
+                           'admin': [f'acct:{user}@hypothes.is'],
+                           'update': [f'acct:{user}@hypothes.is'],
+                           'delete': [f'acct:{user}@hypothes.is']},
+           'target': target,
+           'document': {'title': ['A paper about ' + uri.rsplit('/', 1)[-1]]},
+           'links': {'html': f'https://hypothes.is/a/{id}',
+                     'incontext': f'https://hyp.is/{id}/{uri}',
+                     'json': f'https://hypothes.is/api/annotations/{id}'},
+           'flagged': False,
+           'hidden': False}
+
+    if references:
+        row['references'] = list(references)
+
+    return row
+
+
+def make_rows(n, group='__world__', seed=0):
+    """ n rows in ascending updated order """
+    rng = random.Random(seed)
+    return [make_row(updated=timestamp(i), group=group,
+                     tags=rng.sample(('RRID:AB_1', 'PROTCUR:a', 'PROTCUR:b', 'test'),
+                                     rng.randint(0, 2)),
+                     uri=f'https://example.org/paper/{rng.randint(0, n // 10)}',
+                     exact=f'exact text {i}', rng=rng)
+            for i in range(n)]
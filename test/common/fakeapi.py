@@ -0,0 +1,75 @@
+# -*- coding: utf-8 -*-
+"""In process stand in for the hypothes.is search api."""
+
+import json
+import threading
+from urllib.parse import urlparse, parse_qs
+from hyputils.hypothesis import HypothesisUtils
+
+
+def search_rows(rows, params):
+    """ apply search api params to a list of rows sorted by updated """
+    group = params.get('group')
+    user = params.get('user')
+    order = params.get('order', 'desc')
+    after = params.get('search_after')
+    limit = int(params.get('limit', 20))
+    offset = int(params.get('offset', 0))
+    out = [r for r in rows
+           if (group is None or r['group'] == group) and
+           (user is None or r['user'] == f'acct:{user}@hypothes.is')]
+    if order == 'desc':
+        out = out[::-1]
+    if after is not None:
+        out = [r for r in out if (r['updated'] > after
+                                  if order == 'asc' else
+                                  r['updated'] < after)]
+    return {'total': len(out), 'rows': out[offset:offset + limit]}
+
+
+class FakeResponse:
+    def __init__(self, obj, status_code=200, headers=None):
+        self._obj = obj
+        self.status_code = status_code
+        self.ok = status_code < 400
+        self.reason = 'OK' if self.ok else 'ERROR'
+        self.headers = {} if headers is None else headers
+
+    def json(self):
+        return self._obj
+
+
+class FakeHypothesisUtils(HypothesisUtils):
+    """ answers requests from a list of rows instead of the network """
+
+    def __init__(self, rows, group='__world__', **kwargs):
+        super().__init__(username='tgbugstest', token='TOKEN', group=group, **kwargs)
+        self.rows = rows
+        self.queries = 0
+        self._lock = threading.Lock()
+
+    def _row(self, id):
+        for row in self.rows:
+            if row['id'] == id:
+                return row
+
+    def _send(self, method, url, data=None, **kwargs):
+        with self._lock:
+            self.queries += 1
+
+        url = urlparse(url)
+        path = url.path.split('/')
+        if path[-1] == 'search':
+            params = {k: v[0] for k, v in parse_qs(url.query).items()}
+            return FakeResponse(search_rows(self.rows, params))
+
+        row = self._row(path[-1])
+        if row is None:
+            return FakeResponse({'status': 'failure'}, 404)
+        elif method == 'PATCH':
+            row.update(json.loads(data))
+        elif method == 'DELETE':
+            self.rows.remove(row)
+            return FakeResponse({'id': row['id'], 'deleted': True})
+
+        return FakeResponse(row)
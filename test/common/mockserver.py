@@ -0,0 +1,340 @@
+# -*- coding: utf-8 -*-
+"""Local stand in for the hypothes.is rest api and websocket.
+
+Serves /api/search, /api/annotations and /ws from a synthetic corpus on
+a background thread so that HypothesisUtils, Memoizer, AnnotationStream
+and the async client can be pointed at it with domain=server.domain and
+scheme='http'. Latency and errors can be injected to exercise retries.
+
+    with MockHypothesis(n=10000, latency=0.01) as server:
+        h = HypothesisUtils(domain=server.domain, scheme='http', ...)
+"""
+
+import json
+import random
+import asyncio
+import threading
+from bisect import bisect_left, bisect_right
+from aiohttp import web, WSMsgType
+from .corpus import make_id, make_rows, timestamp
+
+max_limit = 200  # same as the real api
+
+
+def _user_matches(row, user):
+    return row['user'] == user or row['user'] == f'acct:{user}@hypothes.is'
+
+
+def _clause_matches(row, clause):
+    field, values = clause['field'], clause['value']
+    if field == '/group':
+        return row['group'] in values
+    elif field == '/user':
+        return any(_user_matches(row, v) for v in values)
+    elif field == '/uri':
+        return row['uri'] in values
+    elif field == '/tags':
+        return any(t in values for t in row['tags'])
+    else:
+        return True
+
+
+def filter_matches(filter, action, row):
+    """ apply a websocket filter message as exported by subscribe.preFilter """
+    if filter is None:
+        return True
+
+    f = filter['filter']
+    if not f['actions'].get(action, True):
+        return False
+    elif action == 'delete' or not f['clauses']:
+        # real deletes only carry the id so they cannot be filtered
+        return True
+
+    matches = (_clause_matches(row, c) for c in f['clauses'])
+    return all(matches) if f['match_policy'] == 'include_all' else any(matches)
+
+
+class MockHypothesis:
+    """ rows are kept in ascending updated order, every create and update
+        gets a fresh updated one second after the newest so that search_after
+        pagination is stable, latency is seconds added to every request and
+        error_rate is the fraction of requests answered with error_status """
+
+    def __init__(self, rows=None, n=1000, group='__world__', token=None,
+                 latency=0, error_rate=0, error_status=503, retry_after=None,
+                 seed=0, host='127.0.0.1', port=0):
+        self.host = host
+        self.port = port
+        self.token = token
+        self.latency = latency
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.retry_after = retry_after
+        self.seed = seed
+        self._initial = rows if rows is not None else make_rows(n, group=group, seed=seed)
+        self._lock = threading.Lock()
+        self._loop = None
+        self._thread = None
+        self._runner = None
+        self.reset()
+
+    # corpus
+
+    def reset(self, rows=None):
+        """ restore the corpus and clear counters and injected failures """
+        with self._lock:
+            rows = self._initial if rows is None else rows
+            self.rows = sorted((dict(r) for r in rows), key=lambda r: r['updated'])
+            self._keys = [r['updated'] for r in self.rows]
+            self._by_id = {r['id']: r for r in self.rows}
+            self._tick = len(self.rows)
+            self._fail = []
+            self._rng = random.Random(self.seed)
+            self._ids = random.Random(self.seed + 1)
+            self.requests = {}
+
+    def _next_updated(self):
+        newest = self._keys[-1] if self._keys else None
+        while True:
+            updated = timestamp(self._tick)
+            self._tick += 1
+            if newest is None or updated > newest:
+                return updated
+
+    def _remove(self, row):
+        i = bisect_left(self._keys, row['updated'])
+        while self.rows[i] is not row:
+            i += 1
+
+        del self.rows[i], self._keys[i]
+
+    def _store(self, row, action):
+        with self._lock:
+            old = self._by_id.get(row['id'])
+            if old is not None:
+                self._remove(old)
+
+            if action == 'delete':
+                self._by_id.pop(row['id'], None)
+                return {'id': row['id']}
+
+            row = dict(old or {}, **row)
+            row['updated'] = self._next_updated()
+            if action == 'create':
+                row['created'] = row['updated']
+
+            self.rows.append(row)
+            self._keys.append(row['updated'])
+            self._by_id[row['id']] = row
+            return row
+
+    def push(self, action, row, notify=True):
+        """ change the corpus as if another client did and notify
+            websocket subscribers, row only needs an id for delete,
+            notify=False simulates a notification lost in transit """
+        row = self._store(row, action)
+        if notify and self._loop is not None:
+            asyncio.run_coroutine_threadsafe(self._notify(action, row), self._loop).result()
+
+        return row
+
+    def fail_next(self, n=1, status=None):
+        """ answer the next n requests with status instead of the default """
+        with self._lock:
+            self._fail.extend([status or self.error_status] * n)
+
+    # server
+
+    @property
+    def domain(self):
+        return f'{self.host}:{self.port}'
+
+    @property
+    def url(self):
+        return f'http://{self.domain}'
+
+    @property
+    def ws_url(self):
+        return f'ws://{self.domain}/ws'
+
+    def start(self):
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever, daemon=True)
+        self._thread.start()
+        asyncio.run_coroutine_threadsafe(self._start(), self._loop).result()
+        return self
+
+    def stop(self):
+        if self._loop is None:
+            return
+
+        asyncio.run_coroutine_threadsafe(self._stop(), self._loop).result()
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+        self._loop.close()
+        self._loop = self._thread = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+
+    async def _start(self):
+        self._sockets = {}  # socket -> filter
+        app = web.Application(middlewares=[self._middleware])
+        app.add_routes([web.get('/api/search', self._search),
+                        web.post('/api/annotations', self._create),
+                        web.get('/api/annotations/{id}', self._get),
+                        web.patch('/api/annotations/{id}', self._patch),
+                        web.delete('/api/annotations/{id}', self._delete),
+                        web.get('/ws', self._ws)])
+        self._runner = web.AppRunner(app)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, self.host, self.port)
+        await site.start()
+        self.port = site._server.sockets[0].getsockname()[1]
+
+    async def _stop(self):
+        await self.disconnect()
+        await self._runner.cleanup()
+
+    async def disconnect(self):
+        """ drop every websocket, clients are expected to reconnect """
+        for ws in list(self._sockets):
+            await ws.close()
+
+    def disconnect_all(self):
+        asyncio.run_coroutine_threadsafe(self.disconnect(), self._loop).result()
+
+    @web.middleware
+    async def _middleware(self, request, handler):
+        route = request.match_info.route.resource
+        name = request.method + ' ' + (route.canonical if route is not None else request.path)
+        with self._lock:
+            self.requests[name] = self.requests.get(name, 0) + 1
+            status = (self._fail.pop(0) if self._fail else
+                      self.error_status if self._rng.random() < self.error_rate else
+                      None)
+
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+        if status is not None:
+            headers = {} if self.retry_after is None else {'Retry-After': str(self.retry_after)}
+            return web.json_response({'status': 'failure', 'reason': 'injected'},
+                                     status=status, headers=headers)
+
+        if (self.token is not None and
+            request.headers.get('Authorization') != 'Bearer ' + self.token):
+            return web.json_response({'status': 'failure', 'reason': 'bad token'}, status=401)
+
+        return await handler(request)
+
+    # rest api
+
+    def search(self, params):
+        """ the search api over the corpus, also usable without a server """
+        sort = params.get('sort', 'updated')
+        order = params.get('order', 'desc')
+        after = params.get('search_after')
+        limit = min(int(params.get('limit', 20)), max_limit)
+        offset = int(params.get('offset', 0))
+        group, user = params.get('group'), params.get('user')
+        uri, tags = params.get('uri'), params.get('tags') or params.get('tag')
+        with self._lock:
+            if sort == 'updated':
+                rows, keys = self.rows, self._keys
+            else:
+                rows = sorted(self.rows, key=lambda r: r[sort])
+                keys = [r[sort] for r in rows]
+
+            if after is None:
+                pass
+            elif order == 'asc':
+                rows = rows[bisect_right(keys, after):]
+            else:
+                rows = rows[:bisect_left(keys, after)]
+
+        if order != 'asc':
+            rows = rows[::-1]
+
+        if group or user or uri or tags:
+            tags = tags.split(',') if isinstance(tags, str) else tags
+            rows = [r for r in rows
+                    if (group is None or r['group'] == group) and
+                    (user is None or _user_matches(r, user)) and
+                    (uri is None or r['uri'] == uri) and
+                    (not tags or all(t in r['tags'] for t in tags))]
+
+        return {'total': len(rows), 'rows': rows[offset:offset + limit]}
+
+    async def _search(self, request):
+        return web.json_response(self.search(dict(request.query)))
+
+    def _row(self, request):
+        row = self._by_id.get(request.match_info['id'])
+        if row is None:
+            raise web.HTTPNotFound(text=json.dumps({'status': 'failure', 'reason': 'not found'}),
+                                   content_type='application/json')
+        return row
+
+    async def _get(self, request):
+        return web.json_response(self._row(request))
+
+    async def _create(self, request):
+        payload = await request.json()
+        row = dict(payload, id=make_id(self._ids), tags=payload.get('tags', []))
+        row.setdefault('user', f'acct:{row.pop("username", "tgbugstest")}@hypothes.is')
+        row.setdefault('group', '__world__')
+        row.setdefault('text', '')
+        row.setdefault('target', [{'source': row.get('uri')}])
+        row = self._store(row, 'create')
+        await self._notify('create', row)
+        return web.json_response(row)
+
+    async def _patch(self, request):
+        self._row(request)
+        payload = await request.json()
+        row = self._store(dict(payload, id=request.match_info['id']), 'update')
+        await self._notify('update', row)
+        return web.json_response(row)
+
+    async def _delete(self, request):
+        row = self._row(request)
+        self._store(row, 'delete')
+        await self._notify('delete', {'id': row['id']})
+        return web.json_response({'id': row['id'], 'deleted': True})
+
+    # websocket
+
+    async def _ws(self, request):
+        ws = web.WebSocketResponse()
+        await ws.prepare(request)
+        self._sockets[ws] = None
+        try:
+            async for msg in ws:
+                if msg.type != WSMsgType.TEXT:
+                    continue
+
+                data = json.loads(msg.data)
+                if 'filter' in data:
+                    self._sockets[ws] = data
+                # client_id messages need no reply
+        finally:
+            self._sockets.pop(ws, None)
+
+        return ws
+
+    async def _notify(self, action, row):
+        message = json.dumps({'type': 'annotation-notification',
+                              'options': {'action': action},
+                              'payload': [row]})
+        for ws, filter in list(self._sockets.items()):
+            if filter_matches(filter, action, row) and not ws.closed:
+                await ws.send_str(message)
+
+    def subscribers(self):
+        """ number of websockets that have sent a filter """
+        return sum(f is not None for f in self._sockets.values())
@@ -0,0 +1,28 @@
+import pytest
+
+
+@pytest.fixture(scope='session')
+def hypothesis_server():
+    """ one local stand in for hypothes.is shared by the whole session """
+    pytest.importorskip('aiohttp')
+    from .common.mockserver import MockHypothesis
+    with MockHypothesis(n=1000) as server:
+        yield server
+
+
+@pytest.fixture
+def mock_hypothesis(hypothesis_server):
+    """ the shared server with its corpus, counters and failures reset """
+    hypothesis_server.reset()
+    hypothesis_server.latency = 0
+    hypothesis_server.error_rate = 0
+    yield hypothesis_server
+    hypothesis_server.reset()
+
+
+@pytest.fixture
+def mock_hypothesis_class(request, mock_hypothesis):
+    """ expose the server as self.server on unittest classes """
+    request.cls.server = mock_hypothesis
+    yield mock_hypothesis
+    del request.cls.server
@@ -0,0 +1,123 @@
+import asyncio
+import json
+import unittest
+import pytest
+from .common.corpus import make_rows
+from .common.fakeapi import search_rows
+
+aiohttp = pytest.importorskip('aiohttp')
+from aiohttp import web
+from hyputils.aiohypothesis import AsyncHypothesisUtils
+
+
+class TestAsyncClient(unittest.TestCase):
+    def setUp(self):
+        self.rows = make_rows(45)
+        self.index = {r['id']: r for r in self.rows}
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    async def serve(self):
+        async def search(request):
+            return web.json_response(search_rows(self.rows, dict(request.query)))
+
+        async def annotation(request):
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+            await asyncio.sleep(0.01)
+            self.in_flight -= 1
+            row = self.index[request.match_info['id']]
+            if request.method == 'PATCH':
+                row = dict(row, **json.loads(await request.text()))
+            return web.json_response(row)
+
+        app = web.Application()
+        app.router.add_get('/api/search', search)
+        app.router.add_route('*', '/api/annotations/{id}', annotation)
+        runner = web.AppRunner(app)
+        await runner.setup()
+        site = web.TCPSite(runner, '127.0.0.1', 0)
+        await site.start()
+        host, port = runner.addresses[0][:2]
+        h = AsyncHypothesisUtils('tgbugstest', 'TOKEN', limit=10, concurrency=3,
+                                 domain=f'{host}:{port}', scheme='http')
+        return runner, h
+
+    def run_with_server(self, test):
+        async def main():
+            runner, h = await self.serve()
+            try:
+                async with h:
+                    return await test(h)
+            finally:
+                await runner.cleanup()
+
+        loop = asyncio.new_event_loop()  # asyncio.run is 3.7+
+        try:
+            return loop.run_until_complete(main())
+        finally:
+            loop.close()
+
+    def test_search_all(self):
+        async def test(h):
+            params = {'order': 'asc', 'sort': 'updated', 'group': '__world__'}
+            rows = [r async for r in h.search_all(dict(params))]
+            some = [r async for r in h.search_all(dict(params), max_results=15)]
+            return rows, some
+
+        rows, some = self.run_with_server(test)
+        assert rows == self.rows
+        assert some == self.rows[:15]
+
+    def test_batch_update(self):
+        ids = [r['id'] for r in self.rows[:12]]
+
+        async def test(h):
+            def retag(blob):
+                return {'tags': blob['tags'] + ['new']}
+
+            pretend = [r async for r in h.batch_update(retag, *ids)]
+            patched = [(b, await resp.json()) async for b, resp in
+                       h.batch_update(retag, *ids, pretend=False)]
+            return pretend, patched
+
+        pretend, patched = self.run_with_server(test)
+        assert [b['id'] for b, u in pretend] == ids
+        assert all(u['tags'][-1] == 'new' for b, u in patched)
+        assert self.max_in_flight <= 3
+
+    def test_batch_update_unordered(self):
+        ids = [r['id'] for r in self.rows]
+
+        async def test(h):
+            def retag(blob):
+                return {'tags': blob['tags'] + ['new']}
+
+            all_tasks = getattr(asyncio, 'all_tasks', None) or asyncio.Task.all_tasks
+            got, n_tasks = [], 0
+            async for b, u in h.batch_update(retag, *ids, ordered=False):
+                got.append(b['id'])
+                n_tasks = max(n_tasks, len(all_tasks()))
+
+            return got, n_tasks
+
+        got, n_tasks = self.run_with_server(test)
+        assert sorted(got) == sorted(ids)
+        assert self.max_in_flight <= 3
+        assert n_tasks < len(ids) // 2  # not one task per id
+
+    def test_summarize_batch(self):
+        ids = [r['id'] for r in self.rows[:5]]
+
+        async def test(h):
+            def retag(blob):
+                return {'tags': blob['tags'] + ['new']}
+
+            pretend = await h.summarize_batch(h.batch_update(retag, *ids))
+            patched = await h.summarize_batch(h.batch_update(retag, *ids, pretend=False))
+            return pretend, patched
+
+        pretend, patched = self.run_with_server(test)
+        assert pretend == patched
+        assert patched.endswith('5 of 5 annotations changed')
+        assert patched.count('+new') == 5
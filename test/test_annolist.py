@@ -0,0 +1,127 @@
+import json
+import shutil
+import tempfile
+import unittest
+from pathlib import Path
+from hyputils.hypothesis import AnnoList, HypothesisAnnotation, Memoizer, JEncode
+from hyputils.handlers import annotationSyncHandler
+from .common.corpus import make_rows, timestamp
+
+
+class TestAnnoList(unittest.TestCase):
+    def setUp(self):
+        self.annos = [HypothesisAnnotation(r) for r in make_rows(10)]
+        self.alist = AnnoList(self.annos)
+
+    def newer(self, anno, i=100):
+        return HypothesisAnnotation(dict(anno._row, text='new', updated=timestamp(i)))
+
+    def test_list_like(self):
+        assert self.alist == self.annos
+        assert len(self.alist) == 10
+        assert self.alist[-1] is self.annos[-1]
+        assert self.alist[0] is self.annos[0]
+        assert self.alist[3] is self.annos[3] and self.alist[-3] is self.annos[-3]
+        assert self.alist[2:5] == self.annos[2:5]
+        assert list(reversed(self.alist)) == self.annos[::-1]
+        assert self.annos[4] in self.alist
+        with self.assertRaises(IndexError):
+            self.alist[10]
+
+    def test_upsert_moves_to_end(self):
+        new = self.newer(self.annos[2])
+        self.alist.append(new)
+        assert len(self.alist) == 10
+        assert self.alist[-1] is new
+        assert self.alist[-1].updated == timestamp(100)
+        assert self.annos[2] not in self.alist
+
+    def test_delete_remove(self):
+        assert self.alist.delete(self.annos[0].id) is self.annos[0]
+        assert self.alist.delete(self.annos[0].id) is None
+        self.alist.remove(self.annos[1])
+        with self.assertRaises(ValueError):
+            self.alist.remove(self.annos[1])
+        assert self.alist == self.annos[2:]
+
+    def test_mutable_sequence(self):
+        a = self.annos
+        assert a[4].id in self.alist and 'missing' not in self.alist
+        assert self.alist.index(a[4]) == self.alist.index(a[4].id) == 4
+        with self.assertRaises(ValueError):
+            self.alist.index('missing')
+
+        both = self.alist + a[:2]
+        assert type(both) is list and len(both) == 12
+        assert a[:2] + self.alist == a[:2] + a
+        assert self.alist.pop() is a[-1] and self.alist.pop(0) is a[0]
+        self.alist.insert(0, a[0])
+        self.alist.insert(100, a[-1])
+        assert self.alist == a
+        self.alist.insert(2, a[7])  # moves rather than duplicates
+        assert self.alist == a[:2] + [a[7]] + a[2:7] + a[8:]
+        self.alist.sort(key=lambda x: x.updated, reverse=True)
+        assert self.alist == a[::-1]
+        self.alist.reverse()
+        assert self.alist == a
+
+    def test_setitem_delitem(self):
+        a = self.annos
+        new = self.newer(a[3])
+        self.alist[3] = new  # same id keeps its position
+        assert self.alist[3] is new and len(self.alist) == 10
+        self.alist[0] = a[9]
+        assert self.alist == [a[9]] + a[1:3] + [new] + a[4:9]
+        del self.alist[0]
+        del self.alist[-2:]
+        assert self.alist == a[1:3] + [new] + a[4:7]
+        self.alist[1:] = a[7:]
+        assert self.alist == [a[1]] + a[7:]
+        self.alist += a[:1]
+        assert self.alist[-1] is a[0] and isinstance(self.alist, AnnoList)
+
+    def test_json(self):
+        assert json.loads(json.dumps(self.alist, cls=JEncode)) == [a._row for a in self.annos]
+
+
+class TestCallSites(unittest.TestCase):
+    def setUp(self):
+        self.folder = Path(tempfile.mkdtemp())
+        self.mem = Memoizer(self.folder / 'annos.json', group='__world__')
+        self.mem.memoize_annos([HypothesisAnnotation(r) for r in make_rows(20)])
+        self.annos, _ = self.mem.get_annos_from_file()
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    def test_memoizer(self):
+        assert isinstance(self.annos, AnnoList)
+        old = self.annos[3]
+        new = HypothesisAnnotation(dict(old._row, updated=timestamp(100)))
+        self.mem.update_anno(new, self.annos)
+        self.mem.del_anno(self.annos[0].id, self.annos)
+        with self.assertRaises(ValueError):
+            self.mem.del_anno('missing', self.annos)
+
+        assert self.annos[-1] is new and len(self.annos) == 19
+        self.mem._merge_new_annos(self.annos, [HypothesisAnnotation(r)
+                                               for r in make_rows(5, seed=1)])
+        assert len(self.annos) == 24
+        reloaded, lsu = self.mem.get_annos_from_file()
+        assert [a.id for a in reloaded] == [a.id for a in self.annos][:-5]
+
+    def test_plain_list_still_works(self):
+        annos = list(self.annos)
+        self.mem.del_anno(annos[0].id, annos)
+        assert len(annos) == 19
+
+    def test_handler(self):
+        handler = annotationSyncHandler(self.annos, memoizer=self.mem)
+        gone = self.annos[5]
+        handler.handler({'options': {'action': 'delete'}, 'payload': [{'id': gone.id}]})
+        row = dict(self.annos[0]._row, updated=timestamp(200))
+        handler.handler({'options': {'action': 'update'}, 'payload': [row]})
+        assert len(self.annos) == 19
+        assert self.annos[-1].updated == timestamp(200)
+        assert self.annos.byId(gone.id) is None
+        handler.close()
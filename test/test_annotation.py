@@ -0,0 +1,40 @@
+import pickle
+import unittest
+from hyputils.hypothesis import HypothesisAnnotation
+from .common.corpus import make_row
+
+
+class TestCachedFields(unittest.TestCase):
+    def setUp(self):
+        self.row = make_row(tags=(' RRID:AB_1', 'test '),
+                            uri='https://via.hypothes.is/https://example.org/a',
+                            exact='hello')
+        self.anno = HypothesisAnnotation(self.row)
+
+    def test_slots(self):
+        assert not hasattr(self.anno, '__dict__')
+
+    def test_fields(self):
+        a = self.anno
+        assert a.uri == 'https://example.org/a'
+        assert a.tags == ['RRID:AB_1', 'test']
+        assert a.type == 'annotation'
+        assert (a.prefix, a.exact, a.suffix) == ('before ', 'hello', ' after')
+        assert (a.start, a.end) == (7, 12)
+        assert a.fragment_selector is None
+
+    def test_tags_copy(self):
+        self.anno.tags.append('oops')
+        assert self.anno.tags == ['RRID:AB_1', 'test']
+
+    def test_pagenote_and_reply(self):
+        assert HypothesisAnnotation(make_row()).type == 'pagenote'
+        reply = HypothesisAnnotation(make_row(references=[self.anno.id]))
+        assert reply.type == 'reply'
+        assert reply.exact is None
+
+    def test_pickle(self):
+        self.anno.uri  # fill a cache slot
+        new = pickle.loads(pickle.dumps(self.anno))
+        assert new == self.anno
+        assert new.uri == self.anno.uri
@@ -0,0 +1,51 @@
+import unittest
+from .common.corpus import make_rows
+from hyputils.retry import RetryPolicy
+from .common.fakeapi import FakeHypothesisUtils, FakeResponse
+
+
+def retag(blob):
+    return {'tags': blob['tags'] + ['RETAGGED']}
+
+
+class TestBatchUpdate(unittest.TestCase):
+    def setUp(self):
+        self.rows = make_rows(40)
+        self.h = FakeHypothesisUtils(self.rows)
+        self.ids = [r['id'] for r in self.rows]
+
+    def test_pretend(self):
+        results = list(self.h.batch_update(retag, *self.ids, workers=8))
+        assert [b['id'] for b, u in results] == self.ids
+        assert all('RETAGGED' not in r['tags'] for r in self.rows)
+        summary = self.h.summarize_batch(results)
+        assert summary.endswith('40 of 40 annotations changed')
+        assert '+RETAGGED' in summary.split('\n')[0]
+
+    def test_patch_unordered(self):
+        results = list(self.h.batch_update(retag, *self.ids, pretend=False,
+                                           workers=8, ordered=False))
+        assert sorted(b['id'] for b, r in results) == sorted(self.ids)
+        assert all(r['tags'][-1] == 'RETAGGED' for r in self.rows)
+
+    def test_retry(self):
+        self.h.retry = RetryPolicy(backoff=0)
+        send = self.h._send
+        failures = []
+
+        def flaky(method, url, **kwargs):
+            if len(failures) < 2:
+                failures.append(url)
+                return FakeResponse({}, 503, {'Retry-After': '0'})
+            return send(method, url, **kwargs)
+
+        self.h._send = flaky
+        results = list(self.h.batch_update(retag, self.ids[0], retries=2))
+        assert results[0][0]['id'] == self.ids[0]
+        assert len(failures) == 2
+
+    def test_retries_exhausted(self):
+        self.h.retry = RetryPolicy(retries=1, backoff=0)
+        self.h._send = lambda method, url, **kwargs: FakeResponse({}, 503)
+        resp = self.h.get_annotation(self.ids[0])
+        assert resp.status_code == 503
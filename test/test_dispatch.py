@@ -0,0 +1,227 @@
+import asyncio
+import json
+import time
+import threading
+import unittest
+from hyputils.handlers import filterHandler
+from hyputils.subscribe import Dispatcher, Handler, Backfill, process_messages
+from .common.corpus import make_rows, timestamp
+
+
+def message(row, action='update'):
+    return json.dumps({'type': 'annotation-notification',
+                       'options': {'action': action},
+                       'payload': [row]})
+
+
+class Recorder(filterHandler):
+    concurrency = 'thread'
+
+    def __init__(self, delay=0):
+        self.delay = delay
+        self.seen = []
+        self.lock = threading.Lock()
+
+    def handler(self, message):
+        time.sleep(self.delay)
+        row = message['payload'][0]
+        with self.lock:
+            self.seen.append((row['id'], row['text']))
+
+
+class Pickles(filterHandler):
+    concurrency = 'process'
+
+    def handler(self, message):
+        return message['payload'][0]['id']
+
+
+class Broken(filterHandler):
+    def handler(self, message):
+        raise ValueError('oops')
+
+
+def run(coro):
+    loop = asyncio.new_event_loop()  # asyncio.run is 3.7+
+    try:
+        return loop.run_until_complete(coro)
+    finally:
+        loop.close()
+
+
+class TestDispatcher(unittest.TestCase):
+    def setUp(self):
+        self.rows = make_rows(5)
+
+    def stream(self, n):
+        """ n updates spread over 5 annotations, text counts up per id """
+        out = []
+        for i in range(n):
+            row = dict(self.rows[i % 5], text=str(i // 5))
+            out.append(message(row))
+
+        return out
+
+    def test_per_annotation_order(self):
+        recorder = Recorder(delay=0.001)
+        dispatcher = Dispatcher(Handler([recorder]), maxsize=20, lanes=4, thread_workers=4)
+
+        async def main():
+            for response in self.stream(100):
+                await dispatcher.put(response)
+
+            await dispatcher.close()
+
+        run(main())
+        assert len(recorder.seen) == 100
+        for row in self.rows:
+            texts = [int(t) for id_, t in recorder.seen if id_ == row['id']]
+            assert texts == list(range(20))
+
+        m = dispatcher.metrics
+        assert m.received == m.processed == 100 and m.queued == 0
+        assert m.handler_calls == {'Recorder': 100}
+
+    def test_default_keeps_arrival_order(self):
+        recorder = Recorder(delay=0.001)
+        dispatcher = Dispatcher(Handler([recorder]), thread_workers=4)
+        stream = self.stream(50)
+
+        async def main():
+            for response in stream:
+                await dispatcher.put(response)
+
+            await dispatcher.close()
+
+        run(main())
+        expect = [(m['payload'][0]['id'], m['payload'][0]['text'])
+                  for m in map(json.loads, stream)]
+        assert recorder.seen == expect
+
+    def test_slow_handler_does_not_block_the_loop(self):
+        recorder = Recorder(delay=0.05)
+        dispatcher = Dispatcher(Handler([recorder]), maxsize=4, lanes=2)
+        ticks = []
+
+        async def tick():
+            while True:
+                ticks.append(time.monotonic())
+                await asyncio.sleep(0.01)
+
+        async def main():
+            ticker = asyncio.ensure_future(tick())
+            for response in self.stream(20):
+                await dispatcher.put(response)
+
+            await dispatcher.close()
+            ticker.cancel()
+
+        run(main())
+        assert len(recorder.seen) == 20
+        assert max(b - a for a, b in zip(ticks, ticks[1:])) < 0.05
+        m = dispatcher.metrics
+        assert m.blocked > 0 and m.blocked_seconds > 0  # the queue pushed back
+        assert m.max_queued <= 4
+
+    def test_errors_and_processes(self):
+        dispatcher = Dispatcher(Handler([Broken(), Pickles()]), process_workers=1)
+
+        async def main():
+            for response in self.stream(5) + ['not json', 'null']:
+                await dispatcher.put(response)
+
+            await dispatcher.close()
+
+        run(main())
+        m = dispatcher.metrics
+        assert m.received == m.processed == 5
+        assert m.errors == 5
+        assert m.handler_calls == {'Broken': 5, 'Pickles': 5}
+
+
+class FakeFetcher:
+    def __init__(self, rows):
+        self.rows = rows
+        self.calls = []
+
+    def yield_from_api(self, search_after=None, **kwargs):
+        self.calls.append(search_after)
+        time.sleep(0.05)  # live messages keep arriving meanwhile
+        for row in self.rows:
+            if search_after is None or row['updated'] > search_after:
+                yield row
+
+
+class Closed(Exception):
+    pass
+
+
+class FakeWebSocket:
+    def __init__(self, responses):
+        self.responses = list(responses)
+
+    async def recv(self):
+        await asyncio.sleep(0.001)
+        if not self.responses:
+            raise Closed()
+
+        return self.responses.pop(0)
+
+
+class TestBackfill(unittest.TestCase):
+    def setUp(self):
+        self.rows = make_rows(12)  # updated counts up
+        for row in self.rows:
+            row['text'] = 'v1'
+
+    def test_reconnect_is_exactly_once(self):
+        recorder = Recorder()
+        recorder.concurrency = 'inline'
+        backfill = Backfill(FakeFetcher(self.rows[:10]), self.rows[4]['updated'])
+        dispatcher = Dispatcher(Handler([recorder]), lanes=1, backfill=backfill)
+        newer = dict(self.rows[8], text='v2', updated=timestamp(500))
+        live = [message(self.rows[7]),  # also in the backfill
+                message(newer),
+                message(self.rows[10]),
+                message(self.rows[3])]  # older than what we already had
+        ws = FakeWebSocket(live)
+
+        async def main():
+            with self.assertRaises(Closed):
+                await process_messages(ws, dispatcher)
+
+            await dispatcher.close()
+
+        run(main())
+        assert backfill.fetcher.calls == [self.rows[4]['updated']]
+        expect = [(r['id'], 'v1') for r in self.rows[5:10]]
+        expect += [(newer['id'], 'v2'), (self.rows[10]['id'], 'v1'), (self.rows[3]['id'], 'v1')]
+        assert recorder.seen == expect
+        assert backfill.last_updated == timestamp(500)
+        m = dispatcher.metrics
+        assert m.backfilled == 5 and m.duplicates == 1
+
+    def test_seen_is_bounded(self):
+        backfill = Backfill(FakeFetcher(self.rows[:10]), max_seen=3)
+        for row in self.rows[:6]:
+            assert backfill.accept(json.loads(message(row)))
+
+        assert list(backfill._updated) == [r['id'] for r in self.rows[3:6]]
+        assert not backfill.accept(json.loads(message(self.rows[5])))
+        backfill.last_updated = self.rows[4]['updated']
+        dispatcher = Dispatcher(Handler([]), backfill=backfill)
+
+        async def main():
+            await backfill.fill(dispatcher)
+            await dispatcher.close()
+
+        run(main())
+        # only what the backfill itself let through is left
+        assert list(backfill._updated) == [r['id'] for r in self.rows[7:10]]
+        assert dispatcher.metrics.backfilled == 4  # rows 6 to 9, 5 was seen
+
+    def test_no_backfill_without_a_starting_point(self):
+        backfill = Backfill(FakeFetcher(self.rows))
+        dispatcher = Dispatcher(Handler([]), backfill=backfill)
+        run(dispatcher.resume(FakeWebSocket([])))
+        assert backfill.fetcher.calls == []
@@ -0,0 +1,91 @@
+import time
+import shutil
+import tempfile
+import unittest
+from pathlib import Path
+import pytest
+from hyputils.hypothesis import Memoizer, HypothesisAnnotation, fcntl
+from .common.corpus import make_row, make_rows, timestamp
+
+
+class TestJournal(unittest.TestCase):
+    def setUp(self):
+        self.folder = Path(tempfile.mkdtemp())
+        self.memfile = self.folder / 'annos.json'
+        self.mem = Memoizer(self.memfile, group='__world__')
+        self.annos = [HypothesisAnnotation(r) for r in make_rows(20)]
+        self.mem.memoize_annos(self.annos)
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    def reload(self):
+        return Memoizer(self.memfile, group='__world__').get_annos_from_file()
+
+    def test_0_append_does_not_rewrite_snapshot(self):
+        size = self.memfile.stat().st_size
+        anno = HypothesisAnnotation(make_row(updated=timestamp(100)))
+        self.mem.add_anno(anno, self.annos)
+        assert self.memfile.stat().st_size == size
+        assert self.mem._journal_file.exists()
+
+        annos, lsu = self.reload()
+        assert [a.id for a in annos] == [a.id for a in self.annos]
+        assert lsu == anno.updated
+
+    def test_1_update_and_delete(self):
+        old = self.annos[3]
+        row = dict(old._row, text='new text', updated=timestamp(200))
+        new = HypothesisAnnotation(row)
+        self.mem.update_anno(new, self.annos)
+        gone = self.annos[0].id
+        self.mem.del_anno(gone, self.annos)
+
+        annos, lsu = self.reload()
+        assert gone not in [a.id for a in annos]
+        assert annos[-1].id == old.id and annos[-1].text == 'new text'
+        assert len(annos) == 19
+
+    def test_2_compaction(self):
+        self.mem.compact_after = 5
+        for i in range(5):
+            self.mem.add_anno(HypothesisAnnotation(make_row(updated=timestamp(100 + i))),
+                              self.annos)
+
+        self.mem._wait_for_compaction()
+        assert not self.mem._journal_file.exists()
+        assert not self.mem._compacting_file.exists()
+        annos, lsu = self.reload()
+        assert len(annos) == 25
+
+    @pytest.mark.skipif(fcntl is None, reason='needs fcntl')
+    def test_2_compaction_waits_for_writer(self):
+        self.mem.add_anno(HypothesisAnnotation(make_row(updated=timestamp(100))), self.annos)
+        size = self.memfile.stat().st_size
+        other = Memoizer(self.memfile, group='__world__')
+        with other._writer_lock() as ok:  # another process updating
+            assert ok
+            self.mem.compact(self.annos)
+            time.sleep(0.2)
+            assert self.memfile.stat().st_size == size
+            assert self.mem._compacting_file.exists()
+
+        self.mem._wait_for_compaction()
+        assert not self.mem._compacting_file.exists()
+        assert len(self.reload()[0]) == 21
+
+        with self.mem._writer_lock() as ok:  # our own lock does not deadlock
+            assert ok
+            self.mem.add_anno(HypothesisAnnotation(make_row(updated=timestamp(101))), self.annos)
+            self.mem.compact(self.annos, background=False)
+
+        assert len(self.reload()[0]) == 22
+
+    def test_3_replay_after_crashed_compaction(self):
+        new = HypothesisAnnotation(dict(self.annos[5]._row, updated=timestamp(300)))
+        self.mem.update_anno(new, self.annos)
+        self.mem._journal_file.rename(self.mem._compacting_file)
+        self.mem._write_snapshot(self.annos)  # crash before the unlink
+        annos, lsu = self.reload()
+        assert [a.id for a in annos] == [a.id for a in self.annos]
+        assert lsu == timestamp(300)
@@ -0,0 +1,136 @@
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+from pathlib import Path
+from hyputils import hypothesis as hyp
+from hyputils.hypothesis import Memoizer, HypothesisAnnotation
+from .common.corpus import make_rows
+
+
+class SlowMemoizer(Memoizer):
+    """ pretends to fetch rows from the api until told to finish """
+
+    def __init__(self, *args, rows=(), **kwargs):
+        super().__init__(*args, **kwargs)
+        self.rows = rows
+        self.started = threading.Event()
+        self.finish = threading.Event()
+
+    def yield_from_api(self, search_after=None, stop_at=None, **kwargs):
+        self.started.set()
+        self.finish.wait(10)
+        yield from self.rows
+
+
+class NoApiMemoizer(Memoizer):
+    def yield_from_api(self, *args, **kwargs):
+        raise AssertionError('waiting readers should not hit the api')
+
+
+@unittest.skipIf(hyp.fcntl is None, 'no fcntl')
+class TestLockWait(unittest.TestCase):
+    def setUp(self):
+        self.folder = Path(tempfile.mkdtemp())
+        self.memfile = self.folder / 'annos.json'
+        rows = make_rows(30)
+        self.old, self.new = rows[:20], rows[20:]
+        self.writer = SlowMemoizer(self.memfile, group='__world__', rows=self.new)
+        self.writer.memoize_annos([HypothesisAnnotation(r) for r in self.old])
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    def start_writer(self):
+        annos, _ = self.writer.get_annos_from_file()
+        thread = threading.Thread(target=self.writer.update_annos_from_api, args=(annos,))
+        thread.start()
+        assert self.writer.started.wait(5)
+        return thread
+
+    def test_waiters_wake_with_new_annos(self):
+        thread = self.start_writer()
+        seen, results = [], []
+
+        def read():
+            reader = NoApiMemoizer(self.memfile, group='__world__', on_update=seen.append)
+            annos, _ = reader.get_annos_from_file()
+            results.append((reader.update_annos_from_api(annos), annos))
+
+        readers = [threading.Thread(target=read) for _ in range(3)]
+        for r in readers:
+            r.start()
+
+        time.sleep(0.2)
+        assert not results  # still blocked on the writer
+        released = time.monotonic()
+        self.writer.finish.set()
+        for r in readers:
+            r.join(5)
+
+        assert time.monotonic() - released < 1  # no second long sleep
+        thread.join(5)
+        expect = [r['id'] for r in self.new]
+        assert len(results) == 3 and len(seen) == 3
+        for new_annos, annos in results:
+            assert [a.id for a in new_annos] == expect
+            assert len(annos) == 30
+
+        assert [a.id for a in seen[0]] == expect
+        assert not self.writer._lock_folder.exists()
+
+    def test_writer_before_folder(self):
+        """ the writer holds the lock file but has not made the folder yet """
+        lock = self.writer._lock_file
+        self.writer._touch_private(lock)
+        results = []
+
+        def read():
+            reader = NoApiMemoizer(self.memfile, group='__world__')
+            annos, _ = reader.get_annos_from_file()
+            results.append(reader.update_annos_from_api(annos))
+
+        with open(lock, 'rb') as f:
+            hyp.fcntl.flock(f.fileno(), hyp.fcntl.LOCK_EX)
+            thread = threading.Thread(target=read)
+            thread.start()
+            time.sleep(0.2)
+            assert not results  # blocked on the lock file not the folder
+            self.writer.memoize_annos([HypothesisAnnotation(r) for r in self.old + self.new])
+            hyp.fcntl.flock(f.fileno(), hyp.fcntl.LOCK_UN)
+
+        thread.join(5)
+        assert [a.id for a in results[0]] == [r['id'] for r in self.new]
+
+    def test_flock_timeout(self):
+        lock = self.writer._lock_file
+        self.writer._touch_private(lock)
+        with open(lock, 'rb') as held, open(lock, 'rb') as f:
+            hyp.fcntl.flock(held.fileno(), hyp.fcntl.LOCK_EX)
+            threads = set(threading.enumerate())
+            start = time.monotonic()
+            assert not hyp._flock(f.fileno(), hyp.fcntl.LOCK_SH, 0.1)
+            assert 0.1 <= time.monotonic() - start < 0.5
+            assert not set(threading.enumerate()) - threads  # no helper thread
+            hyp.fcntl.flock(held.fileno(), hyp.fcntl.LOCK_UN)
+            assert hyp._flock(f.fileno(), hyp.fcntl.LOCK_SH, 0.1)
+
+    def test_timeout(self):
+        thread = self.start_writer()
+        try:
+            reader = NoApiMemoizer(self.memfile, group='__world__', lock_timeout=0.2)
+            annos, _ = reader.get_annos_from_file()
+            with self.assertRaises(TimeoutError):
+                reader.update_annos_from_api(annos)
+        finally:
+            self.writer.finish.set()
+            thread.join(5)
+
+    def test_stale_folder_is_taken_over(self):
+        self.writer._lock_folder.mkdir()  # no lock-pid and nobody holding the lock
+        self.writer.finish.set()
+        annos, _ = self.writer.get_annos_from_file()
+        new_annos = self.writer.update_annos_from_api(annos)
+        assert [a.id for a in new_annos] == [r['id'] for r in self.new]
+        assert not self.writer._lock_folder.exists()
@@ -0,0 +1,107 @@
+import shutil
+import tempfile
+import time
+import unittest
+from pathlib import Path
+import pytest
+from hyputils.hypothesis import AnnoFetcher, Memoizer, HypothesisUtils
+from hyputils.retry import RetryPolicy
+from hyputils.handlers import annotationSyncHandler
+from hyputils.subscribe import AnnotationStream, preFilter
+from .common.corpus import make_row
+
+pytest.importorskip('aiohttp')
+
+
+@pytest.mark.usefixtures('mock_hypothesis_class')
+class TestMockRest(unittest.TestCase):
+    def fetcher(self, cls=AnnoFetcher, *args, **kwargs):
+        return cls(*args, api_token='TOKEN', username='tgbugstest', group='__world__',
+                   domain=self.server.domain, scheme='http', **kwargs)
+
+    def test_search_after(self):
+        get = self.fetcher()
+        annos = get.get_annos_from_api()
+        assert [a.id for a in annos] == [r['id'] for r in self.server.rows]
+        after = get.get_annos_from_api(search_after=annos[99].updated,
+                                       stop_at=annos[100].updated)
+        assert [a.id for a in after] == [annos[100].id]
+        assert self.server.requests['GET /api/search'] > 1000 // 200
+
+    def test_desc_and_filters(self):
+        rows = self.server.rows
+        out = self.server.search({'limit': 5})
+        assert [r['id'] for r in out['rows']] == [r['id'] for r in rows[::-1][:5]]
+        uri = rows[0]['uri']
+        out = self.server.search({'uri': uri, 'tags': 'test', 'limit': 500})
+        assert out['rows'] and len(out['rows']) <= 200
+        assert all(r['uri'] == uri and 'test' in r['tags'] for r in out['rows'])
+
+    def test_crud(self):
+        h = HypothesisUtils(username='tgbugstest', token='TOKEN', group='__world__',
+                            domain=self.server.domain, scheme='http')
+        r = h.post_annotation({'uri': 'https://example.org/new', 'text': 'hello'})
+        row = r.json()
+        assert self.server.rows[-1]['id'] == row['id']
+        h.patch_annotation(row['id'], {'text': 'edited'})
+        assert h.get_annotation(row['id']).json()['text'] == 'edited'
+        h.delete_annotation(row['id'])
+        assert h.head_annotation(row['id']).status_code == 404
+
+    def test_error_injection(self):
+        self.server.fail_next(2, status=503)
+        h = HypothesisUtils(username='tgbugstest', token='TOKEN', group='__world__',
+                            domain=self.server.domain, scheme='http',
+                            retry=RetryPolicy(backoff=0.01))
+        rows = list(h.search_all({'group': '__world__', 'order': 'asc'}, max_results=10))
+        assert len(rows) == 10
+        assert self.server.requests['GET /api/search'] == 3
+
+    def test_memoizer(self):
+        folder = Path(tempfile.mkdtemp())
+        try:
+            mem = self.fetcher(Memoizer, folder / 'annos.json')
+            annos = mem.get_annos()
+            assert len(annos) == 1000
+            new = self.server.push('create', make_row(text='later'))
+            annos = mem.get_annos()
+            assert len(annos) == 1001 and annos[-1].id == new['id']
+        finally:
+            shutil.rmtree(folder)
+
+
+@pytest.mark.usefixtures('mock_hypothesis_class')
+class TestMockWebsocket(unittest.TestCase):
+    def wait(self, condition, timeout=5):
+        end = time.monotonic() + timeout
+        while not condition():
+            if time.monotonic() > end:
+                raise AssertionError('timed out')
+            time.sleep(0.01)
+
+    def test_stream_and_reconnect(self):
+        folder = Path(tempfile.mkdtemp())
+        try:
+            mem = Memoizer(folder / 'annos.json', api_token='TOKEN', username='tgbugstest',
+                           group='__world__', domain=self.server.domain, scheme='http')
+            annos = mem.get_annos()
+            prefilter = preFilter(groups=['__world__']).export()
+            stream = AnnotationStream(annos, prefilter, annotationSyncHandler, memoizer=mem,
+                                      websocket_endpoint=self.server.ws_url)
+            thread, exit_loop = stream()
+            thread.start()
+            try:
+                self.wait(lambda: self.server.subscribers() == 1)
+                live = self.server.push('create', make_row(text='live'))
+                self.wait(lambda: annos[-1].id == live['id'])
+
+                missed = self.server.push('create', make_row(text='missed'), notify=False)
+                self.server.disconnect_all()
+                self.wait(lambda: annos[-1].id == missed['id'])  # backfilled on reconnect
+                assert len(annos) == 1002
+                assert len({a.id for a in annos}) == 1002
+            finally:
+                exit_loop()
+                thread.join(5)
+        finally:
+            shutil.rmtree(folder)
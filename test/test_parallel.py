@@ -0,0 +1,83 @@
+import threading
+import unittest
+from urllib.parse import urlparse, parse_qs
+from hyputils.hypothesis import AnnoFetcher, NotOkError
+from .common.corpus import make_rows, timestamp
+from .common.fakeapi import FakeHypothesisUtils, FakeResponse
+
+
+class Unauthorized(FakeHypothesisUtils):
+    def _send(self, method, url, data=None, **kwargs):
+        return FakeResponse({'status': 'failure', 'reason': 'bad token'}, 401)
+
+
+class Gated(FakeHypothesisUtils):
+    """ pages after gate_after wait until the gate is opened """
+
+    def __init__(self, rows, gate_after, **kwargs):
+        super().__init__(rows, **kwargs)
+        self.gate_after = gate_after
+        self.gate = threading.Event()
+        self.timed_out = False
+
+    def _send(self, method, url, data=None, **kwargs):
+        after = parse_qs(urlparse(url).query).get('search_after', [None])[0]
+        if after is not None and after >= self.gate_after and not self.gate.wait(5):
+            self.timed_out = True
+
+        return super()._send(method, url, data=data, **kwargs)
+
+
+class TestParallelFetch(unittest.TestCase):
+    def setUp(self):
+        self.rows = make_rows(1000)
+        self.fetcher = AnnoFetcher('TOKEN', 'tgbugstest', '__world__', workers=4)
+        self.fetcher._h = FakeHypothesisUtils(self.rows)
+
+    def ids(self, rows):
+        return [r['id'] for r in rows]
+
+    def test_full(self):
+        rows = list(self.fetcher.yield_from_api(max_results=None))
+        assert self.ids(rows) == self.ids(self.rows)
+
+    def test_search_after_stop_at(self):
+        rows = list(self.fetcher.yield_from_api(search_after=self.rows[99]['updated'],
+                                                stop_at=self.rows[899]['updated']))
+        assert self.ids(rows) == self.ids(self.rows[100:900])
+
+    def test_matches_sequential(self):
+        after = self.rows[10]['updated']
+        parallel = list(self.fetcher.yield_from_api(search_after=after))
+        sequential = list(self.fetcher.yield_from_api(search_after=after, workers=1))
+        assert parallel == sequential
+
+    def test_updated_during_sync(self):
+        moved = dict(self.rows[5], updated=timestamp(5000), text='newer')
+        self.fetcher._h.rows = self.rows + [moved]
+        rows = list(self.fetcher.yield_from_api())
+        assert len(rows) == 1001  # the newer version comes again at the end
+        assert rows[-1] == moved
+        assert [r['updated'] for r in rows] == sorted(r['updated'] for r in rows)
+
+    def test_streams_windows(self):
+        self.fetcher._h = Gated(self.rows, self.rows[500]['updated'])
+        gen = self.fetcher.yield_from_api()
+        try:
+            assert next(gen) == self.rows[0]  # before the later windows are done
+            assert not self.fetcher._h.timed_out
+        finally:
+            self.fetcher._h.gate.set()
+
+        assert self.ids([self.rows[0]] + list(gen)) == self.ids(self.rows)
+
+    def test_failed_bounds_raise(self):
+        for workers in (4, 1):
+            fetcher = AnnoFetcher('TOKEN', 'tgbugstest', '__world__', workers=workers)
+            fetcher._h = Unauthorized(self.rows)
+            with self.assertRaises(NotOkError):
+                list(fetcher.yield_from_api())
+
+    def test_empty(self):
+        self.fetcher._h.rows = []
+        assert list(self.fetcher.yield_from_api()) == []
@@ -0,0 +1,84 @@
+import unittest
+from hyputils.hypothesis import AnnotationPool, HypothesisAnnotation
+from .common.corpus import make_row, make_rows, timestamp
+
+
+def anno(**kwargs):
+    return HypothesisAnnotation(make_row(**kwargs))
+
+
+class TestAnnotationPool(unittest.TestCase):
+    def setUp(self):
+        self.annos = [HypothesisAnnotation(r) for r in make_rows(100)]
+        self.pool = AnnotationPool(self.annos)
+
+    def ids(self, annos):
+        return sorted(a.id for a in annos)
+
+    def test_lookups_match_scans(self):
+        for tags in (('test',), ('PROTCUR:a', 'test'), ('nope',)):
+            expect = [a for a in self.annos if set(tags) <= set(a.tags)]
+            assert self.ids(self.pool.byTags(*tags)) == self.ids(expect)
+
+        uri = self.annos[0].uri
+        expect = [a for a in self.annos if a.uri == uri]
+        assert self.ids(self.pool.byUri(uri.replace('https', 'http'))) == self.ids(expect)
+        assert len(list(self.pool.byUri('https://example.org/', prefix=True))) == 100
+        assert len(self.pool.byUser('tgbugstest')) == 100
+        assert len(self.pool.byType('annotation')) == 100
+        assert self.pool.byGroup('other') == []
+
+    def test_update_moves_indexes(self):
+        old = self.annos[5]
+        new = HypothesisAnnotation(dict(old._row, tags=['moved'],
+                                        uri='https://example.org/new',
+                                        updated=timestamp(1000)))
+        self.pool.update(new)
+        assert len(self.pool) == 100
+        assert self.pool.byId(old.id) is new
+        assert self.ids(self.pool.byTags('moved')) == [old.id]
+        assert [a.id for a in self.pool.byUri('https://example.org/new')] == [old.id]
+        for tag in old.tags:
+            assert old.id not in [a.id for a in self.pool.byTags(tag)]
+
+    def test_delete(self):
+        gone = self.annos[0]
+        assert self.pool.delete(gone.id) is gone
+        assert self.pool.delete(gone.id) is None
+        assert gone.id not in self.pool
+        assert gone.id not in [a.id for a in self.pool.byUri(gone.uri)]
+        assert len(self.pool.byUser('tgbugstest')) == 99
+
+    def test_threads_and_orphans(self):
+        root = anno(updated=timestamp(1))
+        child = anno(references=[root.id], updated=timestamp(2))
+        grandchild = anno(references=[root.id, child.id], updated=timestamp(3))
+        pool = AnnotationPool()
+        pool.add([grandchild])  # arrives before its parents, no KeyError
+        assert list(pool.orphans()) == [grandchild]
+        pool.add([child])
+        assert list(pool.orphans()) == [child]
+        pool.add([root])
+        assert list(pool.orphans()) == []
+        assert pool._annos == [grandchild, child, root]  # compatibility
+        assert [a.id for a in pool.thread(grandchild.id)][0] == root.id
+        assert self.ids(pool.thread(root.id)) == self.ids([root, child, grandchild])
+        assert self.ids(pool.replies(root.id)) == self.ids([child, grandchild])
+        assert grandchild.parent(pool) is child
+
+        pool.delete(child.id)
+        assert list(pool.orphans()) == [grandchild]
+        assert [a.id for a in pool.replies(child.id)] == [grandchild.id]
+
+    def test_indexes_are_lazy(self):
+        pool = AnnotationPool(self.annos)
+        assert not pool._indexed
+        pool.update(anno(tags=['early']))  # before the first query
+        pool.delete(self.annos[1].id)
+        assert pool.byId(self.annos[0].id) is self.annos[0]
+        assert not pool._indexed
+        assert [a.tags for a in pool.byTags('early')] == [['early']]
+        assert pool._indexed
+        assert len(pool.byUser('tgbugstest')) == 100
+        pool.update(anno(tags=['late']))
+        assert len(pool.byTags('late')) == 1
@@ -0,0 +1,68 @@
+import io
+import json
+import shutil
+import tempfile
+import unittest
+from pathlib import Path
+from hyputils.hypothesis import AnnoReader, _JsonArrayStream
+from .common.corpus import make_rows
+
+
+class TestStreamingReader(unittest.TestCase):
+    def setUp(self):
+        self.folder = Path(tempfile.mkdtemp())
+        self.memfile = self.folder / 'annos.json'
+        self.reader = AnnoReader(self.memfile, '__world__')
+        self.rows = make_rows(50)
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    def write(self, obj, **kwargs):
+        with open(self.memfile, 'wt') as f:
+            json.dump(obj, f, **kwargs)
+
+    def test_lsu_layout(self):
+        self.write([self.rows, 'some-lsu'], indent=2)
+        annos, lsu = self.reader.get_annos_from_file()
+        assert [a.id for a in annos] == [r['id'] for r in self.rows]
+        assert lsu == 'some-lsu'
+
+    def test_bare_layout(self):
+        self.write(self.rows)
+        annos, lsu = self.reader.get_annos_from_file()
+        assert len(annos) == 50
+        assert lsu == self.rows[-1]['updated']
+
+    def test_bare_two(self):
+        # the ambiguous case for the old loader
+        self.write(self.rows[:2])
+        annos, lsu = self.reader.get_annos_from_file()
+        assert len(annos) == 2
+        assert lsu == self.rows[1]['updated']
+
+    def test_empty(self):
+        self.write([[], None])
+        assert self.reader.get_annos_from_file() == ([], None)
+        self.write([])
+        assert self.reader.get_annos_from_file() == ([], None)
+        self.memfile.write_text('')
+        assert self.reader.get_annos_from_file() == ([], None)
+
+    def test_corrupt(self):
+        self.memfile.write_text(json.dumps([self.rows, 'lsu'])[:-100])
+        assert self.reader.get_annos_from_file() == ([], None)
+
+    def test_small_chunks(self):
+        text = json.dumps([self.rows, 'lsu'])
+        stream = _JsonArrayStream(io.StringIO(text), chunk_size=7)
+        stream.expect('[')
+        rows = list(stream.members())
+        assert rows == self.rows
+
+    def test_lazy(self):
+        self.write([self.rows, 'lsu'])
+        gen = self.reader.yield_annos_from_file()
+        first = next(gen)
+        assert first.id == self.rows[0]['id']
+        gen.close()
@@ -0,0 +1,358 @@
+import random
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from hyputils.hypothesis import (HypothesisHelper, HelperRegistry, norm,
+                                 HypothesisAnnotation, AnnoList)
+from .common.corpus import make_row, make_rows, timestamp
+
+
+class Helper(HypothesisHelper):
+    objects = {}
+
+
+def populate(registry):
+    Bound = registry.bind(Helper)
+    return [Bound(a, registry.annos) for a in registry.annos]
+
+
+class TestHelperRegistry(unittest.TestCase):
+    def setUp(self):
+        self.world = HelperRegistry([HypothesisAnnotation(r) for r in make_rows(30)])
+        self.other = HelperRegistry([HypothesisAnnotation(r)
+                                     for r in make_rows(20, group='other', seed=1)])
+
+    def test_isolated(self):
+        populate(self.world)
+        populate(self.other)
+        World, Other = self.world[Helper], self.other[Helper]
+        assert World is not Other and World.__name__ == 'Helper'
+        assert len(list(World)) == 30 and len(list(Other)) == 20
+        assert Helper.objects == {}  # the unbound class is untouched
+        anno = self.world.annos[0]
+        assert World.byId(anno.id).id == anno.id
+        assert Other.byId(anno.id) is None
+        assert self.world.bind(Helper) is World
+
+    def test_threads(self):
+        with ThreadPoolExecutor(2) as pool:
+            results = list(pool.map(populate, (self.world, self.other)))
+
+        assert [len(r) for r in results] == [30, 20]
+        assert {h._anno.group for h in results[1]} == {'other'}
+
+    def test_tags_and_replies(self):
+        root = HypothesisAnnotation(make_row(updated=timestamp(100), tags=['RRID:AB_1']))
+        reply = HypothesisAnnotation(make_row(updated=timestamp(101), references=[root.id]))
+        self.world.annos.extend([root, reply])
+        populate(self.world)
+        World = self.world[Helper]
+        assert World.byId(reply.id).parent.id == root.id
+        assert [r.id for r in World.byId(root.id).replies] == [reply.id]
+        expect = {a.id for a in self.world.annos if 'RRID:AB_1' in a.tags}
+        assert {h.id for h in World.byTags('RRID:AB_1')} == expect
+
+    def test_update_and_delete(self):
+        populate(self.world)
+        World = self.world[Helper]
+        old = self.world.annos[3]
+        new = HypothesisAnnotation(dict(old._row, text='changed', updated=timestamp(500)))
+        h = World(new, [new])  # a different list only syncs the one annotation
+        assert h is World.byId(old.id) and h.text == 'changed'
+        assert self.world.annos[-1] is new and len(self.world.annos) == 30
+
+        class Deleted:
+            deleted = True
+            id = old.id
+
+        assert World(Deleted(), self.world.annos) is None
+        assert old.id not in World.objects
+        assert self.world.annos.byId(old.id) is None
+
+    def test_reset(self):
+        populate(self.world)
+        World = self.world[Helper]
+        World.reset()
+        assert list(World) == [] and len(self.world.annos) == 30
+        assert isinstance(self.world.annos, AnnoList)
+
+
+class Depth(HypothesisHelper):
+    """ reads state that __init__ sets on the parent """
+    objects = {}
+
+    def __init__(self, anno, annos):
+        super().__init__(anno, annos)
+        parent = self.parent
+        self.depth = 0 if parent is None else parent.depth + 1
+
+
+class TestFromAnnos(unittest.TestCase):
+    def setUp(self):
+        rows = make_rows(40)
+        for i in range(1, 40, 3):  # replies to the row before, some newer than their parent
+            rows[i]['references'] = [rows[i - 1]['id']]
+            rows[i]['target'] = [{'source': rows[i]['uri']}]
+
+        rows.append(make_row(updated=timestamp(99), references=['gone']))
+        self.annos = [HypothesisAnnotation(r) for r in rows]
+
+    def compare(self, Slow, Fast):
+        for h in Fast.objects.values():
+            s = Slow.byId(h.id)
+            assert (s.parent and s.parent.id) == (h.parent and h.parent.id)
+            assert {r.id for r in s.replies} == {r.id for r in h.replies}
+
+        assert {h.id for h in Slow.orphans} == {h.id for h in Fast.orphans}
+        # the old class attributes are still readable from both
+        assert Fast._orphanedReplies == {self.annos[-1].id}
+        parent = Fast.byId(self.annos[0].id)
+        assert parent._replies[parent.id] == set(parent.replies)
+        assert {k: {h.id for h in v} for k, v in Slow._replies.items()} == \
+            {k: {h.id for h in v} for k, v in Fast._replies.items()}
+
+    def test_bulk_matches_per_call(self):
+        slow = HelperRegistry(self.annos)
+        Slow = slow.bind(Helper)
+        [Slow(a, slow.annos) for a in slow.annos]
+        fast = HelperRegistry(self.annos)
+        Fast = fast.bind(Helper)
+        helpers = Fast.fromAnnos(fast.annos[::-1])  # replies before parents
+        assert [h.id for h in helpers] == [a.id for a in fast.annos]
+        assert len(Fast.objects) == 41 and Fast._done_loading
+        self.compare(Slow, Fast)
+
+    def test_parents_initialized_first(self):
+        rows = make_rows(60)
+        rng = random.Random(0)
+        for i, row in enumerate(rows[1:], 1):  # threads several levels deep
+            if rng.random() < 0.7:
+                parent = rows[rng.randrange(i)]
+                row['references'] = parent.get('references', []) + [parent['id']]
+
+        rng.shuffle(rows)
+        registry = HelperRegistry([HypothesisAnnotation(r) for r in rows])
+        Deep = registry.bind(Depth)
+        Deep.fromAnnos(registry.annos)
+        for anno in registry.annos:
+            assert Deep.byId(anno.id).depth == len(anno.references)
+
+    def test_unbound(self):
+        class Unbound(HypothesisHelper):
+            objects = {}
+            _tagIndex = {}
+
+        try:
+            Unbound.reset(reset_annos_dict=True)
+            helpers = Unbound.fromAnnos(self.annos)
+            assert len(helpers) == len(Unbound.objects) == 41
+            assert Unbound.byId(self.annos[1].id).parent.id == self.annos[0].id
+            assert [h.id for h in Unbound.orphans] == [self.annos[-1].id]
+        finally:
+            Unbound.reset(reset_annos_dict=True)
+
+
+class TestTagIndex(unittest.TestCase):
+    def setUp(self):
+        self.registry = HelperRegistry([HypothesisAnnotation(r) for r in make_rows(60)])
+        self.Helper = self.registry.bind(Helper)
+        self.Helper.fromAnnos(self.registry.annos)
+
+    def expect(self, *tags):
+        return sorted(a.id for a in self.registry.annos if set(tags) <= set(a.tags))
+
+    def ids(self, helpers):
+        return sorted(h.id for h in helpers)
+
+    def test_by_tags(self):
+        assert self.ids(self.Helper.byTags('test')) == self.expect('test')
+        assert self.ids(self.Helper.byTags('test', 'PROTCUR:a')) == self.expect('test', 'PROTCUR:a')
+        assert self.Helper.byTags('missing') == []
+
+    def test_prefix(self):
+        assert self.Helper.tagsWithPrefix('PROTCUR:') == ['PROTCUR:a', 'PROTCUR:b']
+        expect = sorted(a.id for a in self.registry.annos
+                        if any(t.startswith('PROTCUR:') for t in a.tags))
+        assert self.ids(self.Helper.byTagPrefix('PROTCUR:')) == expect
+
+    def test_live_updates(self):
+        self.Helper.byTags('test')  # index is live from here on
+        old = self.registry.annos[0]
+        new = HypothesisAnnotation(dict(old._row, tags=['PROTCUR:new'], updated=timestamp(900)))
+        self.Helper(new, self.registry.annos)
+        assert self.ids(self.Helper.byTags('PROTCUR:new')) == [old.id]
+        assert old.id not in self.ids(self.Helper.byTagPrefix('RRID:'))
+        created = HypothesisAnnotation(make_row(tags=['fresh'], updated=timestamp(901)))
+        self.Helper(created, self.registry.annos)
+        assert self.ids(self.Helper.byTags('fresh')) == [created.id]
+
+        class Deleted:
+            deleted = True
+            id = created.id
+
+        self.Helper(Deleted(), self.registry.annos)
+        assert self.Helper.byTags('fresh') == []
+        assert 'fresh' not in self.Helper.tagsWithPrefix('')
+        assert self.ids(self.Helper.byTags('test')) == self.expect('test')
+
+
+class TestUriIndex(unittest.TestCase):
+    def setUp(self):
+        rows = make_rows(80)
+        rows[0]['uri'] = 'https://via.hypothes.is/http://example.org/paper/1'
+        self.registry = HelperRegistry([HypothesisAnnotation(r) for r in rows])
+        self.Helper = self.registry.bind(Helper)
+        self.Helper.fromAnnos(self.registry.annos)
+
+    def scan(self, iri, prefix=False):
+        n = norm(iri)
+        return sorted(a.id for a in self.registry.annos
+                      if norm(a.uri) == n or prefix and norm(a.uri).startswith(n))
+
+    def ids(self, helpers):
+        return sorted(h.id for h in helpers)
+
+    def test_exact_and_prefix(self):
+        for iri in ('http://example.org/paper/1', 'https://example.org/paper/2', 'nope'):
+            assert self.ids(self.Helper.byIri(iri)) == self.scan(iri)
+
+        for iri in ('https://example.org/paper/', 'http://example.org/paper/1', 'https://'):
+            assert self.ids(self.Helper.byIri(iri, prefix=True)) == self.scan(iri, True)
+
+    def test_update_and_delete(self):
+        old = self.registry.annos[5]
+        new = HypothesisAnnotation(dict(old._row, uri='https://moved.org/x',
+                                        updated=timestamp(900)))
+        self.Helper(new, self.registry.annos)
+        assert self.ids(self.Helper.byIri('https://moved.org/x')) == [old.id]
+        assert old.id not in self.ids(self.Helper.byIri(old.uri))
+
+        class Deleted:
+            deleted = True
+            id = old.id
+
+        self.Helper(Deleted(), self.registry.annos)
+        assert list(self.Helper.byIri('https://moved.org/', prefix=True)) == []
+
+
+class Workflow(HypothesisHelper):
+    namespace = 'PROTCUR'
+    prefix_ast = 'PROTCUR:'
+
+
+class TestUriTags(unittest.TestCase):
+    def setUp(self):
+        self.registry = HelperRegistry([HypothesisAnnotation(r) for r in make_rows(60)])
+        self.Helper = self.registry.bind(Helper)
+        self.Workflow = self.registry.bind(Workflow)
+        self.Helper.fromAnnos(self.registry.annos)
+        self.Workflow.fromAnnos(self.registry.annos)
+
+    def check(self):
+        expect, namespaced = {}, set()
+        for a in self.registry.annos:
+            expect.setdefault(a.uri, set()).update(a.tags)
+            if any(t.startswith('PROTCUR:') for t in a.tags):
+                namespaced.add(a.uri)
+
+        assert self.Helper.uri_tags == expect
+        assert self.Helper.uris == set(expect)
+        assert self.Workflow.uris == namespaced
+
+    def test_build(self):
+        self.check()
+
+    def test_update_and_delete(self):
+        for i, anno in enumerate(list(self.registry.annos)[:20]):
+            new = HypothesisAnnotation(dict(anno._row, tags=['other'],
+                                            uri='https://example.org/moved',
+                                            updated=timestamp(1000 + i)))
+            self.Helper(new, self.registry.annos)
+            self.Workflow(new, self.registry.annos)
+
+        self.check()
+
+        class Deleted:
+            deleted = True
+
+        for anno in list(self.registry.annos)[:30]:
+            gone = Deleted()
+            gone.id = anno.id
+            self.Helper(gone, self.registry.annos)
+            self.Workflow(gone, self.registry.annos)
+
+        self.check()
+
+
+class TestSiblingClasses(unittest.TestCase):
+    """ unbound subclasses of HypothesisHelper each keep their own indexes """
+
+    def setUp(self):
+        class Plain(HypothesisHelper):
+            objects = {}
+            _tagIndex = {}
+
+        class Flow(HypothesisHelper):
+            objects = {}
+            _tagIndex = {}
+            namespace = 'PROTCUR'
+            prefix_ast = 'PROTCUR:'
+
+        self.classes = Plain, Flow
+        self.annos = [HypothesisAnnotation(r) for r in make_rows(40)]
+        for cls in self.classes:  # no reset, that would hide shared state
+            cls.fromAnnos(self.annos)
+
+    def tearDown(self):
+        for cls in self.classes:
+            cls.reset(reset_annos_dict=True)
+
+    def test_tag_prefix(self):
+        expect = sorted({t for a in self.annos for t in a.tags if t.startswith('PROTCUR:')})
+        n = len([a for a in self.annos if any(t.startswith('PROTCUR:') for t in a.tags)])
+        for cls in self.classes:
+            cls.byTags('test')  # both indexes are live before either is checked
+
+        for cls in self.classes:
+            assert cls.tagsWithPrefix('PROTCUR:') == expect
+            helpers = cls.byTagPrefix('PROTCUR:')
+            assert len(helpers) == n and {type(h) for h in helpers} == {cls}
+
+    def test_by_iri(self):
+        uri = self.annos[0].uri
+        expect = sorted(a.id for a in self.annos if a.uri == uri)
+        for cls in self.classes:
+            helpers = list(cls.byIri(uri))
+            assert sorted(h.id for h in helpers) == expect
+            assert {type(h) for h in helpers} == {cls}
+            assert len(list(cls.byIri('https://example.org/', prefix=True))) == 40
+
+    def test_uri_tags(self):
+        Plain, Flow = self.classes
+        expect = {}
+        for a in self.annos:
+            expect.setdefault(a.uri, set()).update(a.tags)
+
+        assert not Plain._uriTagsLive  # built on first read
+        for cls in self.classes:
+            assert cls.uri_tags == expect
+
+        assert Plain.uris == set(expect)
+        assert Flow.uris == {uri for uri, tags in expect.items()
+                             if any(t.startswith('PROTCUR:') for t in tags)}
+        new = HypothesisAnnotation(make_row(uri='https://example.org/new', tags=['PROTCUR:new'],
+                                            updated=timestamp(100)))
+        self.annos.append(new)
+        Plain(new, self.annos)  # kept up to date once built
+        assert Plain.uri_tags[new.uri] == {'PROTCUR:new'}
+        assert new.uri not in Flow.uri_tags and new.uri not in Flow.uris
+
+    def test_uri_tags_copies(self):
+        Plain, Flow = self.classes
+        uri = self.annos[0].uri
+        uri_tags, uris = Plain.uri_tags, Flow.uris
+        uri_tags[uri].add('mutated')
+        uri_tags.pop(uri)
+        uris.clear()
+        assert uri in Plain.uri_tags and 'mutated' not in Plain.uri_tags[uri]
+        assert Flow.uris and type(Flow.uris) is set
+        assert type(Plain.uri_tags[uri]) is set
@@ -0,0 +1,71 @@
+import unittest
+from email.utils import format_datetime
+from datetime import datetime, timedelta, timezone
+import pytest
+import requests
+from hyputils.retry import RetryPolicy, TokenBucket
+from .common.corpus import make_rows
+from .common.fakeapi import FakeHypothesisUtils, FakeResponse
+
+
+class TestRetryPolicy(unittest.TestCase):
+    def test_delay(self):
+        policy = RetryPolicy(backoff=1, max_backoff=10, jitter=False)
+        assert [policy.delay(a) for a in range(5)] == [1, 2, 4, 8, 10]
+        jittery = RetryPolicy(backoff=1, max_backoff=10)
+        assert all(0 <= jittery.delay(3) <= 8 for _ in range(100))
+
+    def test_retry_after(self):
+        policy = RetryPolicy()
+        assert policy.delay(0, '7') == 7
+        later = datetime.now(timezone.utc) + timedelta(seconds=30)
+        assert 25 < policy.delay(0, format_datetime(later, usegmt=True)) <= 30
+        assert policy.parse_retry_after('garbage') is None
+
+    def test_idempotent(self):
+        policy = RetryPolicy(retries=2)
+        assert policy.retry_status(502, 0)
+        assert not policy.retry_status(502, 0, idempotent=False)
+        assert policy.retry_status(429, 1, idempotent=False)
+        assert not policy.retry_status(429, 2)
+        error = requests.exceptions.ConnectionError()
+        assert policy.retry_exception(error, 0)
+        assert not policy.retry_exception(error, 0, idempotent=False)
+
+
+class TestTokenBucket(unittest.TestCase):
+    def test_reserve(self):
+        bucket = TokenBucket(rate=10, burst=2)
+        assert bucket.reserve() == 0
+        assert bucket.reserve() == 0
+        assert 0.05 < bucket.reserve() <= 0.1
+        assert 0.15 < bucket.reserve() <= 0.2
+
+
+class TestSearchRetry(unittest.TestCase):
+    def test_no_silent_truncation(self):
+        rows = make_rows(50)
+        h = FakeHypothesisUtils(rows, limit=10, retry=RetryPolicy(retries=1, backoff=0))
+        send = h._send
+        h._send = lambda method, url, **kwargs: (FakeResponse({}, 500)
+                                                 if h.queries >= 3 else
+                                                 send(method, url, **kwargs))
+        params = {'order': 'asc', 'sort': 'updated', 'group': '__world__'}
+        with pytest.raises(Exception):
+            list(h.search_all(params))
+
+    def test_recovers(self):
+        rows = make_rows(50)
+        h = FakeHypothesisUtils(rows, limit=10, retry=RetryPolicy(backoff=0))
+        send = h._send
+        calls = []
+
+        def flaky(method, url, **kwargs):
+            calls.append(url)
+            if len(calls) % 2:
+                raise requests.exceptions.ConnectionError('reset')
+            return send(method, url, **kwargs)
+
+        h._send = flaky
+        params = {'order': 'asc', 'sort': 'updated', 'group': '__world__'}
+        assert list(h.search_all(params)) == rows
@@ -0,0 +1,50 @@
+import unittest
+from .common.corpus import make_rows
+from .common.fakeapi import FakeHypothesisUtils
+
+
+class Boom(Exception):
+    pass
+
+
+class TestSearchAll(unittest.TestCase):
+    def setUp(self):
+        self.rows = make_rows(95)
+        self.h = FakeHypothesisUtils(self.rows, limit=10)
+        self.params = {'order': 'asc', 'sort': 'updated', 'group': '__world__'}
+
+    def search(self, **kwargs):
+        return list(self.h.search_all(dict(self.params), **kwargs))
+
+    def test_prefetch_matches(self):
+        for kwargs in ({}, {'max_results': 33}, {'stop_at': self.rows[57]['updated']}):
+            assert self.search(prefetch=3, **kwargs) == self.search(prefetch=0, **kwargs)
+
+        assert self.search(prefetch=2) == self.rows
+        assert len(self.search(prefetch=2, max_results=33)) == 33
+
+    def test_prefetch_stops_early(self):
+        self.search(prefetch=2, stop_at=self.rows[15]['updated'])
+        assert self.h.queries == 2
+
+    def test_prefetch_error(self):
+        query = self.h.authenticated_api_query
+
+        def flaky(query_url=None):
+            if self.h.queries >= 3:
+                raise Boom()
+            return query(query_url)
+
+        self.h.authenticated_api_query = flaky
+        gen = self.h.search_all(dict(self.params), prefetch=2)
+        rows = []
+        with self.assertRaises(Boom):
+            for row in gen:
+                rows.append(row)
+
+        assert rows == self.rows[:30]
+
+    def test_prefetch_close(self):
+        gen = self.h.search_all(dict(self.params), prefetch=1)
+        next(gen)
+        gen.close()
@@ -0,0 +1,67 @@
+import shutil
+import tempfile
+import unittest
+from pathlib import Path
+from hyputils.hypothesis import HypothesisAnnotation
+from hyputils.store import SqliteMemoizer
+from .common.corpus import make_row, make_rows, timestamp
+
+
+class TestSqliteMemoizer(unittest.TestCase):
+    def setUp(self):
+        self.folder = Path(tempfile.mkdtemp())
+        self.dbfile = self.folder / 'annos.sqlite'
+        self.rows = make_rows(30)
+        self.mem = SqliteMemoizer(self.dbfile, group='__world__')
+        self.mem.yield_from_api = self.fake_api
+        self.annos = [HypothesisAnnotation(r) for r in self.rows[:20]]
+        self.mem.memoize_annos(self.annos)
+
+    def tearDown(self):
+        self.mem.close()
+        shutil.rmtree(self.folder)
+
+    def fake_api(self, search_after=None, limit=None, max_results=None, stop_at=None):
+        for row in self.rows:
+            if search_after is None or row['updated'] > search_after:
+                yield row
+
+    def test_roundtrip(self):
+        annos, lsu = SqliteMemoizer(self.dbfile, group='__world__').get_annos_from_file()
+        assert [a.id for a in annos] == [a.id for a in self.annos]
+        assert lsu == self.annos[-1].updated
+
+    def test_batched_changes(self):
+        new = HypothesisAnnotation(dict(self.annos[2]._row, text='edited',
+                                        updated=timestamp(500)))
+        created = HypothesisAnnotation(make_row(updated=timestamp(501)))
+        self.mem.memoize_changes([('delete', self.annos[0].id), ('update', new),
+                                  ('create', created)], self.annos)
+        annos, lsu = self.mem.get_annos_from_file()
+        assert len(annos) == 20 and lsu == timestamp(501)
+        assert self.mem.byId(self.annos[0].id) is None
+        assert self.mem.byId(new.id).text == 'edited'
+
+    def test_point_writes(self):
+        new = HypothesisAnnotation(dict(self.annos[2]._row, text='edited',
+                                        updated=timestamp(500)))
+        self.mem.update_anno(new, self.annos)
+        self.mem.del_anno(self.annos[0].id, self.annos)
+        annos, lsu = self.mem.get_annos_from_file()
+        assert len(annos) == 19
+        assert annos[-1].text == 'edited'
+
+    def test_lookups(self):
+        anno = self.annos[4]
+        assert self.mem.byId(anno.id) == anno
+        assert anno in self.mem.byUri(anno.uri)
+        for tag in anno.tags:
+            assert anno in self.mem.byTags(tag)
+
+        tagged = [a for a in self.annos if {'test', 'RRID:AB_1'} <= set(a.tags)]
+        assert sorted(a.id for a in self.mem.byTags('test', 'RRID:AB_1')) == sorted(a.id for a in tagged)
+
+    def test_get_annos_syncs(self):
+        annos = self.mem.get_annos()
+        assert [a.id for a in annos] == [r['id'] for r in self.rows]
+        assert len(self.mem.get_annos_from_file()[0]) == 30
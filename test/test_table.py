@@ -0,0 +1,87 @@
+import shutil
+import tempfile
+import unittest
+from pathlib import Path
+import pytest
+from hyputils.hypothesis import Memoizer, HypothesisAnnotation, norm
+from .common.corpus import make_row, make_rows, timestamp
+
+np = pytest.importorskip('numpy')
+from hyputils.table import AnnotationTable, timestamp_us
+
+
+class TestAnnotationTable(unittest.TestCase):
+    def setUp(self):
+        self.rows = make_rows(200)
+        self.rows.append(make_row(user='someone', updated=timestamp(500),
+                                  references=[self.rows[0]['id']]))
+        self.annos = [HypothesisAnnotation(r) for r in self.rows]
+        self.table = AnnotationTable(self.annos)
+
+    def ids(self, annos):
+        return sorted(a.id for a in annos)
+
+    def test_between(self):
+        got = self.table.between(timestamp(10), timestamp(20))
+        assert self.ids(got) == self.ids(self.annos[10:20])
+        assert len(self.table.between(start=timestamp(500))) == 1
+
+    def test_between_docstring(self):
+        # the example from the module docstring, a date with no time
+        assert len(self.table.between(start='2019-01-01')) == 0
+        assert len(self.table.between(end='2019-01-01')) == len(self.annos)
+
+    def test_timestamp_forms(self):
+        expect = 0
+        for value in ('1970-01-01',
+                      '1970-01-01T00:00',
+                      '1970-01-01T00:00:00',
+                      '1970-01-01T00:00:00Z',
+                      '1970-01-01T00:00:00+00:00',
+                      '1970-01-01T00:00:00.000000Z',
+                      '1970-01-01T01:00:00+01:00'):
+            assert timestamp_us(value) == expect, value
+
+        with self.assertRaises(ValueError):
+            timestamp_us('not a timestamp')
+
+    def test_user_type(self):
+        got = self.table.user('someone')
+        assert len(got) == 1 and got[0].type == 'reply'
+        assert self.ids(self.table.type('annotation')) == self.ids(self.annos[:200])
+
+    def test_tags(self):
+        expect = [a for a in self.annos if {'test', 'PROTCUR:a'} <= set(a.tags)]
+        assert self.ids(self.table.tag('test', 'PROTCUR:a')) == self.ids(expect)
+        expect = [a for a in self.annos if any(t.startswith('PROTCUR:') for t in a.tags)]
+        assert self.ids(self.table.tag_prefix('PROTCUR:')) == self.ids(expect)
+        assert len(self.table.tag('no-such-tag')) == 0
+
+    def test_chain_keeps_tags(self):
+        sub = self.table.between(timestamp(50)).tag('test')
+        for i, anno in enumerate(sub):
+            assert sub.tags(i) == anno.tags
+            assert anno.updated >= timestamp(50)
+
+    def test_uri(self):
+        uri = self.annos[3].uri
+        expect = [a for a in self.annos if norm(a.uri) == norm(uri)]
+        assert self.ids(self.table.uri(uri.replace('https', 'http'))) == self.ids(expect)
+        assert len(self.table.uri('https://example.org/', prefix=True)) == len(self.annos)
+
+    def test_masks_and_ids(self):
+        mask = self.table.user_mask('someone') | self.table.tag_mask('RRID:AB_1')
+        assert len(self.table[mask]) == mask.sum()
+        anno = self.annos[7]
+        assert self.table.byId(anno.id) is anno
+        assert self.table.byId('missing') is None
+
+    def test_from_memoizer(self):
+        folder = Path(tempfile.mkdtemp())
+        try:
+            mem = Memoizer(folder / 'annos.json', group='__world__')
+            mem.memoize_annos(self.annos)
+            table = AnnotationTable.from_memoizer(mem)
+            assert self.ids(table) == self.ids(self.annos)
+        finally:
+            shutil.rmtree(folder)
@@ -0,0 +1,129 @@
+import itertools
+import unittest
+from hyputils.hypothesis import (ThreadIndex, HelperRegistry, HypothesisHelper,
+                                 HypothesisAnnotation, shareLinkFromId)
+from .common.corpus import make_row, timestamp
+
+# a -> b -> c -> d and a -> e, references are root first
+threads = {'a': (), 'b': ('a',), 'c': ('a', 'b'), 'd': ('a', 'b', 'c'), 'e': ('a',)}
+
+
+class TestThreadIndex(unittest.TestCase):
+    def build(self, order):
+        index = ThreadIndex()
+        for id_ in order:
+            index.add(id_, threads[id_])
+
+        return index
+
+    def test_any_order(self):
+        for order in itertools.permutations(threads):
+            index = self.build(order)
+            assert [index.parent(i) for i in 'abcde'] == [None, 'a', 'b', 'c', 'a'], order
+            assert sorted(index.children('a')) == ['b', 'e']
+            assert index.orphans() == ()
+            assert list(index.descendants('a')) in (list('bcde'), list('ebcd'))
+
+    def test_extend_matches_add(self):
+        for order in itertools.permutations(threads):
+            for split in (0, 2, 5):
+                index = self.build(order[:split])
+                index.extend((id_, threads[id_]) for id_ in order[split:])
+                expect = self.build(order)
+                for id_ in threads:
+                    assert index.parent(id_) == expect.parent(id_), (order, split)
+                    assert sorted(index.children(id_)) == sorted(expect.children(id_))
+
+                assert sorted(index.orphans()) == sorted(expect.orphans())
+
+        index = self.build('acd')
+        index.extend([('b', threads['b']), ('c', threads['c'])])
+        assert index.parent('c') == 'b' and index.orphans() == ()
+
+    def test_missing_and_removed(self):
+        index = self.build('acd')
+        assert index.parent('c') == 'a' and index.orphans() == ('c',)
+        assert index.top('d') == 'a' and index.root('d') == 'a' and index.depth('d') == 3
+        index.add('b', threads['b'])
+        assert index.parent('c') == 'b' and index.orphans() == ()
+        index.remove('b')
+        assert index.parent('c') == 'a' and index.orphans() == ('c',)
+        assert index.children('a') == ('c',)
+        index.remove('a')
+        assert index.parent('c') is None and index.top('d') == 'c'
+        index.add('b', threads['b'])
+        assert index.parent('c') == 'b' and index.orphans() == ('b',)
+
+
+class Helper(HypothesisHelper):
+    objects = {}
+
+
+class TestHelperThreads(unittest.TestCase):
+    def setUp(self):
+        rows = {}
+        for i, (id_, refs) in enumerate(threads.items()):
+            rows[id_] = make_row(id=id_ * 22, updated=timestamp(i),
+                                 references=[r * 22 for r in refs])
+
+        self.rows = rows
+        self.registry = HelperRegistry([HypothesisAnnotation(r) for r in rows.values()])
+        self.Helper = self.registry.bind(Helper)
+
+    def test_per_call_newest_first(self):
+        annos = self.registry.annos
+        [self.Helper(a, annos) for a in reversed(list(annos))]
+        h = self.Helper.byId('d' * 22)
+        assert h.parent.id == 'c' * 22
+        assert h.shareLink == shareLinkFromId('a' * 22)
+        root = self.Helper.byId('a' * 22)
+        assert {r.id for r in root.replies} == {'b' * 22, 'e' * 22}
+        assert len(list(root.descendants())) == 4
+
+    def test_delete_middle(self):
+        self.Helper.fromAnnos(self.registry.annos)
+
+        class Deleted:
+            deleted = True
+            id = 'b' * 22
+
+        self.Helper(Deleted(), self.registry.annos)
+        c = self.Helper.byId('c' * 22)
+        assert c.parent.id == 'a' * 22
+        assert [h.id for h in self.Helper.orphans] == ['c' * 22]
+        assert c.shareLink == shareLinkFromId('a' * 22)
+
+
+class TestSiblingThreads(unittest.TestCase):
+    def setUp(self):
+        class A(HypothesisHelper):
+            objects = {}
+
+        class B(HypothesisHelper):
+            objects = {}
+
+        self.A, self.B = A, B
+        self.annos = [HypothesisAnnotation(make_row(id=id_ * 22, updated=timestamp(i),
+                                                    references=[r * 22 for r in refs]))
+                      for i, (id_, refs) in enumerate(threads.items())]
+        self.by_id = {a.id[0]: a for a in self.annos}
+
+    def tearDown(self):
+        for cls in (self.A, self.B):
+            cls.reset(reset_annos_dict=True)
+
+    def test_siblings(self):
+        self.A.fromAnnos(self.annos)
+        d = self.B(self.by_id['d'], self.annos)  # parents are built for B
+        assert d.parent.id == 'c' * 22 and type(d.parent) is self.B
+        assert {r.id for r in self.A.byId('a' * 22).replies} == {'b' * 22, 'e' * 22}
+        assert {r.id for r in self.B.byId('a' * 22).replies} == {'b' * 22}
+        assert list(self.B.orphans) == []
+
+    def test_direct_parent(self):
+        a, b, c = (self.by_id[i] for i in 'abc')
+        self.A(a, self.annos)
+        h = self.A(c, self.annos)  # references (a, b) and only a has a helper
+        assert h.parent.id == b.id
+        assert self.A.byId(b.id).parent.id == a.id
+        assert {r.id for r in self.A.byId(a.id).replies} == {b.id}
@@ -0,0 +1,138 @@
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+from pathlib import Path
+from hyputils.hypothesis import Memoizer, HypothesisAnnotation, AnnoList
+from hyputils import handlers
+from hyputils.handlers import annotationSyncHandler, writeBehind
+from .common.corpus import make_row, make_rows, timestamp
+
+
+class SlowMemoizer:
+    """ records every write and how many ran at the same time """
+
+    def __init__(self, delay=0):
+        self.delay = delay
+        self.writes = []
+        self.running = 0
+        self.max_running = 0
+        self._lock = threading.Lock()
+
+    def memoize_changes(self, changes, annos):
+        with self._lock:
+            self.running += 1
+            self.max_running = max(self.running, self.max_running)
+
+        time.sleep(self.delay)
+        self.writes.append((changes, annos))
+        with self._lock:
+            self.running -= 1
+
+
+class SnapshotOnly:
+    def __init__(self):
+        self.snapshots = []
+
+    def memoize_annos(self, annos):
+        self.snapshots.append(annos)
+
+
+def update(anno, i):
+    row = dict(anno._row, text=str(i), updated=timestamp(1000 + i))
+    return {'options': {'action': 'update'}, 'payload': [row]}
+
+
+class TestWriteBehind(unittest.TestCase):
+    def setUp(self):
+        self.annos = AnnoList(HypothesisAnnotation(r) for r in make_rows(10))
+
+    def test_burst_is_coalesced(self):
+        mem = SlowMemoizer(delay=0.2)
+        handler = annotationSyncHandler(self.annos, memoizer=mem)
+        start = time.monotonic()
+        for i in range(300):
+            handler.handler(update(self.annos[0], i))
+
+        assert time.monotonic() - start < 0.2  # never waited on a write
+        handler.close()
+        assert mem.max_running == 1
+        assert len(mem.writes) < 300
+        changes, snapshot = mem.writes[-1]
+        assert changes[-1][1].text == '299'
+        assert len(snapshot) == 10
+
+    def test_max_pending(self):
+        mem = SlowMemoizer()
+        wb = writeBehind(mem, self.annos, max_pending=5, max_delay=60)
+        for anno in list(self.annos)[:5]:
+            wb.mark('update', anno)
+
+        for _ in range(100):
+            if mem.writes:
+                break
+            time.sleep(0.01)
+
+        assert [len(changes) for changes, _ in mem.writes] == [5]
+        wb.close()
+
+    def test_max_delay(self):
+        mem = SlowMemoizer()
+        wb = writeBehind(mem, self.annos, max_delay=0.05)
+        wb.mark('delete', 'some-id')
+        wb.mark('create', self.annos[0])
+        wb.mark('update', self.annos[0])
+        time.sleep(0.5)
+        assert [changes for changes, _ in mem.writes] == [[('delete', 'some-id'),
+                                                           ('create', self.annos[0])]]
+        wb.close()
+
+    def test_exit_hook(self):
+        mem = SlowMemoizer()
+        wbs = [writeBehind(mem, self.annos, max_delay=60) for _ in range(3)]
+        for wb in wbs:
+            wb.mark('delete', 'some-id')
+
+        assert set(wbs) <= set(handlers._write_behinds)
+        wbs[0].close()
+        assert wbs[0] not in handlers._write_behinds
+        handlers._close_write_behinds()  # what runs at exit
+        assert len(mem.writes) == 3
+        assert not set(wbs) & set(handlers._write_behinds)
+
+    def test_snapshot_fallback(self):
+        mem = SnapshotOnly()
+        handler = annotationSyncHandler(self.annos, memoizer=mem)
+        handler.handler({'options': {'action': 'delete'},
+                         'payload': [{'id': self.annos[0].id}]})
+        handler.flush()
+        assert len(mem.snapshots) == 1 and len(mem.snapshots[0]) == 9
+        handler.close()
+
+
+class TestWriteBehindMemoizer(unittest.TestCase):
+    def setUp(self):
+        self.folder = Path(tempfile.mkdtemp())
+        self.mem = Memoizer(self.folder / 'annos.json', group='__world__')
+        self.mem.memoize_annos([HypothesisAnnotation(r) for r in make_rows(20)])
+        self.annos, _ = self.mem.get_annos_from_file()
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    def test_journal_round_trip(self):
+        handler = annotationSyncHandler(self.annos, memoizer=self.mem)
+        for i in range(50):
+            handler.handler(update(self.annos[i % 5], i))
+
+        handler.handler({'options': {'action': 'delete'},
+                         'payload': [{'id': self.annos[0].id}]})
+        created = make_row(updated=timestamp(2000))
+        handler.handler({'options': {'action': 'create'}, 'payload': [created]})
+        handler.close()
+        reloaded, lsu = Memoizer(self.mem.memoization_file,
+                                 group='__world__').get_annos_from_file()
+        assert [a.id for a in reloaded] == [a.id for a in self.annos]
+        assert [a.updated for a in reloaded] == [a.updated for a in self.annos]
+        assert lsu == timestamp(2000)